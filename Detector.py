@@ -2,8 +2,15 @@ import cv2
 import os
 from time import time
 from PIL import Image
-from tkinter import messagebox
-from typing import Tuple, Optional
+from typing import Callable, Dict, Tuple, Optional
+from gallery import FaceGallery
+from face_dataset import normalize_face
+from video_source import FrameGrabber, FrameRateGovernor
+from face_detection import FaceDetector, FaceTracker
+from decision import TemporalVoter
+from model_registry import load_lbph
+from lbp import calibrated_threshold, model_extension
+from metrics import Metrics, default_metrics
 
 
 class FaceRecognitionApp:
@@ -12,28 +19,74 @@ class FaceRecognitionApp:
     and recognition with automatic timeout functionality.
     """
     
-    def __init__(self, name: str, timeout: int = 5, confidence_threshold: int = 50):
+    def __init__(self, name: Optional[str], timeout: int = 5, confidence_threshold: Optional[int] = None,
+                 use_gallery: bool = False, detect_interval: int = 1,
+                 detector: Optional[FaceDetector] = None,
+                 vote_window: int = 7, vote_quorum: int = 4,
+                 headless: bool = False, max_fps: Optional[float] = None,
+                 on_result: Optional[Callable[[Dict], None]] = None,
+                 metrics: Optional[Metrics] = None, engine: str = "opencv", source=0):
         """
         Initialize the face recognition application.
         
         Args:
-            name: Name of the person to recognize
+            name: Name of the person to recognize, or None to accept any
+                enrolled user (requires use_gallery)
             timeout: Timeout in seconds for the recognition process
             confidence_threshold: Minimum confidence level for positive recognition
+                (default: the model's, see lbp.calibrated_threshold)
+            use_gallery: Identify faces against the shared gallery of all
+                enrolled users instead of a per-user classifier
+            detect_interval: Run the Haar cascade every N frames and track
+                faces in between (1 detects on every frame)
+            detector: Face detector to use, e.g. with a reduced detection
+                resolution or face-size bounds (default: full-resolution cascade)
+            vote_window: Number of recent frames considered for the decision (M)
+            vote_quorum: Number of agreeing frames that ends the check-in (K)
+            headless: Run without any window, drawing or message box
+            max_fps: Frame-rate cap used instead of waitKey() pacing when headless
+            on_result: Called with the results of every processed frame;
+                returning False stops the run
+            metrics: Metrics to report stage timings, FPS and confidences to
+                (default: the process-wide metrics, disabled unless configured)
+            engine: Recognizer backend the models were trained with,
+                "opencv", "numpy" or "pca" (see lbp.py)
+            source: Camera index, video file or stream URL, or an already
+                open FrameGrabber that is left open after the run (e.g. to
+                run several check-ins on one stream)
         """
         self.name = name
         self.timeout = timeout
         self.confidence_threshold = confidence_threshold
+        self.use_gallery = use_gallery or name is None
+        self.detect_interval = detect_interval
+        self.headless = headless
+        self.governor = FrameRateGovernor(max_fps)
+        self.on_result = on_result
+        self.metrics = metrics if metrics is not None else default_metrics()
         self.face_cascade_path = './data/haarcascade_frontalface_default.xml'
-        self.classifier_path = f"./data/classifiers/{name}_classifier.xml"
+        self.engine = engine
+        self.source = source
+        self.classifier_path = f"./data/classifiers/{name}_classifier{model_extension(engine)}"
         
         # Initialize components
         self.face_cascade = None
+        self.detector = detector
+        self.tracker = None
         self.recognizer = None
+        self.threshold = confidence_threshold
+        self.gallery = None
         self.cap = None
         
         # Recognition state
         self.is_recognized = False
+        self.identity = None
+        self.confidence = 0
+        self.voter = TemporalVoter(vote_window, vote_quorum)
+        self._last_faces = []
+        self._frame_index = 0
+        self._dropped = 0
+        self._stop_requested = False
         
     def _initialize_components(self) -> bool:
         """
@@ -48,21 +101,43 @@ class FaceRecognitionApp:
                 print(f"Error: Face cascade file not found at {self.face_cascade_path}")
                 return False
                 
-            self.face_cascade = cv2.CascadeClassifier(self.face_cascade_path)
+            if self.detector is None:
+                self.detector = FaceDetector(self.face_cascade_path, 1.3, 5)
+            self.face_cascade = self.detector.cascade
+            if self.detect_interval > 1:
+                self.tracker = FaceTracker(self._detect_faces, self.detect_interval)
             
             # Load trained recognizer
-            if not os.path.exists(self.classifier_path):
-                print(f"Error: Classifier file not found at {self.classifier_path}")
-                return False
-                
-            self.recognizer = cv2.face.LBPHFaceRecognizer_create()
-            self.recognizer.read(self.classifier_path)
+            if self.use_gallery:
+                self.gallery = FaceGallery(confidence_threshold=self.confidence_threshold, engine=self.engine)
+                if not self.gallery.load():
+                    return False
+            else:
+                if not os.path.exists(self.classifier_path):
+                    print(f"Error: Classifier file not found at {self.classifier_path}")
+                    return False
+                    
+                # Shared across check-ins; only re-parsed when the file changes
+                self.recognizer = load_lbph(self.classifier_path)
+                self.threshold = calibrated_threshold(self.recognizer, self.confidence_threshold)
+                if self.threshold is None:
+                    print(f"Error: Classifier {self.classifier_path} has no calibrated confidence threshold; "
+                          "give one (--confidence-threshold)")
+                    return False
             
-            # Initialize camera
-            self.cap = cv2.VideoCapture(0)
+            # Initialize camera, grabbing on a background thread so we
+            # always process the freshest frame
+            # Duck-typed: FrameGrabber may be replaced (e.g. by the benchmark)
+            if hasattr(self.source, "read"):
+                self.cap = self.source
+            else:
+                # Recorded files keep every frame; live sources drop stale ones
+                live = isinstance(self.source, int) or "://" in str(self.source)
+                self.cap = FrameGrabber(self.source, drop_oldest=live)
             if not self.cap.isOpened():
                 print("Error: Could not open camera")
                 return False
+            self._dropped = self.cap.dropped
                 
             return True
             
@@ -70,6 +145,10 @@ class FaceRecognitionApp:
             print(f"Error initializing components: {e}")
             return False
     
+    def _detect_faces(self, gray_frame):
+        """Run the Haar cascade on a grayscale frame."""
+        return self.detector.detect(gray_frame, previous=self._last_faces)
+
     def _process_face_detection(self, frame, gray_frame):
         """
         Process face detection and recognition on the current frame.
@@ -81,25 +160,77 @@ class FaceRecognitionApp:
         Returns:
             Processed frame with annotations
         """
-        faces = self.face_cascade.detectMultiScale(gray_frame, 1.3, 5)
+        with self.metrics.stage("detect"):
+            if self.tracker is not None:
+                faces = self.tracker.update(gray_frame)
+            else:
+                faces = self._detect_faces(gray_frame)
+        self._last_faces = faces
         
+        # Each frame with a face casts one vote: a recognized face wins over unknown ones
+        vote = None
+        vote_confidence = 0
+        results = []
         for (x, y, w, h) in faces:
             roi_gray = gray_frame[y:y+h, x:x+w]
-            face_id, confidence = self.recognizer.predict(roi_gray)
-            confidence_percentage = 100 - int(confidence)
             
-            if confidence_percentage > self.confidence_threshold:
-                self._draw_recognized_face(frame, x, y, w, h)
-                self.is_recognized = True
-            else:
-                self._draw_unknown_face(frame, x, y, w, h)
-                self.is_recognized = False
-                
+            with self.metrics.stage("recognize"):
+                recognized = self._recognize_face(roi_gray)
+            self.metrics.confidence(self.confidence)
+            results.append({"box": (int(x), int(y), int(w), int(h)),
+                            "identity": self.identity, "confidence": self.confidence})
+            if recognized:
+                if not self.headless:
+                    with self.metrics.stage("annotate"):
+                        self._draw_recognized_face(frame, x, y, w, h)
+                if vote is None or self.confidence > vote_confidence:
+                    vote, vote_confidence = self.identity, self.confidence
+            elif not self.headless:
+                with self.metrics.stage("annotate"):
+                    self._draw_unknown_face(frame, x, y, w, h)
+        
+        if len(faces):
+            self.voter.add(vote, vote_confidence)
+            self.is_recognized = bool(self.voter.decision)
+        
+        if self.on_result is not None:
+            if self.on_result({"frame": self._frame_index, "faces": results,
+                               "decision": self.voter.decision, "identity": self.voter.identity}) is False:
+                self._stop_requested = True
+        self._frame_index += 1
+        if self.metrics.enabled:
+            self.metrics.increment("recognized_faces_total", sum(r["identity"] is not None for r in results))
+            self.metrics.frame(len(faces), self.cap.dropped - self._dropped if self.cap else 0)
+            if self.cap:
+                self._dropped = self.cap.dropped
+        
         return frame
     
+    def _recognize_face(self, roi_gray) -> bool:
+        """
+        Decide whether a face region belongs to the expected user.
+        
+        Args:
+            roi_gray: Grayscale face region
+            
+        Returns:
+            bool: True if the face is recognized, False otherwise
+        """
+        if self.gallery is not None:
+            self.identity, self.confidence = self.gallery.identify(roi_gray)
+            if self.name is None:
+                return self.identity is not None
+            return self.identity == self.name
+        
+        face_id, confidence = self.recognizer.predict(normalize_face(roi_gray))
+        confidence_percentage = 100 - int(confidence)
+        self.confidence = confidence_percentage
+        self.identity = self.name if confidence_percentage > self.threshold else None
+        return self.identity is not None
+    
     def _draw_recognized_face(self, frame, x: int, y: int, w: int, h: int):
         """Draw rectangle and text for recognized face."""
-        text = f'Recognized: {self.name.upper()}'
+        text = f'Recognized: {self.identity.upper()}'
         color = (0, 255, 0)  # Green
         font = cv2.FONT_HERSHEY_PLAIN
         
@@ -117,6 +248,11 @@ class FaceRecognitionApp:
     
     def _show_result_message(self):
         """Show appropriate message based on recognition result."""
+        if self.headless:
+            print(f"Recognition result: {'Success' if self.is_recognized else 'Failed'}")
+            return
+        # Imported lazily so headless deployments do not need Tk
+        from tkinter import messagebox
         if self.is_recognized:
             messagebox.showinfo('Success', 'You have successfully checked in!')
         else:
@@ -124,9 +260,13 @@ class FaceRecognitionApp:
     
     def _cleanup(self):
         """Release resources and close windows."""
-        if self.cap:
+        if self.cap and self.cap is not self.source:
             self.cap.release()
-        cv2.destroyAllWindows()
+            if self.cap.dropped:
+                print(f"Dropped {self.cap.dropped} stale frames")
+        if not self.headless:
+            cv2.destroyAllWindows()
+        self.metrics.flush()
     
     def run(self) -> bool:
         """
@@ -139,31 +279,48 @@ class FaceRecognitionApp:
         if not self._initialize_components():
             return False
         
-        print(f"Starting face recognition for {self.name}")
+        print(f"Starting face recognition for {self.name or 'any enrolled user'}")
         print(f"Timeout: {self.timeout} seconds")
-        print("Press 'q' to quit early")
+        if not self.headless:
+            print("Press 'q' to quit early")
         
         start_time = time()
         
         try:
             while True:
-                ret, frame = self.cap.read()
+                with self.metrics.stage("capture"):
+                    ret, frame = self.cap.read()
                 if not ret:
                     print("Error: Could not read frame from camera")
                     break
                 
                 # Convert to grayscale for face detection
-                gray_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+                with self.metrics.stage("convert"):
+                    gray_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
                 
                 # Process face detection and recognition
                 processed_frame = self._process_face_detection(frame, gray_frame)
                 
-                # Display the frame
-                cv2.imshow("Face Recognition", processed_frame)
+                if self.headless:
+                    self.governor.wait()
+                else:
+                    # Display the frame
+                    with self.metrics.stage("display"):
+                        cv2.imshow("Face Recognition", processed_frame)
+                        key = cv2.waitKey(20) & 0xFF
+                    
+                    # Check for quit key
+                    if key == ord('q'):
+                        print("Recognition stopped by user")
+                        break
                 
-                # Check for quit key
-                if cv2.waitKey(20) & 0xFF == ord('q'):
-                    print("Recognition stopped by user")
+                if self._stop_requested:
+                    print("Recognition stopped by on_result")
+                    break
+                
+                # Stop as soon as enough recent frames agree
+                if self.voter.decision is not None:
+                    print(f"Decision reached after {time() - start_time:.2f} seconds")
                     break
                 
                 # Check timeout
@@ -185,21 +342,36 @@ class FaceRecognitionApp:
         return self.is_recognized
 
 
-def main_app(name: str, timeout: int = 5) -> bool:
+def main_app(name: str, timeout: int = 5, use_gallery: bool = False) -> bool:
     """
     Main function to run face recognition application.
     
     Args:
         name: Name of the person to recognize
         timeout: Timeout in seconds (default: 5)
+        use_gallery: Verify against the shared gallery (default: False)
         
     Returns:
         bool: True if recognition was successful, False otherwise
     """
-    app = FaceRecognitionApp(name, timeout)
+    app = FaceRecognitionApp(name, timeout, use_gallery=use_gallery)
     return app.run()
 
 
+def identify_app(timeout: int = 5) -> Optional[str]:
+    """
+    Identify whoever is in front of the camera against all enrolled users.
+    
+    Args:
+        timeout: Timeout in seconds (default: 5)
+        
+    Returns:
+        Name of the identified user, or None if nobody was recognized
+    """
+    app = FaceRecognitionApp(None, timeout)
+    return app.voter.identity if app.run() else None
+
+
 # Example usage
 if __name__ == "__main__":
     # Replace 'john' with the actual name/identifier
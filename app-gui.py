@@ -1,11 +1,12 @@
 from Detector import main_app
-from create_classifier import train_classifer
+from create_classifier import train_classifer, enroll_user
+from face_dataset import MIN_SAMPLES
 from create_dataset import start_capture
 import tkinter as tk
 from tkinter import font as tkfont
 from tkinter import messagebox,PhotoImage
 #from PIL import ImageTk, Image
-from gender_prediction import emotion,ageAndgender
+from gender_prediction import emotion,ageAndgender,warm_up_models,OPENCV_MODEL_NAMES
 
 # Modern color scheme
 COLORS = {
@@ -414,16 +415,17 @@ class PageThree(tk.Frame):
 
     def capimg(self):
         self.numimglabel.config(text=str("Captured Images = 0 "))
-        messagebox.showinfo("INSTRUCTIONS", "We will Capture 300 pic of your Face.")
+        messagebox.showinfo("INSTRUCTIONS", "We will capture pictures of your face. Slowly turn your head and change your expression until the capture stops.")
         x = start_capture(self.controller.active_name)
         self.controller.num_of_images = x
         self.numimglabel.config(text=str("Number of images captured = "+str(x)))
 
     def trainmodel(self):
-        if self.controller.num_of_images < 300:
-            messagebox.showerror("ERROR", "Not enough Data, Capture at least 300 images!")
+        if self.controller.num_of_images < MIN_SAMPLES:
+            messagebox.showerror("ERROR", f"Not enough Data, Capture at least {MIN_SAMPLES} images!")
             return
         train_classifer(self.controller.active_name)
+        enroll_user(self.controller.active_name)
         messagebox.showinfo("SUCCESS", "The model has been successfully trained!")
         self.controller.show_frame("PageFour")
 
@@ -505,5 +507,9 @@ class PageFour(tk.Frame):
 
 app = MainUI()
 app.iconphoto(True, tk.PhotoImage(file='icon.ico'))
+# Warm only the OpenCV models in the background: the TensorFlow emotion
+# model would freeze the window while it loads, so it loads when Emotion
+# Detection is first used
+warm_up_models(OPENCV_MODEL_NAMES)
 app.mainloop()
 
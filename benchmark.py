@@ -0,0 +1,423 @@
+import argparse
+import contextlib
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional
+import cv2
+import numpy as np
+import create_classifier
+import create_dataset
+import Detector
+import gender_prediction
+from face_dataset import PackedFaceDataset, SampleSelector
+from face_detection import FaceDetector
+from lbp import model_extension
+from model_registry import registry
+from video_source import FrameGrabber
+
+CASCADE_PATH = "./data/haarcascade_frontalface_default.xml"
+BASELINE_PATH = "./data/benchmark_baseline.json"
+STAGES = ["decode", "convert", "detect", "recognize", "annotate", "load", "total"]
+SCENARIOS = ["take_video", "train_classifer", "recognition", "age_gender", "emotion"]
+BENCH_USER = "benchmark"
+
+
+class StageTimer:
+    """
+    Collects per-frame latencies of named pipeline stages.
+
+    Stage functions are wrapped in place with patch(), so the benchmark drives
+    the real code paths unchanged. Every call adds its duration to the current
+    frame and end_frame() closes the frame, so a stage called several times
+    per frame (e.g. one color conversion per face) is reported as one sample.
+    """
+
+    def __init__(self):
+        self.samples: Dict[str, List[float]] = defaultdict(list)
+        self.frames = 0
+        self._current: Dict[str, float] = defaultdict(float)
+
+    def end_frame(self):
+        """Close the current frame and record its stage latencies."""
+        if not self._current:
+            return
+        for stage, seconds in self._current.items():
+            self.samples[stage].append(seconds * 1000.0)
+        self.frames += 1
+        self._current = defaultdict(float)
+
+    @contextlib.contextmanager
+    def measure(self, stage: str):
+        """Time a block of code as part of a stage."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._current[stage] += time.perf_counter() - start
+
+    @contextlib.contextmanager
+    def patch(self, owner, attr: str, stage: str, frame_boundary: bool = False):
+        """
+        Time every call of owner.attr as a stage while the context is active.
+
+        Args:
+            owner: Module, class or instance holding the function
+            attr: Attribute name of the function
+            stage: Stage the calls are accounted to
+            frame_boundary: Close the current frame before each call, for the
+                function that fetches the next frame
+        """
+        had_own = attr in vars(owner)
+        original = vars(owner)[attr] if had_own else None
+        function = getattr(owner, attr)
+        if isinstance(owner, type):
+            # Look the function up unbound so it also works as a method
+            function = original
+
+        def timed(*args, **kwargs):
+            if frame_boundary:
+                self.end_frame()
+            with self.measure(stage):
+                return function(*args, **kwargs)
+
+        setattr(owner, attr, timed)
+        try:
+            yield
+        finally:
+            if had_own:
+                setattr(owner, attr, original)
+            else:
+                delattr(owner, attr)
+
+    def summary(self, wall_seconds: float) -> Dict:
+        """
+        Summarize the collected samples.
+
+        Args:
+            wall_seconds: Wall-clock duration of the run
+
+        Returns:
+            Dict with frame count, throughput and per-stage statistics in ms
+        """
+        self.end_frame()
+        stages = {}
+        for stage in sorted(self.samples, key=lambda s: STAGES.index(s) if s in STAGES else len(STAGES)):
+            values = np.asarray(self.samples[stage])
+            p50, p90, p99 = np.percentile(values, [50, 90, 99])
+            stages[stage] = {"count": int(values.size), "mean": float(values.mean()),
+                             "p50": float(p50), "p90": float(p90), "p99": float(p99)}
+        return {"frames": self.frames, "seconds": wall_seconds,
+                "throughput": self.frames / wall_seconds if wall_seconds > 0 else 0.0,
+                "stages": stages}
+
+
+def synthetic_face(size: int) -> np.ndarray:
+    """
+    Draw a grayscale cartoon face the Haar cascade reliably detects.
+
+    Args:
+        size: Width and height of the face image
+
+    Returns:
+        Grayscale face image
+    """
+    s = size
+    c = s // 2
+    face = np.full((s, s), 60, np.uint8)
+    cv2.ellipse(face, (c, c + s // 12), (int(s * .36), int(s * .46)), 0, 0, 360, 180, -1)
+    face = cv2.GaussianBlur(face, (0, 0), s / 40)
+    for ex in (c - int(s * .15), c + int(s * .15)):
+        cv2.ellipse(face, (ex, c - int(s * .05)), (int(s * .08), int(s * .035)), 0, 0, 360, 40, -1)
+        cv2.line(face, (ex - int(s * .1), c - int(s * .15)), (ex + int(s * .1), c - int(s * .15)), 70, max(2, s // 30))
+    cv2.ellipse(face, (c, c + int(s * .12)), (int(s * .04), int(s * .08)), 0, 0, 360, 140, -1)
+    cv2.ellipse(face, (c, c + int(s * .27)), (int(s * .12), int(s * .03)), 0, 0, 360, 80, -1)
+    return cv2.GaussianBlur(face, (0, 0), 1.5)
+
+
+def make_synthetic_video(path: str, frames: int = 150, size=(640, 480), fps: float = 25.0,
+                         seed: int = 0) -> str:
+    """
+    Write a deterministic video fixture of a face moving over a noisy background.
+
+    Every tenth frame has no face, so empty frames are covered as well.
+
+    Args:
+        path: Output path (.avi, MJPG encoded)
+        frames: Number of frames
+        size: Frame (width, height)
+        fps: Frame rate stored in the file
+        seed: Seed of the background noise
+
+    Returns:
+        The path written
+    """
+    width, height = size
+    rng = np.random.default_rng(seed)
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"MJPG"), fps, (width, height))
+    try:
+        for i in range(frames):
+            frame = rng.integers(90, 130, (height, width), dtype=np.uint8)
+            if i % 10:
+                face_size = min(100 + (i * 3) % 60, height - 1)
+                x = (i * 7) % max(1, width - face_size)
+                y = (height - face_size) // 3
+                frame[y:y + face_size, x:x + face_size] = synthetic_face(face_size)
+            writer.write(cv2.cvtColor(frame, cv2.COLOR_GRAY2BGR))
+    finally:
+        writer.release()
+    return path
+
+
+@contextlib.contextmanager
+def _fixture_camera(module, video):
+    # Stands in for FrameGrabber(0) in module: every fixture frame, in order
+    module.FrameGrabber = lambda *args, **kwargs: FrameGrabber(video, buffer_size=8, drop_oldest=False)
+    try:
+        yield
+    finally:
+        module.FrameGrabber = FrameGrabber
+
+
+@contextlib.contextmanager
+def _working_directory(path):
+    previous = os.getcwd()
+    os.chdir(path)
+    try:
+        yield
+    finally:
+        os.chdir(previous)
+
+
+def _frame_stages(timer: StageTimer):
+    # Stages shared by every video scenario
+    stack = contextlib.ExitStack()
+    stack.enter_context(timer.patch(FrameGrabber, "read", "decode", frame_boundary=True))
+    stack.enter_context(timer.patch(cv2, "cvtColor", "convert"))
+    stack.enter_context(timer.patch(FaceDetector, "detect", "detect"))
+    return stack
+
+
+def _capture_selector():
+    # The fixture shows a single drawn face, which the quality gates would
+    # reduce to a handful of crops: keep up to 300 like the original capture
+    return SampleSelector(min_size=0, min_sharpness=0, max_distance=-1, max_samples=300)
+
+
+def _ensure_classifier(video: str, train: bool = True, engine: str = "opencv"):
+    # Scenarios run on their own too: build their inputs without timing them
+    if not PackedFaceDataset("./data/" + BENCH_USER).exists():
+        create_dataset.take_video(BENCH_USER, video, headless=True, selector=_capture_selector())
+    if train and not os.path.exists(f"./data/classifiers/{BENCH_USER}_classifier{model_extension(engine)}"):
+        create_classifier.train_classifer(BENCH_USER, engine)
+
+
+def bench_take_video(timer: StageTimer, video: str):
+    """Capture a dataset from the fixture with create_dataset.take_video."""
+    with _frame_stages(timer):
+        create_dataset.take_video(BENCH_USER, video, headless=True, selector=_capture_selector())
+
+
+def bench_train_classifer(timer: StageTimer, runs: int = 5, engine: str = "opencv"):
+    """Train the per-user classifier on the captured dataset, runs times."""
+    with timer.patch(create_classifier, "load_user_faces", "load"):
+        for _ in range(runs):
+            with timer.measure("total"):
+                create_classifier.train_classifer(BENCH_USER, engine)
+            timer.end_frame()
+
+
+def bench_recognition(timer: StageTimer, video: str, engine: str = "opencv"):
+    """Run FaceRecognitionApp._process_face_detection on every fixture frame."""
+    app = Detector.FaceRecognitionApp(BENCH_USER, engine=engine)
+    with _fixture_camera(Detector, video):
+        if not app._initialize_components():
+            raise RuntimeError("FaceRecognitionApp could not be initialized")
+
+    with _frame_stages(timer), \
+            timer.patch(app, "_recognize_face", "recognize"), \
+            timer.patch(app, "_draw_recognized_face", "annotate"), \
+            timer.patch(app, "_draw_unknown_face", "annotate"):
+        try:
+            while True:
+                ret, frame = app.cap.read()
+                if not ret:
+                    break
+                gray_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+                app._process_face_detection(frame, gray_frame)
+        finally:
+            app.cap.release()
+
+
+def bench_age_gender(timer: StageTimer, video: str):
+    """Run the headless ageAndgender() loop on the fixture."""
+    registry.get("ageNet")
+    registry.get("genderNet")
+    with _frame_stages(timer), \
+            timer.patch(gender_prediction, "predict_age_gender", "recognize"), \
+            _fixture_camera(gender_prediction, video):
+        gender_prediction.ageAndgender(headless=True)
+
+
+def bench_emotion(timer: StageTimer, video: str):
+    """Run the headless emotion() loop on the fixture."""
+    registry.get("emotion_classifier")
+    with _frame_stages(timer), \
+            timer.patch(gender_prediction, "predict_emotions", "recognize"), \
+            _fixture_camera(gender_prediction, video):
+        gender_prediction.emotion(headless=True)
+
+
+def run_benchmarks(video: Optional[str] = None, scenarios: Optional[List[str]] = None,
+                   frames: int = 150, train_runs: int = 5, engine: str = "opencv") -> Dict:
+    """
+    Run the benchmark scenarios against a video fixture.
+
+    take_video, train_classifer and recognition run in a scratch directory
+    (the captured dataset feeds the classifier, which feeds recognition),
+    so ./data is never modified. age_gender and emotion use the models in
+    ./data and are skipped when those cannot be loaded.
+
+    Args:
+        video: Recorded fixture (default: a generated synthetic video)
+        scenarios: Scenarios to run (default: all)
+        frames: Length of the synthetic fixture
+        train_runs: Number of train_classifer runs
+        engine: Per-user recognizer backend, "opencv" or "numpy" (see lbp.py)
+
+    Returns:
+        Dict with the environment and one summary per scenario
+    """
+    scenarios = scenarios or SCENARIOS
+    results = {"environment": {"opencv": cv2.__version__, "numpy": np.__version__,
+                               "python": platform.python_version(), "machine": platform.machine(),
+                               "fixture": os.path.basename(video) if video else f"synthetic-{frames}",
+                               "engine": engine},
+               "scenarios": {}}
+
+    with tempfile.TemporaryDirectory() as workdir:
+        os.makedirs(os.path.join(workdir, "data", "classifiers"))
+        shutil.copy(CASCADE_PATH, os.path.join(workdir, "data"))
+        if video is None:
+            video = make_synthetic_video(os.path.join(workdir, "fixture.avi"), frames)
+        video = os.path.abspath(video)
+
+        runners = {
+            "take_video": lambda timer: bench_take_video(timer, video),
+            "train_classifer": lambda timer: bench_train_classifer(timer, train_runs, engine),
+            "recognition": lambda timer: bench_recognition(timer, video, engine),
+            "age_gender": lambda timer: bench_age_gender(timer, video),
+            "emotion": lambda timer: bench_emotion(timer, video),
+        }
+        for scenario in scenarios:
+            timer = StageTimer()
+            # The check-in scenarios work on the scratch copy of ./data
+            scratch = scenario in ("take_video", "train_classifer", "recognition")
+            try:
+                with _working_directory(workdir) if scratch else contextlib.nullcontext():
+                    if scenario in ("train_classifer", "recognition"):
+                        _ensure_classifier(video, train=scenario == "recognition", engine=engine)
+                    start = time.perf_counter()
+                    runners[scenario](timer)
+            except Exception as e:
+                print(f"Skipping {scenario}: {e}", file=sys.stderr)
+                results["scenarios"][scenario] = {"skipped": str(e)}
+                continue
+            results["scenarios"][scenario] = timer.summary(time.perf_counter() - start)
+    return results
+
+
+def compare_to_baseline(results: Dict, baseline: Dict, threshold: float = 0.25,
+                        min_delta_ms: float = 1.0) -> List[str]:
+    """
+    Find stages that got slower than the baseline.
+
+    A stage regresses when its p50 or p90 grows by more than threshold and by
+    more than min_delta_ms, so sub-millisecond jitter is not reported. A
+    scenario regresses when its throughput drops by more than threshold.
+
+    Args:
+        results: Output of run_benchmarks()
+        baseline: Stored output of an earlier run
+        threshold: Allowed relative slowdown
+        min_delta_ms: Allowed absolute slowdown
+
+    Returns:
+        One message per regression
+    """
+    regressions = []
+    for scenario, current in results["scenarios"].items():
+        base = baseline.get("scenarios", {}).get(scenario)
+        if not base or "skipped" in base or "skipped" in current:
+            continue
+        for stage, stats in current["stages"].items():
+            base_stats = base["stages"].get(stage)
+            if base_stats is None:
+                continue
+            for key in ("p50", "p90"):
+                before, after = base_stats[key], stats[key]
+                if after > before * (1 + threshold) and after - before > min_delta_ms:
+                    regressions.append(f"{scenario}/{stage} {key}: {before:.2f} -> {after:.2f} ms "
+                                       f"(+{(after / before - 1) * 100 if before else float('inf'):.0f}%)")
+        if current["throughput"] < base["throughput"] * (1 - threshold):
+            regressions.append(f"{scenario} throughput: {base['throughput']:.1f} -> {current['throughput']:.1f}/s")
+    return regressions
+
+
+def format_report(results: Dict) -> str:
+    """Format benchmark results as a text table."""
+    env = results["environment"]
+    lines = [f"OpenCV {env['opencv']}, NumPy {env['numpy']}, Python {env['python']} ({env['machine']}), "
+             f"fixture {env['fixture']}, engine {env.get('engine', 'opencv')}",
+             f"{'scenario':<16}{'stage':<11}{'count':>7}{'mean':>9}{'p50':>9}{'p90':>9}{'p99':>9}  (ms)"]
+    for scenario, summary in results["scenarios"].items():
+        if "skipped" in summary:
+            lines.append(f"{scenario:<16}skipped: {summary['skipped']}")
+            continue
+        for stage, stats in summary["stages"].items():
+            lines.append(f"{scenario:<16}{stage:<11}{stats['count']:>7}{stats['mean']:>9.2f}"
+                         f"{stats['p50']:>9.2f}{stats['p90']:>9.2f}{stats['p99']:>9.2f}")
+        lines.append(f"{scenario:<16}{'throughput':<11}{summary['throughput']:>7.1f}/s over {summary['frames']} iterations")
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the capture, training and recognition paths without a camera.")
+    parser.add_argument("--video", help="Recorded video fixture (default: generated synthetic video)")
+    parser.add_argument("--frames", type=int, default=150, help="Length of the synthetic fixture")
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, help="Scenarios to run (default: all)")
+    parser.add_argument("--train-runs", type=int, default=5, help="Number of train_classifer runs")
+    parser.add_argument("--engine", choices=["opencv", "numpy"], default="opencv", help="Per-user recognizer backend")
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="Baseline file to compare against")
+    parser.add_argument("--save-baseline", action="store_true", help="Store this run as the new baseline")
+    parser.add_argument("--threshold", type=float, default=0.25, help="Allowed relative slowdown")
+    parser.add_argument("--min-delta-ms", type=float, default=1.0, help="Allowed absolute slowdown in ms")
+    parser.add_argument("--json", help="Also write the results to this file")
+    args = parser.parse_args()
+
+    results = run_benchmarks(args.video, args.scenarios, args.frames, args.train_runs, args.engine)
+    print(format_report(results))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Baseline saved to {args.baseline}")
+    elif os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline["environment"]["opencv"] != results["environment"]["opencv"]:
+            print(f"Baseline was recorded with OpenCV {baseline['environment']['opencv']}")
+        regressions = compare_to_baseline(results, baseline, args.threshold, args.min_delta_ms)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
+        print("No regressions against the baseline")
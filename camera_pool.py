@@ -0,0 +1,309 @@
+import argparse
+import contextlib
+import json
+import multiprocessing as mp
+import os
+import queue
+import sys
+import time
+import cv2
+from typing import Callable, Dict, Iterator, List, Optional, TextIO, Tuple
+from Detector import FaceRecognitionApp
+from gallery import FaceGallery
+from lbp import calibrated_threshold, model_extension
+from metrics import metrics_from_environment
+from model_registry import load_cascade, load_lbph
+from video_source import FrameGrabber
+
+CASCADE_PATH = './data/haarcascade_frontalface_default.xml'
+
+Stream = Tuple[str, object]  # (stream name, camera index / video file / stream URL)
+
+
+def parse_stream(spec: str, index: int = 0) -> Stream:
+    """
+    Parse a "name=source" stream specification.
+
+    The name is optional ("door<index>" by default) and numeric sources are
+    camera indices, e.g. "north=0", "lobby=rtsp://10.0.0.5/stream" or
+    "./data/entrance.mp4".
+    """
+    name, sep, source = spec.partition("=")
+    if not sep or "://" in name:
+        name, source = f"door{index}", spec
+    return name, int(source) if source.isdigit() else source
+
+
+def load_streams(path: str) -> List[Stream]:
+    """
+    Load streams from a JSON file.
+
+    The file holds a list of {"name": ..., "source": ...} objects or a
+    {name: source} mapping.
+    """
+    with open(path, "r") as f:
+        config = json.load(f)
+    if isinstance(config, dict):
+        return list(config.items())
+    return [(entry.get("name", f"door{i}"), entry["source"]) for i, entry in enumerate(config)]
+
+
+def _preload_models(name: Optional[str], engine: str, confidence_threshold: Optional[int]) -> bool:
+    # Fills the process-wide model cache, which forked workers inherit
+    if name is None:
+        if not FaceGallery(confidence_threshold=confidence_threshold, engine=engine).load():
+            return False
+    else:
+        classifier_path = f"./data/classifiers/{name}_classifier{model_extension(engine)}"
+        if not os.path.exists(classifier_path):
+            print(f"Error: Classifier file not found at {classifier_path}")
+            return False
+        if calibrated_threshold(load_lbph(classifier_path), confidence_threshold) is None:
+            print(f"Error: Classifier {classifier_path} has no calibrated confidence threshold; "
+                  "give one (--confidence-threshold)")
+            return False
+    load_cascade(CASCADE_PATH)
+    return True
+
+
+def _is_live(source) -> bool:
+    # Camera indices and stream URLs; anything else is a file that can end
+    return isinstance(source, int) or "://" in str(source)
+
+
+def _stream_worker(stream: str, source, options: Dict, threads: int, results, stop):
+    # Session logs go to stderr, leaving stdout to the supervisor's events
+    with contextlib.redirect_stdout(sys.stderr):
+        _run_stream(stream, source, options, threads, results, stop)
+
+
+def _run_stream(stream: str, source, options: Dict, threads: int, results, stop):
+    # One OpenCV pool per worker: N workers x all cores would oversubscribe the box
+    cv2.setNumThreads(threads)
+    # Every stream writes its own metrics files, labelled with its name
+    metrics = metrics_from_environment(stream)
+
+    def emit(event: str, **fields):
+        results.put(dict(fields, stream=stream, event=event, time=time.time(), pid=os.getpid()))
+
+    def on_result(result):
+        recognized = [face for face in result["faces"] if face["identity"] is not None]
+        if recognized:
+            emit("recognized", frame=result["frame"], faces=recognized)
+        return not stop.is_set()
+
+    grabber = FrameGrabber(source, drop_oldest=_is_live(source))
+    if not grabber.isOpened():
+        emit("error", message=f"Could not open {source}")
+        return
+    emit("started", source=str(source), threads=threads)
+    try:
+        # Every check-in is one session; the stream stays open between them
+        while not stop.is_set() and not grabber.ended:
+            app = FaceRecognitionApp(options["name"], options["timeout"], options["confidence_threshold"],
+                                     use_gallery=options["name"] is None, headless=True,
+                                     max_fps=options["max_fps"], on_result=on_result,
+                                     engine=options["engine"], source=grabber, metrics=metrics)
+            recognized = app.run()
+            if app.voter.decision is not None:
+                emit("decision", recognized=recognized, identity=app.voter.identity)
+            if app.cap is None:
+                emit("error", message="Models could not be loaded")
+                return
+            if recognized and options["cooldown"]:
+                # Do not check the same person in again while they walk through
+                stop.wait(options["cooldown"])
+    finally:
+        grabber.release()
+        metrics.flush()
+        emit("stopped", grabbed=grabber.grabbed, dropped=grabber.dropped)
+
+
+class CameraPool:
+    """
+    Runs face recognition on several streams, one worker process per stream.
+
+    The models are loaded once by the supervisor before the workers start.
+    Where processes are forked (Linux) every worker inherits them
+    copy-on-write, so the gallery is shared read-only instead of being
+    loaded per stream; elsewhere each worker loads it from the model file.
+    Each worker pins OpenCV to its share of the cores, and all recognition
+    events arrive on a single results queue.
+
+    Workers of live sources (cameras, stream URLs) are restarted whenever
+    they exit, e.g. because the feed dropped or could not be opened, and
+    file sources only when they crash; a file that played to the end is
+    done. The delay starts at restart_delay seconds and doubles with every
+    restart of a worker that ran for less than max_restart_delay, up to
+    max_restart_delay.
+    """
+
+    def __init__(self, streams: List[Stream], name: Optional[str] = None, engine: str = "opencv",
+                 timeout: float = 30.0, confidence_threshold: Optional[int] = None, max_fps: Optional[float] = None,
+                 threads_per_worker: Optional[int] = None, cooldown: float = 3.0,
+                 restart_delay: float = 5.0, max_restart_delay: float = 60.0):
+        """
+        Initialize the pool.
+
+        Args:
+            streams: (name, source) of every stream
+            name: Verify this user's classifier instead of identifying
+                against the gallery of all enrolled users
+            engine: Recognizer backend the models were trained with
+            timeout: Seconds of one check-in session before it restarts
+            confidence_threshold: Minimum confidence level for a positive match
+                (default: the model's, see lbp.calibrated_threshold)
+            max_fps: Frame-rate cap per stream
+            threads_per_worker: OpenCV threads per worker (default: the CPU
+                cores divided by the number of streams)
+            cooldown: Seconds a stream pauses after a successful check-in
+            restart_delay: Seconds before a worker is first restarted
+            max_restart_delay: Longest delay between restarts
+        """
+        self.streams = list(streams)
+        self.threads_per_worker = threads_per_worker or max(1, (os.cpu_count() or 1) // max(1, len(self.streams)))
+        self.restart_delay = restart_delay
+        self.max_restart_delay = max_restart_delay
+        self.options = {"name": name, "engine": engine, "timeout": timeout,
+                        "confidence_threshold": confidence_threshold, "max_fps": max_fps,
+                        "cooldown": cooldown}
+        methods = mp.get_all_start_methods()
+        self._context = mp.get_context("fork" if "fork" in methods else "spawn")
+        self.results = self._context.Queue()
+        self._stop = self._context.Event()
+        self._workers: Dict[str, mp.Process] = {}
+        self._restart_at: Dict[str, float] = {}
+        self._started_at: Dict[str, float] = {}
+        self._restarts: Dict[str, int] = {}
+
+    def _spawn(self, stream: str, source):
+        process = self._context.Process(target=_stream_worker, name=f"camera-{stream}", daemon=True,
+                                        args=(stream, source, self.options, self.threads_per_worker,
+                                              self.results, self._stop))
+        process.start()
+        self._workers[stream] = process
+        self._started_at[stream] = time.monotonic()
+
+    def start(self) -> bool:
+        """
+        Load the models and start one worker per stream.
+
+        Returns:
+            bool: True if the workers were started, False if the models
+            could not be loaded
+        """
+        if not _preload_models(self.options["name"], self.options["engine"], self.options["confidence_threshold"]):
+            return False
+        for stream, source in self.streams:
+            self._spawn(stream, source)
+        return True
+
+    @property
+    def running(self) -> bool:
+        """True while any worker is alive or waiting to be restarted."""
+        return any(p.is_alive() for p in self._workers.values()) or bool(self._restart_at)
+
+    def _supervise(self):
+        now = time.monotonic()
+        for stream, source in self.streams:
+            process = self._workers.get(stream)
+            if process is None or process.is_alive() or self._stop.is_set():
+                continue
+            if process.exitcode == 0 and not _is_live(source):
+                continue
+            if stream not in self._restart_at:
+                # Back off while a worker keeps failing soon after its start
+                if now - self._started_at[stream] >= self.max_restart_delay:
+                    self._restarts[stream] = 0
+                restarts = self._restarts.get(stream, 0)
+                delay = min(self.restart_delay * 2 ** restarts, self.max_restart_delay)
+                self._restarts[stream] = restarts + 1
+                print(f"Worker {stream} exited with code {process.exitcode}, "
+                      f"restarting in {delay:g} s", file=sys.stderr)
+                self._restart_at[stream] = now + delay
+            elif now >= self._restart_at[stream]:
+                del self._restart_at[stream]
+                self._spawn(stream, source)
+
+    def events(self, poll_interval: float = 0.5) -> Iterator[Dict]:
+        """
+        Yield events from every stream until all workers have exited.
+
+        Every event is a dict with "stream", "event" ("started",
+        "recognized", "decision", "error" or "stopped"), "time" and "pid",
+        plus the event's own fields.
+
+        Workers are checked every poll_interval seconds, also while other
+        streams keep the queue busy.
+        """
+        next_check = time.monotonic() + poll_interval
+        while True:
+            try:
+                yield self.results.get(timeout=max(0.0, next_check - time.monotonic()))
+            except queue.Empty:
+                pass
+            if time.monotonic() < next_check:
+                continue
+            next_check = time.monotonic() + poll_interval
+            self._supervise()
+            if not self.running and self.results.empty():
+                break
+
+    def stop(self, timeout: float = 5.0):
+        """Ask every worker to finish its current frame and exit."""
+        self._stop.set()
+        self._restart_at.clear()
+        for process in self._workers.values():
+            process.join(timeout)
+            if process.is_alive():
+                process.terminate()
+
+    def run(self, on_event: Optional[Callable[[Dict], None]] = None, output: Optional[TextIO] = None):
+        """
+        Start the pool and handle events until every stream ended or Ctrl+C.
+
+        Args:
+            on_event: Called with every event (default: write it to output
+                as a JSON line)
+            output: Stream the default handler writes to (default: stdout)
+        """
+        if not self.start():
+            return
+        output = output or sys.stdout
+        on_event = on_event or (lambda event: print(json.dumps(event, default=str), file=output, flush=True))
+        try:
+            for event in self.events():
+                on_event(event)
+        except KeyboardInterrupt:
+            print("\nStopping camera workers", file=sys.stderr)
+        finally:
+            self.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run face recognition on several camera streams.")
+    parser.add_argument("streams", nargs="*", help="Streams as name=source (camera index, video file or URL)")
+    parser.add_argument("--config", help="JSON file listing the streams")
+    parser.add_argument("--name", help="Verify this user instead of identifying against the gallery")
+    parser.add_argument("--engine", choices=["opencv", "numpy", "pca"], default="opencv", help="Recognizer backend")
+    parser.add_argument("--timeout", type=float, default=30.0, help="Seconds per check-in session")
+    parser.add_argument("--confidence-threshold", type=int,
+                        help="Minimum confidence of a match (default: the model's calibrated one)")
+    parser.add_argument("--max-fps", type=float, help="Frame-rate cap per stream")
+    parser.add_argument("--threads", type=int, help="OpenCV threads per worker (default: cores / streams)")
+    parser.add_argument("--cooldown", type=float, default=3.0, help="Pause after a successful check-in")
+    parser.add_argument("-o", "--output", default="-", help="File the JSON-lines events are appended to "
+                                                             "(default: stdout)")
+    args = parser.parse_args()
+
+    streams = load_streams(args.config) if args.config else []
+    streams += [parse_stream(spec, len(streams) + i) for i, spec in enumerate(args.streams)]
+    if not streams:
+        parser.error("no streams given")
+    output = sys.stdout if args.output == "-" else open(args.output, "a")
+    try:
+        CameraPool(streams, args.name, args.engine, args.timeout, args.confidence_threshold, max_fps=args.max_fps,
+                   threads_per_worker=args.threads, cooldown=args.cooldown).run(output=output)
+    finally:
+        if output is not sys.stdout:
+            output.close()
@@ -0,0 +1,553 @@
+import argparse
+import asyncio
+import base64
+import hashlib
+import json
+import os
+import struct
+import tempfile
+import threading
+import time
+import cv2
+import numpy as np
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+from decision import TemporalVoter
+from face_detection import CASCADE_PATH, FaceDetector
+from gallery import FaceGallery
+from metrics import Metrics, default_metrics
+
+WEBSOCKET_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+MAX_BODY_BYTES = 32 * 1024 * 1024
+MAX_CLIP_FRAMES = 60
+HTTP_STATUS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+               411: "Length Required", 413: "Payload Too Large", 500: "Internal Server Error",
+               503: "Service Unavailable"}
+
+
+class MicroBatcher:
+    """
+    Groups the faces of concurrent requests into one recognizer call.
+
+    The first face to arrive opens a batch. The batch is run once it holds
+    max_batch faces or max_delay seconds have passed, whichever comes first,
+    so a lone request waits at most max_delay while a burst of requests
+    shares one predict_batch() call. Batches run one at a time on a
+    dedicated thread, which also keeps the recognizer single-threaded.
+    """
+
+    def __init__(self, gallery: FaceGallery, max_batch: int = 32, max_delay: float = 0.005):
+        """
+        Initialize the batcher.
+
+        Args:
+            gallery: Loaded gallery to identify faces against
+            max_batch: Maximum number of faces per recognizer call
+            max_delay: Latency budget in seconds a face may wait for others
+        """
+        self.gallery = gallery
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.batches = 0
+        self.faces = 0
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="recognizer")
+
+    def start(self):
+        """Start the batching task on the running event loop."""
+        self._queue = asyncio.Queue()
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def close(self):
+        """Stop the batching task."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._executor.shutdown(wait=False)
+
+    async def identify(self, rois: List[np.ndarray]) -> List[Tuple[Optional[str], int]]:
+        """Identify face regions, batched with those of concurrent requests."""
+        if not rois:
+            return []
+        loop = asyncio.get_running_loop()
+        futures = []
+        for roi in rois:
+            future = loop.create_future()
+            self._queue.put_nowait((roi, future))
+            futures.append(future)
+        return list(await asyncio.gather(*futures))
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.max_delay
+            while len(batch) < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            # Drain whatever queued up meanwhile without waiting any longer
+            while len(batch) < self.max_batch and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+
+            try:
+                results = await loop.run_in_executor(self._executor, self.gallery.identify_many,
+                                                     [roi for roi, _ in batch])
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            self.batches += 1
+            self.faces += len(batch)
+            for (_, future), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+
+
+class CheckInService:
+    """
+    A local asyncio HTTP/WebSocket check-in service.
+
+    Thin clients (e.g. badge readers) send JPEG frames or short video clips:
+
+    - POST /checkin with a JPEG body (or a video clip with any other
+      Content-Type) returns the faces found and the check-in decision;
+      ?name=<user> only accepts that user.
+    - GET /ws upgrades to a WebSocket; every binary message is one JPEG
+      frame and is answered with that frame's faces and the running
+      decision, voted over the frames of the connection like
+      FaceRecognitionApp does. A "reset" text message starts a new
+      check-in.
+    - GET /health returns batching statistics and latency percentiles.
+
+    Decoding and face detection run on a thread pool, so the event loop
+    only parses requests; recognition goes through a MicroBatcher.
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 8080, engine: str = "opencv",
+                 confidence_threshold: Optional[int] = None, max_batch: int = 32, max_delay: float = 0.005,
+                 workers: Optional[int] = None, vote_window: int = 7, vote_quorum: int = 4,
+                 detect_width: Optional[int] = 640, max_pending: int = 64,
+                 metrics: Optional[Metrics] = None, reload_interval: float = 2.0):
+        """
+        Initialize the service.
+
+        Args:
+            host: Interface to listen on
+            port: TCP port to listen on
+            engine: Recognizer backend of the gallery
+            confidence_threshold: Minimum confidence level for a positive match
+                (default: the model's, see lbp.calibrated_threshold)
+            max_batch: Maximum number of faces per recognizer call
+            max_delay: Seconds a face may wait for others to be batched with
+            workers: Decode/detect threads (default: CPU count)
+            vote_window: Number of recent frames considered for a decision (M)
+            vote_quorum: Number of agreeing frames needed for a decision (K)
+            detect_width: Width frames are downscaled to before detection
+            max_pending: Requests processed at once; more are refused with
+                503 (or an error message) instead of queueing, which keeps
+                the latency of accepted requests bounded
+            metrics: Metrics to report to (default: the process-wide metrics)
+            reload_interval: Seconds between checks of the gallery manifest;
+                users enrolled while the service runs are picked up when it
+                changes (0 never reloads)
+        """
+        self.host = host
+        self.port = port
+        self.gallery = FaceGallery(confidence_threshold=confidence_threshold, engine=engine)
+        self.batcher = MicroBatcher(self.gallery, max_batch, max_delay)
+        self.vote_window = vote_window
+        self.vote_quorum = vote_quorum
+        self.detect_width = detect_width
+        self.max_pending = max_pending
+        self.pending = 0
+        self.rejected = 0
+        self.errors = 0
+        self.metrics = metrics if metrics is not None else default_metrics()
+        self.latencies = deque(maxlen=4096)
+        self.requests = 0
+        self._executor = ThreadPoolExecutor(max_workers=workers or os.cpu_count(), thread_name_prefix="decode")
+        self._local = threading.local()
+        self._server: Optional[asyncio.AbstractServer] = None
+        self.reload_interval = reload_interval
+        self._gallery_version = None
+        self._watcher: Optional[asyncio.Task] = None
+
+    # Decoding and detection (thread pool)
+
+    def _detector(self) -> FaceDetector:
+        detector = getattr(self._local, "detector", None)
+        if detector is None:
+            detector = FaceDetector(CASCADE_PATH, 1.3, 5, detect_width=self.detect_width)
+            # The cached cascade is shared process-wide; give each thread its own
+            detector.cascade = cv2.CascadeClassifier(CASCADE_PATH)
+            self._local.detector = detector
+        return detector
+
+    def _faces(self, gray) -> Tuple[List[List[int]], List[np.ndarray]]:
+        boxes = [[int(v) for v in box] for box in self._detector().detect(gray)]
+        return boxes, [gray[y:y + h, x:x + w] for x, y, w, h in boxes]
+
+    def _decode_image(self, data: bytes):
+        try:
+            gray = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_GRAYSCALE)
+        except cv2.error:
+            gray = None
+        if gray is None:
+            raise ValueError("Could not decode the image")
+        return [self._faces(gray)]
+
+    def _decode_clip(self, data: bytes, max_frames: int = MAX_CLIP_FRAMES):
+        # VideoCapture only reads from files
+        fd, path = tempfile.mkstemp(suffix=".clip")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            cap = cv2.VideoCapture(path)
+            frames = []
+            try:
+                while len(frames) < max_frames:
+                    ret, frame = cap.read()
+                    if not ret:
+                        break
+                    frames.append(self._faces(cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)))
+            finally:
+                cap.release()
+        finally:
+            os.remove(path)
+        if not frames:
+            raise ValueError("Could not decode the clip")
+        return frames
+
+    # Recognition
+
+    async def _recognize(self, frames, voter: TemporalVoter, name: Optional[str] = None) -> List[Dict]:
+        rois = [roi for _, frame_rois in frames for roi in frame_rois]
+        with self.metrics.stage("recognize"):
+            matches = iter(await self.batcher.identify(rois))
+        results = []
+        for boxes, _ in frames:
+            faces = []
+            vote, vote_confidence = None, 0
+            for box in boxes:
+                identity, confidence = next(matches)
+                if name is not None and identity != name:
+                    identity = None
+                faces.append({"box": box, "identity": identity, "confidence": confidence})
+                if identity is not None and (vote is None or confidence > vote_confidence):
+                    vote, vote_confidence = identity, confidence
+            if boxes:
+                voter.add(vote, vote_confidence)
+            results.append({"faces": faces})
+        return results
+
+    def _observe(self, started: float):
+        latency = time.perf_counter() - started
+        self.latencies.append(latency)
+        self.requests += 1
+        self.metrics.observe("checkin_seconds", latency)
+
+    async def check_in(self, data: bytes, clip: bool = False, name: Optional[str] = None) -> Dict:
+        """
+        Check in from one JPEG frame or a short clip.
+
+        A single frame checks in when a face is recognized; a clip needs a
+        K-of-M majority of its frames (decided on the last frames when the
+        clip is shorter than the quorum).
+
+        Args:
+            data: JPEG (or other image) bytes, or video clip bytes
+            clip: Decode data as a video clip instead of an image
+            name: Only accept this user
+
+        Returns:
+            Result with the faces of every frame and the decision
+        """
+        started = time.perf_counter()
+        loop = asyncio.get_running_loop()
+        self.pending += 1
+        try:
+            with self.metrics.stage("decode"):
+                frames = await loop.run_in_executor(self._executor,
+                                                    self._decode_clip if clip else self._decode_image, data)
+            voter = TemporalVoter(min(self.vote_window, len(frames)), min(self.vote_quorum, len(frames)))
+            results = await self._recognize(frames, voter, name)
+        finally:
+            self.pending -= 1
+        self._observe(started)
+        return {"checked_in": bool(voter.decision), "identity": voter.identity, "frames": results,
+                "latency_ms": round((time.perf_counter() - started) * 1000, 2)}
+
+    def health(self) -> Dict:
+        """Return batching statistics and request latency percentiles."""
+        latencies = np.array(self.latencies) * 1000
+        percentiles = {f"p{p}_ms": round(float(np.percentile(latencies, p)), 2) if len(latencies) else None
+                       for p in (50, 95, 99)}
+        return dict(percentiles, status="ok", requests=self.requests, rejected=self.rejected, errors=self.errors,
+                    pending=self.pending, batches=self.batcher.batches,
+                    faces=self.batcher.faces,
+                    mean_batch=round(self.batcher.faces / self.batcher.batches, 2) if self.batcher.batches else 0,
+                    enrolled=len(self.gallery.labels))
+
+    # HTTP
+
+    @staticmethod
+    async def _read_request(reader: asyncio.StreamReader):
+        head = await reader.readuntil(b"\r\n\r\n")
+        lines = head.decode("latin-1").split("\r\n")
+        method, target, version = lines[0].split(" ", 2)
+        headers = {}
+        for line in lines[1:]:
+            if ":" in line:
+                key, value = line.split(":", 1)
+                headers[key.strip().lower()] = value.strip()
+        return method, target, version, headers
+
+    @staticmethod
+    async def _respond(writer: asyncio.StreamWriter, status: int, body: Dict, keep_alive: bool = True):
+        payload = json.dumps(body, default=str).encode()
+        writer.write((f"HTTP/1.1 {status} {HTTP_STATUS.get(status, '')}\r\n"
+                      f"Content-Type: application/json\r\nContent-Length: {len(payload)}\r\n"
+                      f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n").encode() + payload)
+        await writer.drain()
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                try:
+                    method, target, version, headers = await self._read_request(reader)
+                except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ValueError):
+                    break
+                url = urlsplit(target)
+                query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+                keep_alive = headers.get("connection", "").lower() != "close" and version == "HTTP/1.1"
+
+                if url.path == "/ws" and headers.get("upgrade", "").lower() == "websocket":
+                    await self._websocket(reader, writer, headers, query.get("name"))
+                    break
+                if url.path == "/health":
+                    await self._respond(writer, 200, self.health(), keep_alive)
+                elif url.path != "/checkin":
+                    await self._respond(writer, 404, {"error": "not found"}, keep_alive)
+                elif method != "POST":
+                    await self._respond(writer, 405, {"error": "use POST"}, keep_alive)
+                else:
+                    # Chunked bodies are not supported; the length must be known up front
+                    if "content-length" not in headers or "chunked" in headers.get("transfer-encoding", "").lower():
+                        await self._respond(writer, 411, {"error": "send the body with a Content-Length"}, False)
+                        break
+                    try:
+                        length = int(headers["content-length"])
+                    except ValueError:
+                        length = -1
+                    if length <= 0:
+                        await self._respond(writer, 400, {"error": "empty or invalid body length"}, False)
+                        break
+                    if length > MAX_BODY_BYTES:
+                        await self._respond(writer, 413, {"error": "body too large"}, False)
+                        break
+                    data = await reader.readexactly(length)
+                    if self.pending >= self.max_pending:
+                        self.rejected += 1
+                        await self._respond(writer, 503, {"error": "busy, retry later"}, keep_alive)
+                        continue
+                    clip = not headers.get("content-type", "image/jpeg").startswith("image/")
+                    try:
+                        result = await self.check_in(data, clip, query.get("name"))
+                        await self._respond(writer, 200, result, keep_alive)
+                    except ValueError as e:
+                        await self._respond(writer, 400, {"error": str(e)}, keep_alive)
+                    except Exception as e:
+                        self.errors += 1
+                        print(f"Error checking in: {e}")
+                        await self._respond(writer, 500, {"error": "internal error"}, keep_alive)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        except Exception as e:
+            print(f"Error handling request: {e}")
+        finally:
+            writer.close()
+
+    # WebSocket (RFC 6455, single-frame messages)
+
+    @staticmethod
+    async def _ws_read(reader: asyncio.StreamReader) -> Tuple[int, bytes]:
+        first, second = await reader.readexactly(2)
+        opcode = first & 0x0F
+        length = second & 0x7F
+        if length == 126:
+            length = struct.unpack(">H", await reader.readexactly(2))[0]
+        elif length == 127:
+            length = struct.unpack(">Q", await reader.readexactly(8))[0]
+        if length > MAX_BODY_BYTES:
+            raise ValueError("WebSocket message too large")
+        mask = await reader.readexactly(4) if second & 0x80 else None
+        payload = await reader.readexactly(length)
+        if mask:
+            payload = (np.frombuffer(payload, np.uint8) ^ np.resize(np.frombuffer(mask, np.uint8), length)).tobytes()
+        return opcode, payload
+
+    @staticmethod
+    async def _ws_send(writer: asyncio.StreamWriter, payload: bytes, opcode: int = 0x1):
+        length = len(payload)
+        if length < 126:
+            header = struct.pack(">BB", 0x80 | opcode, length)
+        elif length < 1 << 16:
+            header = struct.pack(">BBH", 0x80 | opcode, 126, length)
+        else:
+            header = struct.pack(">BBQ", 0x80 | opcode, 127, length)
+        writer.write(header + payload)
+        await writer.drain()
+
+    async def _websocket(self, reader, writer, headers: Dict[str, str], name: Optional[str]):
+        accept = base64.b64encode(hashlib.sha1((headers.get("sec-websocket-key", "") + WEBSOCKET_GUID)
+                                               .encode()).digest()).decode()
+        writer.write(("HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n"
+                      f"Sec-WebSocket-Accept: {accept}\r\n\r\n").encode())
+        await writer.drain()
+
+        loop = asyncio.get_running_loop()
+        voter = TemporalVoter(self.vote_window, self.vote_quorum)
+        frame_index = 0
+        while True:
+            opcode, payload = await self._ws_read(reader)
+            if opcode == 0x8:  # close
+                await self._ws_send(writer, payload[:2], 0x8)
+                return
+            if opcode == 0x9:  # ping
+                await self._ws_send(writer, payload, 0xA)
+                continue
+            if opcode == 0x1:
+                if payload.decode(errors="replace").strip() == "reset":
+                    voter.reset()
+                continue
+            if opcode != 0x2:
+                continue
+
+            if self.pending >= self.max_pending:
+                self.rejected += 1
+                await self._ws_send(writer, json.dumps({"error": "busy, frame skipped"}).encode())
+                continue
+            started = time.perf_counter()
+            self.pending += 1
+            try:
+                frames = await loop.run_in_executor(self._executor, self._decode_image, payload)
+                result = (await self._recognize(frames, voter, name))[0]
+            except ValueError as e:
+                await self._ws_send(writer, json.dumps({"error": str(e)}).encode())
+                continue
+            except Exception as e:
+                self.errors += 1
+                print(f"Error checking in: {e}")
+                await self._ws_send(writer, json.dumps({"error": "internal error"}).encode())
+                continue
+            finally:
+                self.pending -= 1
+            self._observe(started)
+            result.update(frame=frame_index, decision=voter.decision, identity=voter.identity,
+                          latency_ms=round((time.perf_counter() - started) * 1000, 2))
+            await self._ws_send(writer, json.dumps(result, default=str).encode())
+            frame_index += 1
+            if voter.decision is not None:
+                # The decision was sent; the next frames start a new check-in
+                voter.reset()
+
+    # Lifecycle
+
+    def _manifest_version(self):
+        try:
+            stat = os.stat(self.gallery.labels_path)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    async def _watch_gallery(self):
+        # Every enrollment commits a new manifest (see FaceGallery.save)
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(self.reload_interval)
+            version = self._manifest_version()
+            if version is None or version == self._gallery_version:
+                continue
+            gallery = FaceGallery(confidence_threshold=self.gallery.confidence_threshold, engine=self.gallery.engine)
+            try:
+                loaded = await loop.run_in_executor(self._executor, gallery.load)
+            except Exception as e:
+                loaded = False
+                print(f"Error reloading the gallery: {e}")
+            if loaded:
+                # Batches already running finish on the previous gallery
+                self.gallery = self.batcher.gallery = gallery
+                print(f"Reloaded the gallery: {len(gallery.labels)} users")
+            self._gallery_version = version
+
+    async def start(self) -> bool:
+        """Load the gallery and start listening."""
+        self._gallery_version = self._manifest_version()
+        if not self.gallery.load():
+            return False
+        if self.reload_interval > 0:
+            self._watcher = asyncio.create_task(self._watch_gallery())
+        self.batcher.start()
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        print(f"Check-in service listening on http://{self.host}:{self.port}")
+        return True
+
+    async def close(self):
+        """Stop listening and release the worker threads."""
+        if self._watcher is not None:
+            self._watcher.cancel()
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+        await self.batcher.close()
+        self._executor.shutdown(wait=False)
+        self.metrics.flush()
+
+    async def serve_forever(self):
+        """Start the service and run until cancelled."""
+        if not await self.start():
+            return
+        try:
+            await self._server.serve_forever()
+        finally:
+            await self.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve face check-ins over HTTP and WebSocket.")
+    parser.add_argument("--host", default="127.0.0.1", help="Interface to listen on")
+    parser.add_argument("--port", type=int, default=8080, help="TCP port to listen on")
+    parser.add_argument("--engine", choices=["opencv", "numpy", "pca"], default="opencv", help="Gallery recognizer backend")
+    parser.add_argument("--confidence-threshold", type=int,
+                        help="Minimum confidence of a match (default: the model's calibrated one)")
+    parser.add_argument("--max-batch", type=int, default=32, help="Maximum faces per recognizer call")
+    parser.add_argument("--max-delay-ms", type=float, default=5.0, help="Latency budget for batching, in ms")
+    parser.add_argument("--workers", type=int, help="Decode/detect threads (default: CPU count)")
+    parser.add_argument("--detect-width", type=int, default=640, help="Downscale frames to this width for detection")
+    parser.add_argument("--max-pending", type=int, default=64, help="Concurrent requests before refusing with 503")
+    parser.add_argument("--reload-interval", type=float, default=2.0,
+                        help="Seconds between checks for newly enrolled users (0 never reloads)")
+    args = parser.parse_args()
+    service = CheckInService(args.host, args.port, args.engine, args.confidence_threshold, max_batch=args.max_batch,
+                             max_delay=args.max_delay_ms / 1000, workers=args.workers,
+                             detect_width=args.detect_width, max_pending=args.max_pending,
+                             reload_interval=args.reload_interval)
+    try:
+        asyncio.run(service.serve_forever())
+    except KeyboardInterrupt:
+        print("\nCheck-in service stopped")
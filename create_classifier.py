@@ -1,41 +1,137 @@
 import numpy as np
 from PIL import Image
-import os, cv2
+import os
+from gallery import FaceGallery
+from face_dataset import PackedFaceDataset, normalize_face
+from lbp import create_recognizer, model_extension
+from lbph_model import write_sidecar
+from prototypes import condense_faces
+from model_registry import model_cache
 
 
 
-# Method to train custom classifier to recognize face
-def train_classifer(name):
-    # Read all the images in custom data-set
+# Load captured face images of a user as grayscale numpy arrays keyed by sample id
+def load_user_samples(name, exclude=()):
     path = os.path.join(os.getcwd()+"/data/"+name+"/")
 
-    faces = []
-    ids = []
-    labels = []
+    samples = {}
     pictures = {}
 
-
-    # Store images in a numpy format and ids of the user on the same index in imageNp and id lists
+    # Packed datasets are mapped zero-copy, one view per sample
+    dataset = PackedFaceDataset(path)
+    if dataset.exists():
+        for i, face in enumerate(dataset.load()):
+            if "#"+str(i) not in exclude:
+                samples["#"+str(i)] = face
+        return samples
 
     for root,dirs,files in os.walk(path):
             pictures = files
 
-
     for pic in pictures :
+            if pic in exclude:
+                continue
 
             imgpath = path+pic
             img = Image.open(imgpath).convert('L')
-            imageNp = np.array(img, 'uint8')
-            id = int(pic.split(name)[0])
+            samples[pic] = normalize_face(np.array(img, 'uint8'))
+
+    return samples
+
+
+# Load every captured face image of a user together with its id
+def load_user_faces(name):
+    faces = []
+    ids = []
+
+    for pic, imageNp in load_user_samples(name).items():
+            # Packed samples are keyed "#<index>", loose pictures "<index><name>.jpg"
+            id = int(pic[1:]) if pic.startswith("#") else int(pic.split(name)[0])
             #names[name].append(id)
             faces.append(imageNp)
             ids.append(id)
 
+    return faces, ids
+
+
+# Method to train custom classifier to recognize face
+# engine: "opencv" (cv2.face LBPH, .xml) or "numpy" (vectorized LBPH, .npz);
+#         "pca" (int8 PCA descriptors) is only trained for the gallery
+# prototypes: keep only this many representative samples (see prototypes.py)
+def train_classifer(name, engine="opencv", prototypes=None):
+    if engine == "pca":
+        # A projection fitted on one person's faces rejects many of their own new ones,
+        # and has no other users to calibrate its threshold against
+        print("Error: pca models need every user (see train_gallery)")
+        return
+    # Store images in a numpy format and ids of the user on the same index in imageNp and id lists
+    faces, ids = load_user_faces(name)
+
+    if prototypes and len(faces) > prototypes:
+        # Match time grows with every stored sample; near-identical frames add little
+        keep = condense_faces(faces, prototypes)
+        faces = [faces[i] for i in keep]
+        ids = [ids[i] for i in keep]
+
     ids = np.array(ids)
 
     #Train and save classifier
-    clf = cv2.face.LBPHFaceRecognizer_create()
+    clf = create_recognizer(engine)
     clf.train(faces, ids)
-    clf.write("./data/classifiers/"+name+"_classifier.xml")
+    model_path = "./data/classifiers/"+name+"_classifier"+model_extension(engine)
+    clf.write(model_path)
+    if engine == "opencv":
+        # Binary copy that loads without parsing the XML (see lbph_model.py)
+        write_sidecar(clf, model_path)
+    # Make sure running recognizers pick up the new model
+    model_cache.invalidate(model_path)
+
+
+# Every folder under ./data holding captured faces is one enrolled user
+def list_enrolled_users():
+    data_dir = os.path.join(os.getcwd(), "data")
+    users = []
+    for entry in sorted(os.listdir(data_dir)):
+        user_dir = os.path.join(data_dir, entry)
+        if entry == "classifiers" or not os.path.isdir(user_dir):
+            continue
+        if PackedFaceDataset(user_dir).exists() or any(f.endswith(entry + ".jpg") for f in os.listdir(user_dir)):
+            users.append(entry)
+    return users
+
+
+# Method to train one shared classifier holding every enrolled user
+def train_gallery(engine="opencv"):
+    samples = {}
+    for name in list_enrolled_users():
+        user_samples = load_user_samples(name)
+        if user_samples:
+            samples[name] = user_samples
+
+    gallery = FaceGallery(engine=engine)
+    gallery.train(samples)
+    gallery.save()
+    return gallery
+
+
+# Add a user (or new samples of a user) to the shared classifier without retraining
+def enroll_user(name, engine="opencv"):
+    gallery = FaceGallery(engine=engine)
+    # The new faces are appended to the gallery's log, so the model itself is not loaded
+    if os.path.exists(gallery.labels_path):
+        if not gallery.read_manifest():
+            return 0
+
+    # Only decode the pictures the gallery has not seen yet
+    samples = load_user_samples(name, exclude=set(gallery.samples.get(name, [])))
+    if engine == "pca":
+        # The PCA projection is learned from every user, so it is refitted with the new samples
+        if samples:
+            train_gallery(engine)
+        return len(samples)
+    added = gallery.enroll(name, samples)
+    if added:
+        gallery.save()
+    return added
 
-#train_classifer('tho1')
\ No newline at end of file
+#train_classifer('tho1')
@@ -1,81 +1,99 @@
 import cv2
 import os
+from face_dataset import PackedFaceDataset, AsyncDatasetWriter, SampleSelector
+from video_source import FrameGrabber
+from face_detection import FaceDetector
 
-def start_capture(name):
+def start_capture(name, selector=None):
         path = "./data/" + name
         num_of_images = 0
-        detector = cv2.CascadeClassifier("./data/haarcascade_frontalface_default.xml")
+        detector = FaceDetector("./data/haarcascade_frontalface_default.xml", scale_factor=1.1, min_neighbors=5)
         try:
             os.makedirs(path)
         except:
             print('Directory Already Created')
-        vid = cv2.VideoCapture(0)
+        writer = AsyncDatasetWriter(PackedFaceDataset(path))
+        # Keeps only sharp, large-enough and new-looking crops
+        selector = selector or SampleSelector()
+        vid = FrameGrabber(0)
         while True:
 
             ret, img = vid.read()
             new_img = None
             grayimg = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-            face = detector.detectMultiScale(image=grayimg, scaleFactor=1.1, minNeighbors=5)
+            face = detector.detect(grayimg)
             for x, y, w, h in face:
                 cv2.rectangle(img, (x, y), (x+w, y+h), (0, 0, 0), 2)
                 cv2.putText(img, "Face Detected", (x, y-5), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 0, 255))
                 cv2.putText(img, str(str(num_of_images)+" images captured"), (x, y+h+20), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 0, 255))
-                new_img = img[y:y+h, x:x+w]
+                new_img = grayimg[y:y+h, x:x+w]
             cv2.imshow("Face Detection", img)
             key = cv2.waitKey(1) & 0xFF
 
 
-            try :
-                cv2.imwrite(str(path+"/"+str(num_of_images)+name+".jpg"), new_img)
-                num_of_images += 1
-            except :
-
-                pass
-            if key == ord("q") or key == 27 or num_of_images > 300: #take 300 frames
+            # Disk writes happen on the writer thread; a full queue drops the sample
+            if new_img is not None and selector.consider(new_img):
+                if writer.submit(new_img):
+                    num_of_images += 1
+                else:
+                    # Dropped: it must not count as a sample or block similar crops
+                    selector.retract()
+            if key == ord("q") or key == 27 or selector.done: #enough diverse samples
                 break
+        vid.release()
         cv2.destroyAllWindows()
-        return num_of_images
+        print(f"Kept {selector.accepted} samples, rejected {selector.rejected}")
+        return writer.close()
 #take frames by extract a video 
-def take_video(name, video):
+def take_video(name, video, headless=False, selector=None):
     path = "./data/" + name
     num_of_images = 0
-    detector = cv2.CascadeClassifier("./data/haarcascade_frontalface_default.xml")
+    detector = FaceDetector("./data/haarcascade_frontalface_default.xml", scale_factor=1.1, min_neighbors=5)
     try:
         os.makedirs(path)
     except:
         print('Directory Already Created')
-    vid = cv2.VideoCapture(video)
+    # Recorded footage: keep every frame, decoding ahead on the grabber thread
+    vid = FrameGrabber(video, buffer_size=8, drop_oldest=False)
     if not vid.isOpened():
         print("Error: Could not open video file.")
         exit()
+    writer = AsyncDatasetWriter(PackedFaceDataset(path))
+    # Keeps only sharp, large-enough and new-looking crops
+    selector = selector or SampleSelector()
     num_of_images = 0
     while True:
 
         ret, img = vid.read()
-        new_img = None
-        grayimg = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-        face = detector.detectMultiScale(image=grayimg, scaleFactor=1.1, minNeighbors=5)
         if not ret:
             break  # Break the loop if no more frames are available
+        new_img = None
+        grayimg = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+        face = detector.detect(grayimg)
         for x, y, w, h in face:
             
-            cv2.rectangle(img, (x, y), (x+w, y+h), (0, 0, 0), 2)
-            cv2.putText(img, "Face Detected", (x, y-5), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 0, 255))
-            cv2.putText(img, str(str(num_of_images)+" images captured"), (x, y+h+20), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 0, 255))
-            new_img = img[y:y+h, x:x+w]
-        cv2.imshow("Face Detection", img)
-        key = cv2.waitKey(1) & 0xFF
-        try :
-            cv2.imwrite(str(path+"/"+str(num_of_images)+name+".jpg"), new_img)
-            num_of_images += 1
-        except :
-
-            pass
-        if key == ord("q") or key == 27 or num_of_images > 300: #take 300 frames
+            if not headless:
+                cv2.rectangle(img, (x, y), (x+w, y+h), (0, 0, 0), 2)
+                cv2.putText(img, "Face Detected", (x, y-5), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 0, 255))
+                cv2.putText(img, str(str(num_of_images)+" images captured"), (x, y+h+20), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 0, 255))
+            new_img = grayimg[y:y+h, x:x+w]
+        key = -1
+        if not headless:
+            cv2.imshow("Face Detection", img)
+            key = cv2.waitKey(1) & 0xFF
+        if new_img is not None and selector.consider(new_img):
+            if writer.submit(new_img):
+                num_of_images += 1
+            else:
+                # Dropped: it must not count as a sample or block similar crops
+                selector.retract()
+        if key == ord("q") or key == 27 or selector.done: #enough diverse samples
             break
     vid.release()
-    cv2.destroyAllWindows()
-    return num_of_images
+    if not headless:
+        cv2.destroyAllWindows()
+    print(f"Kept {selector.accepted} samples, rejected {selector.rejected}")
+    return writer.close()
 
 
 #take_video('tho1', 'data\WIN_20230920_07_56_11_Pro.mp4')
@@ -0,0 +1,68 @@
+from collections import Counter, deque
+from typing import Optional
+
+
+class TemporalVoter:
+    """
+    A K-of-M sliding-window vote over per-frame recognition results.
+
+    Each frame with a face casts one vote: the recognized identity, or None
+    for an unknown face. A decision is reached as soon as `quorum` of the
+    last `window` votes agree, either on one identity (accept) or on
+    unknown (reject), so a single noisy frame can no longer flip the result
+    and a clear check-in finishes after a handful of frames.
+    """
+
+    def __init__(self, window: int = 7, quorum: int = 4):
+        """
+        Initialize the voter.
+
+        Args:
+            window: Number of most recent votes considered (M)
+            quorum: Number of agreeing votes needed for a decision (K)
+        """
+        if not 0 < quorum <= window:
+            raise ValueError("quorum must be between 1 and window")
+        self.window = window
+        self.quorum = quorum
+        self._votes = deque(maxlen=window)
+        self.decision: Optional[bool] = None
+        self.identity: Optional[str] = None
+
+    def reset(self):
+        """Forget every vote and any decision."""
+        self._votes.clear()
+        self.decision = None
+        self.identity = None
+
+    @property
+    def votes(self) -> int:
+        """Number of votes currently in the window."""
+        return len(self._votes)
+
+    def mean_confidence(self, identity: Optional[str] = None) -> float:
+        """Mean confidence of the votes in the window cast for an identity."""
+        confidences = [c for i, c in self._votes if i == identity]
+        return sum(confidences) / len(confidences) if confidences else 0.0
+
+    def add(self, identity: Optional[str], confidence: float = 0.0) -> Optional[bool]:
+        """
+        Cast the vote of one frame.
+
+        Args:
+            identity: Recognized identity, or None for an unknown face
+            confidence: Recognizer confidence of the vote
+
+        Returns:
+            True once accepted, False once rejected, None while undecided
+        """
+        self._votes.append((identity, confidence))
+        self.decision, self.identity = None, None
+        for candidate, count in Counter(i for i, _ in self._votes).most_common():
+            if count < self.quorum:
+                break
+            if candidate is not None:
+                self.decision, self.identity = True, candidate
+                break
+            self.decision = False
+        return self.decision
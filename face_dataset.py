@@ -0,0 +1,340 @@
+import cv2
+import json
+import os
+import queue
+import threading
+import numpy as np
+from typing import Dict, Tuple
+
+
+FACE_SIZE = (100, 100)  # (width, height) of every stored face crop
+MIN_FACE_SIZE = 80      # smallest detected face (pixels) worth keeping
+MIN_SHARPNESS = 50.0    # variance of the Laplacian of a normalized crop
+MIN_SAMPLES = 30        # a capture may stop early once it has this many
+MAX_SAMPLES = 100       # a capture always stops once it has this many
+PACK_FILENAME = 'faces.u8'
+INDEX_FILENAME = 'faces.json'
+FORMAT_VERSION = 1
+
+
+def normalize_face(roi_gray, face_size: Tuple[int, int] = FACE_SIZE):
+    """
+    Resize a grayscale face region to the fixed size used for training.
+
+    Args:
+        roi_gray: Grayscale face region of any size
+        face_size: Target (width, height)
+
+    Returns:
+        Grayscale face crop of exactly face_size
+    """
+    if roi_gray.shape[1] == face_size[0] and roi_gray.shape[0] == face_size[1]:
+        return roi_gray
+    return cv2.resize(roi_gray, face_size, interpolation=cv2.INTER_AREA)
+
+
+class PackedFaceDataset:
+    """
+    A user's face samples packed into one append-only array file.
+
+    Every sample is a fixed-size grayscale crop stored back to back as raw
+    uint8 pixels in faces.u8, described by a small faces.json index. Capture
+    appends to the file and training maps it zero-copy with np.memmap, which
+    replaces hundreds of small JPEG files and their encode/decode round-trips.
+    """
+
+    def __init__(self, path: str, face_size: Tuple[int, int] = FACE_SIZE):
+        """
+        Initialize the dataset.
+
+        Args:
+            path: Directory of the user's dataset (e.g. ./data/<name>)
+            face_size: (width, height) of every stored crop
+        """
+        self.path = path
+        self.pack_path = os.path.join(path, PACK_FILENAME)
+        self.index_path = os.path.join(path, INDEX_FILENAME)
+        self.face_size = face_size
+        self._file = None
+
+        if os.path.exists(self.index_path):
+            with open(self.index_path, "r") as f:
+                index = json.load(f)
+            self.face_size = (index["width"], index["height"])
+
+    @property
+    def sample_bytes(self) -> int:
+        """Size in bytes of one stored sample."""
+        return self.face_size[0] * self.face_size[1]
+
+    def exists(self) -> bool:
+        """Return True if a packed dataset is present on disk."""
+        return os.path.exists(self.index_path) and os.path.exists(self.pack_path)
+
+    def __len__(self) -> int:
+        # The pack size is authoritative: a partially written trailing
+        # sample (e.g. after a crash) is simply ignored.
+        if not os.path.exists(self.pack_path):
+            return 0
+        return os.path.getsize(self.pack_path) // self.sample_bytes
+
+    def _write_index(self):
+        index = {
+            "version": FORMAT_VERSION,
+            "dtype": "uint8",
+            "width": self.face_size[0],
+            "height": self.face_size[1],
+            "count": len(self),
+        }
+        tmp_path = self.index_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(index, f)
+        os.replace(tmp_path, self.index_path)
+
+    def open(self):
+        """Open the pack for appending, creating it if needed."""
+        os.makedirs(self.path, exist_ok=True)
+        if self._file is None:
+            self._file = open(self.pack_path, "ab")
+            self._write_index()
+        return self
+
+    def append(self, roi_gray) -> int:
+        """
+        Append one grayscale face crop to the pack.
+
+        Args:
+            roi_gray: Grayscale face region of any size
+
+        Returns:
+            int: Index of the stored sample
+        """
+        if self._file is None:
+            self.open()
+        face = np.ascontiguousarray(normalize_face(roi_gray, self.face_size), dtype=np.uint8)
+        self._file.write(face.tobytes())
+        return self._file.tell() // self.sample_bytes - 1
+
+    def close(self):
+        """Flush pending samples and update the index."""
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+            self._write_index()
+
+    def __enter__(self):
+        return self.open()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def load(self) -> np.ndarray:
+        """
+        Map every stored sample without copying.
+
+        Returns:
+            Read-only array of shape (count, height, width)
+        """
+        count = len(self)
+        shape = (count, self.face_size[1], self.face_size[0])
+        if count == 0:
+            return np.empty(shape, dtype=np.uint8)
+        return np.memmap(self.pack_path, dtype=np.uint8, mode="r", shape=shape)
+
+
+class AsyncDatasetWriter:
+    """
+    Appends face crops to a PackedFaceDataset from a background thread.
+
+    The capture loop hands crops to a bounded queue and never waits on disk.
+    When the queue is full the crop is rejected and counted as dropped, so
+    slow storage shows up as backpressure instead of a stuttering preview.
+    """
+
+    def __init__(self, dataset: PackedFaceDataset, max_pending: int = 64):
+        """
+        Initialize the writer and start its thread.
+
+        Args:
+            dataset: Packed dataset to append to
+            max_pending: Maximum number of crops waiting to be written
+        """
+        self.dataset = dataset
+        self.written = 0
+        self.dropped = 0
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._thread = threading.Thread(target=self._drain, daemon=True)
+        self.dataset.open()
+        self._thread.start()
+
+    @property
+    def pending(self) -> int:
+        """Number of crops queued but not yet written."""
+        return self._queue.qsize()
+
+    def submit(self, roi_gray) -> bool:
+        """
+        Queue a crop for writing without blocking.
+
+        Args:
+            roi_gray: Grayscale face region of any size
+
+        Returns:
+            bool: True if the crop was queued, False if the queue was full
+        """
+        try:
+            self._queue.put_nowait(roi_gray)
+            return True
+        except queue.Full:
+            self.dropped += 1
+            return False
+
+    def _drain(self):
+        while True:
+            roi_gray = self._queue.get()
+            if roi_gray is None:
+                break
+            try:
+                self.dataset.append(roi_gray)
+                self.written += 1
+            except Exception as e:
+                print(f"Error writing face sample: {e}")
+
+    def close(self) -> int:
+        """
+        Flush every queued crop and close the dataset.
+
+        Returns:
+            int: Exact number of samples persisted
+        """
+        self._queue.put(None)
+        self._thread.join()
+        self.dataset.close()
+        if self.dropped:
+            print(f"Warning: {self.dropped} samples dropped because the writer fell behind")
+        return self.written
+
+
+def sharpness(roi_gray) -> float:
+    """
+    Score how sharp a face crop is.
+
+    Args:
+        roi_gray: Grayscale face region of any size
+
+    Returns:
+        float: Variance of the Laplacian of the normalized crop (low = blurred)
+    """
+    return float(cv2.Laplacian(normalize_face(roi_gray), cv2.CV_64F).var())
+
+
+def dhash(roi_gray, hash_size: int = 8) -> int:
+    """
+    Compute the difference hash of a face crop.
+
+    Args:
+        roi_gray: Grayscale face region of any size
+        hash_size: Hash width and height; the hash has hash_size**2 bits
+
+    Returns:
+        int: Hash whose Hamming distance to another hash measures how different
+        the two crops look
+    """
+    small = cv2.resize(roi_gray, (hash_size + 1, hash_size), interpolation=cv2.INTER_AREA)
+    bits = (small[:, 1:] > small[:, :-1]).flatten()
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+
+class SampleSelector:
+    """
+    Decides which face crops a capture keeps.
+
+    Crops that are too small or blurred are rejected, and so are crops whose
+    difference hash is within max_distance bits of an accepted one, which
+    filters the near-identical frames of a face holding still. The capture
+    is done once max_samples crops were accepted, or earlier once it has
+    min_samples and the last `patience` crops were all duplicates, i.e. the
+    user is no longer showing anything new.
+    """
+
+    def __init__(self, min_size: int = MIN_FACE_SIZE, min_sharpness: float = MIN_SHARPNESS,
+                 max_distance: int = 10, min_samples: int = MIN_SAMPLES,
+                 max_samples: int = MAX_SAMPLES, patience: int = 90):
+        """
+        Initialize the selector.
+
+        Args:
+            min_size: Smallest accepted crop width and height in pixels
+            min_sharpness: Smallest accepted sharpness() score
+            max_distance: Largest dHash Hamming distance counted as a duplicate
+            min_samples: Samples needed before the capture may stop early
+            max_samples: Samples after which the capture stops
+            patience: Consecutive duplicates that end the capture early
+        """
+        self.min_size = min_size
+        self.min_sharpness = min_sharpness
+        self.max_distance = max_distance
+        self.min_samples = min_samples
+        self.max_samples = max_samples
+        self.patience = patience
+        self.accepted = 0
+        self.rejected: Dict[str, int] = {"small": 0, "blurred": 0, "duplicate": 0}
+        # Hashes of the accepted crops as big-endian bytes, one row per crop
+        self._hashes = np.empty((max_samples, 8), dtype=np.uint8)
+        self._duplicates_in_a_row = 0
+        self._retract_duplicates = 0
+
+    def _is_duplicate(self, hash_bytes: np.ndarray) -> bool:
+        if not self.accepted:
+            return False
+        diff = np.bitwise_xor(self._hashes[:self.accepted], hash_bytes)
+        distances = np.unpackbits(diff, axis=1).sum(axis=1)
+        return bool(distances.min() <= self.max_distance)
+
+    def consider(self, roi_gray) -> bool:
+        """
+        Score a crop and record it if it is worth keeping.
+
+        Args:
+            roi_gray: Grayscale face region of any size
+
+        Returns:
+            bool: True if the crop should be saved
+        """
+        if self.done:
+            return False
+        if min(roi_gray.shape[:2]) < self.min_size:
+            self.rejected["small"] += 1
+            return False
+        if sharpness(roi_gray) < self.min_sharpness:
+            self.rejected["blurred"] += 1
+            return False
+
+        hash_bytes = np.frombuffer(dhash(roi_gray).to_bytes(8, "big"), dtype=np.uint8)
+        if self._is_duplicate(hash_bytes):
+            self.rejected["duplicate"] += 1
+            self._duplicates_in_a_row += 1
+            return False
+
+        self._hashes[self.accepted] = hash_bytes
+        self.accepted += 1
+        self._retract_duplicates, self._duplicates_in_a_row = self._duplicates_in_a_row, 0
+        return True
+
+    def retract(self):
+        """
+        Undo the last crop consider() accepted, e.g. because it was not saved.
+
+        It no longer counts towards min_samples and max_samples, and its
+        hash no longer rejects similar crops as duplicates.
+        """
+        if self.accepted:
+            self.accepted -= 1
+            self._duplicates_in_a_row = self._retract_duplicates
+
+    @property
+    def done(self) -> bool:
+        """True once the capture has enough diverse samples."""
+        if self.accepted >= self.max_samples:
+            return True
+        return self.accepted >= self.min_samples and self._duplicates_in_a_row >= self.patience
@@ -0,0 +1,241 @@
+import cv2
+from typing import Callable, List, Optional, Sequence, Tuple
+from model_registry import load_cascade
+
+
+Box = Tuple[int, int, int, int]
+
+CASCADE_PATH = './data/haarcascade_frontalface_default.xml'
+
+
+def _overlap(a: Box, b: Box) -> float:
+    """Intersection over the smaller box's area."""
+    ix = max(0, min(a[0] + a[2], b[0] + b[2]) - max(a[0], b[0]))
+    iy = max(0, min(a[1] + a[3], b[1] + b[3]) - max(a[1], b[1]))
+    return ix * iy / float(min(a[2] * a[3], b[2] * b[3]) or 1)
+
+
+class FaceDetector:
+    """
+    Haar cascade face detection at a configurable working resolution.
+
+    Frames wider than detect_width are downscaled before detectMultiScale,
+    min/max face sizes bound the image pyramid, and when the previous
+    frame's faces are known only a window around each of them is searched
+    (with a full-frame scan every full_scan_interval calls to pick up new
+    faces). Boxes are always returned in full-resolution coordinates.
+    """
+
+    def __init__(self, cascade_path: str = CASCADE_PATH, scale_factor: float = 1.3,
+                 min_neighbors: int = 5, detect_width: Optional[int] = None,
+                 min_face_size: Optional[int] = None, max_face_size: Optional[int] = None,
+                 search_margin: Optional[float] = None, full_scan_interval: int = 10):
+        """
+        Initialize the detector.
+
+        Args:
+            cascade_path: Path of the Haar cascade XML file
+            scale_factor: Pyramid scale factor passed to detectMultiScale
+            min_neighbors: minNeighbors passed to detectMultiScale
+            detect_width: Width frames are downscaled to before detection
+                (None detects at native resolution)
+            min_face_size: Smallest face width to look for, in full-resolution pixels
+            max_face_size: Largest face width to look for, in full-resolution pixels
+            search_margin: When set, search only a window this much larger
+                (relative to the box size) around the previous faces
+            full_scan_interval: Scan the whole frame at least every N calls
+                while window search is active
+        """
+        self.cascade_path = cascade_path
+        self.cascade = load_cascade(cascade_path)
+        self.scale_factor = scale_factor
+        self.min_neighbors = min_neighbors
+        self.detect_width = detect_width
+        self.min_face_size = min_face_size
+        self.max_face_size = max_face_size
+        self.search_margin = search_margin
+        self.full_scan_interval = max(1, full_scan_interval)
+        self._calls_since_full_scan = 0
+
+    def empty(self) -> bool:
+        """Return True if the cascade failed to load."""
+        return self.cascade.empty()
+
+    def _detect_scaled(self, gray, scale: float, offset: Tuple[int, int] = (0, 0)) -> List[Box]:
+        if scale != 1.0:
+            gray = cv2.resize(gray, (max(1, int(gray.shape[1] * scale)), max(1, int(gray.shape[0] * scale))),
+                              interpolation=cv2.INTER_AREA)
+        min_size = (0, 0)
+        max_size = (0, 0)
+        if self.min_face_size:
+            side = max(1, int(self.min_face_size * scale))
+            min_size = (side, side)
+        if self.max_face_size:
+            side = max(1, int(self.max_face_size * scale))
+            max_size = (side, side)
+
+        faces = self.cascade.detectMultiScale(gray, scaleFactor=self.scale_factor,
+                                              minNeighbors=self.min_neighbors,
+                                              minSize=min_size, maxSize=max_size)
+        ox, oy = offset
+        return [(ox + int(round(x / scale)), oy + int(round(y / scale)),
+                 int(round(w / scale)), int(round(h / scale))) for (x, y, w, h) in faces]
+
+    def _scale_for(self, width: int) -> float:
+        if self.detect_width and width > self.detect_width:
+            return self.detect_width / float(width)
+        return 1.0
+
+    def detect(self, gray, previous: Optional[Sequence[Box]] = None) -> List[Box]:
+        """
+        Detect faces in a frame.
+
+        Args:
+            gray: Grayscale frame (3-channel frames are converted)
+            previous: Face boxes from the previous frame, used for window search
+
+        Returns:
+            List of (x, y, w, h) boxes in full-resolution coordinates
+        """
+        if gray.ndim == 3:
+            gray = cv2.cvtColor(gray, cv2.COLOR_BGR2GRAY)
+        frame_h, frame_w = gray.shape[:2]
+        scale = self._scale_for(frame_w)
+
+        self._calls_since_full_scan += 1
+        if (self.search_margin is None or not previous
+                or self._calls_since_full_scan >= self.full_scan_interval):
+            self._calls_since_full_scan = 0
+            return self._detect_scaled(gray, scale)
+
+        faces: List[Box] = []
+        for (x, y, w, h) in previous:
+            mx, my = int(w * self.search_margin), int(h * self.search_margin)
+            x0, y0 = max(0, x - mx), max(0, y - my)
+            x1, y1 = min(frame_w, x + w + mx), min(frame_h, y + h + my)
+            for box in self._detect_scaled(gray[y0:y1, x0:x1], scale, (x0, y0)):
+                if all(_overlap(box, other) < 0.5 for other in faces):
+                    faces.append(box)
+        return faces
+
+
+class FaceTracker:
+    """
+    Detect-then-track face localisation.
+
+    The (expensive) detector runs every detect_interval frames. In between,
+    each face is followed by normalized template matching on a downscaled
+    patch of the grayscale frame, refined by a few pixels at full resolution,
+    which costs a tiny fraction of a full cascade pass. Templates are taken
+    at detection time so tracks do not drift. A new detection is forced as
+    soon as any track's match score drops below min_score.
+    """
+
+    def __init__(self, detect: Callable[[object], List[Box]], detect_interval: int = 5,
+                 min_score: float = 0.6, search_margin: float = 0.3, template_width: int = 32):
+        """
+        Initialize the tracker.
+
+        Args:
+            detect: Function returning face boxes for a grayscale frame
+            detect_interval: Run the detector at least every N frames
+            min_score: Minimum template match score before re-detecting
+            search_margin: Search window margin around a box, relative to its size
+            template_width: Width in pixels templates are downscaled to
+        """
+        self.detect = detect
+        self.detect_interval = max(1, detect_interval)
+        self.min_score = min_score
+        self.search_margin = search_margin
+        self.template_width = template_width
+
+        self.boxes: List[Box] = []
+        self.scores: List[float] = []
+        self._templates = []
+        self._frames_since_detect = 0
+        self.detections = 0
+
+    def reset(self):
+        """Forget every track so the next frame runs the detector."""
+        self.boxes = []
+        self.scores = []
+        self._templates = []
+
+    def _scale(self, w: int) -> float:
+        return min(1.0, self.template_width / float(w))
+
+    def _make_template(self, gray, box: Box):
+        x, y, w, h = box
+        scale = self._scale(w)
+        patch = gray[y:y + h, x:x + w].copy()
+        small = cv2.resize(patch, (max(1, int(w * scale)), max(1, int(h * scale))),
+                           interpolation=cv2.INTER_AREA)
+        return small, patch
+
+    def _redetect(self, gray) -> List[Box]:
+        self.boxes = [tuple(int(v) for v in box) for box in self.detect(gray)]
+        self.scores = [1.0] * len(self.boxes)
+        self._templates = [self._make_template(gray, box) for box in self.boxes]
+        self._frames_since_detect = 0
+        self.detections += 1
+        return self.boxes
+
+    def _track(self, gray, box: Box, template):
+        small_template, full_template = template
+        x, y, w, h = box
+        frame_h, frame_w = gray.shape[:2]
+        mx, my = int(w * self.search_margin), int(h * self.search_margin)
+        x0, y0 = max(0, x - mx), max(0, y - my)
+        x1, y1 = min(frame_w, x + w + mx), min(frame_h, y + h + my)
+
+        scale = self._scale(w)
+        window = cv2.resize(gray[y0:y1, x0:x1],
+                            (max(1, int((x1 - x0) * scale)), max(1, int((y1 - y0) * scale))),
+                            interpolation=cv2.INTER_AREA)
+        if window.shape[0] < small_template.shape[0] or window.shape[1] < small_template.shape[1]:
+            return None, 0.0
+
+        result = cv2.matchTemplate(window, small_template, cv2.TM_CCOEFF_NORMED)
+        _, score, _, (tx, ty) = cv2.minMaxLoc(result)
+        coarse_x = x0 + int(round(tx / scale))
+        coarse_y = y0 + int(round(ty / scale))
+
+        # Refine within the coarse quantisation step at full resolution
+        r = int(round(1.0 / scale)) + 1
+        rx0, ry0 = max(0, coarse_x - r), max(0, coarse_y - r)
+        rx1, ry1 = min(frame_w, coarse_x + w + r), min(frame_h, coarse_y + h + r)
+        if rx1 - rx0 >= w and ry1 - ry0 >= h:
+            result = cv2.matchTemplate(gray[ry0:ry1, rx0:rx1], full_template, cv2.TM_CCOEFF_NORMED)
+            _, score, _, (tx, ty) = cv2.minMaxLoc(result)
+            coarse_x, coarse_y = rx0 + tx, ry0 + ty
+
+        new_x = min(max(0, coarse_x), frame_w - w)
+        new_y = min(max(0, coarse_y), frame_h - h)
+        return (new_x, new_y, w, h), score
+
+    def update(self, gray) -> List[Box]:
+        """
+        Locate faces in the next grayscale frame.
+
+        Args:
+            gray: Grayscale frame
+
+        Returns:
+            List of (x, y, w, h) face boxes in frame coordinates
+        """
+        self._frames_since_detect += 1
+        if not self.boxes or self._frames_since_detect >= self.detect_interval:
+            return self._redetect(gray)
+
+        boxes, scores = [], []
+        for box, template in zip(self.boxes, self._templates):
+            new_box, score = self._track(gray, box, template)
+            if new_box is None or score < self.min_score:
+                # Tracking confidence dropped: fall back to a full detection
+                return self._redetect(gray)
+            boxes.append(new_box)
+            scores.append(score)
+
+        self.boxes = boxes
+        self.scores = scores
+        return boxes
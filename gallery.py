@@ -0,0 +1,425 @@
+import json
+import os
+import tempfile
+import numpy as np
+from typing import Dict, List, Optional, Tuple
+from face_dataset import FACE_SIZE, normalize_face
+from lbp import NumpyLBPHRecognizer, calibrated_threshold, create_recognizer, model_extension
+from lbph_model import BINARY_EXTENSION, binary_path, write_sidecar
+from model_registry import lbph_nbytes, load_lbph, model_cache, read_lbph
+
+
+GALLERY_MODEL_PATH = './data/classifiers/gallery_classifier.xml'
+GALLERY_LABELS_PATH = './data/classifiers/gallery_labels.json'
+FACES_EXTENSION = ".faces"
+# Loading replays the log, so save() folds it into a new model generation
+# once it holds this many faces
+COMPACT_RECORDS = 500
+# One enrolled face in the append-only log: label, then the normalized crop
+FACE_RECORD = np.dtype([("label", "<i4"), ("face", "u1", (FACE_SIZE[1], FACE_SIZE[0]))])
+
+
+def read_faces(path: str, count: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Read the first count records of an enrolled faces log.
+
+    Args:
+        path: Log written by FaceGallery.save()
+        count: Number of committed records (later ones are ignored)
+
+    Returns:
+        Tuple of (faces of shape (count, height, width), int32 labels)
+    """
+    if not count:
+        return np.empty((0,) + FACE_RECORD["face"].shape, dtype=np.uint8), np.empty(0, dtype=np.int32)
+    records = np.fromfile(path, dtype=FACE_RECORD, count=count)
+    if len(records) < count:
+        raise ValueError(f"Enrolled faces log {path} has {len(records)} of {count} records")
+    return np.ascontiguousarray(records["face"]), records["label"].astype(np.int32)
+
+
+def _read_manifest(labels_path: str) -> Dict:
+    with open(labels_path, "r") as f:
+        return json.load(f)
+
+
+def _read_gallery(labels_path: str):
+    # Cache loader: the model a manifest names plus the faces enrolled since
+    manifest = _read_manifest(labels_path)
+    directory = os.path.dirname(labels_path)
+    recognizer = read_lbph(os.path.join(directory, manifest["model"]))
+    faces, labels = read_faces(os.path.join(directory, manifest["log"]), manifest["log_records"])
+    if len(labels):
+        recognizer.update(list(faces), labels)
+    return recognizer, manifest
+
+
+class FaceGallery:
+    """
+    A shared multi-identity LBPH gallery.
+
+    All enrolled users live in one recognizer with integer labels mapped to
+    names, so answering "who is this?" costs a single predict per face no
+    matter how many users are enrolled.
+
+    On disk the gallery is a model, an append-only log of the faces enrolled
+    since the model was written, and a JSON manifest. The manifest is the
+    single commit point: it names the model and the number of committed log
+    records, maps labels to names and lists the samples included per user.
+    enroll() only appends the new faces to the log and rewrites the small
+    manifest, so its cost does not depend on the gallery size; train()
+    writes a new model generation (<stem>.<generation><ext>) and starts an
+    empty log. Once the log holds compact_records faces, save() also
+    compacts it into a new generation. A crash before the manifest is
+    replaced leaves the previous gallery intact, including which samples it
+    holds.
+    """
+
+    def __init__(self, model_path: Optional[str] = None,
+                 labels_path: Optional[str] = None,
+                 confidence_threshold: Optional[int] = None, engine: str = "opencv",
+                 compact_records: int = COMPACT_RECORDS):
+        """
+        Initialize the gallery.
+
+        Args:
+            model_path: Base path of the LBPH model files (default: the
+                gallery model of the engine)
+            labels_path: Path of the JSON manifest (default: the gallery
+                manifest of the engine)
+            confidence_threshold: Minimum confidence level for a positive match
+                (default: the model's, see lbp.calibrated_threshold)
+            engine: Recognizer backend, "opencv", "numpy" or "pca" (see lbp.py)
+            compact_records: Log size, in faces, at which save() writes a new
+                model generation (0 never compacts)
+        """
+        if model_path is None:
+            model_path = os.path.splitext(GALLERY_MODEL_PATH)[0] + model_extension(engine)
+        if labels_path is None:
+            # Each engine's model includes the samples it was enrolled with
+            labels_path = GALLERY_LABELS_PATH
+            if engine != "opencv":
+                labels_path = os.path.splitext(GALLERY_LABELS_PATH)[0] + f"_{engine}.json"
+        self.engine = engine
+        self.model_path = model_path
+        self.labels_path = labels_path
+        self.confidence_threshold = confidence_threshold
+        self.compact_records = compact_records
+        self.recognizer = None
+        self.labels: Dict[int, str] = {}
+        self.samples: Dict[str, List[str]] = {}
+        self.generation = 0
+        self._model_file: Optional[str] = None
+        self._log_file: Optional[str] = None
+        self._log_records = 0
+        self._pending: List[Tuple[int, np.ndarray]] = []
+        self._rewrite = False
+        self._shared = False
+
+    @property
+    def names(self) -> List[str]:
+        """Names of all enrolled identities, ordered by label."""
+        return [self.labels[label] for label in sorted(self.labels)]
+
+    @property
+    def threshold(self) -> Optional[int]:
+        """Confidence threshold of a positive match: the caller's, else the model's."""
+        return calibrated_threshold(self.recognizer, self.confidence_threshold)
+
+    def label_for(self, name: str) -> Optional[int]:
+        """Return the integer label of an enrolled name, or None."""
+        for label, label_name in self.labels.items():
+            if label_name == name:
+                return label
+        return None
+
+    def _apply_manifest(self, manifest: Dict):
+        directory = os.path.dirname(self.labels_path)
+        self.labels = {int(label): name for label, name in manifest["labels"].items()}
+        self.samples = manifest.get("samples", {})
+        self.generation = manifest.get("generation", 0)
+        # Manifests written before the log existed name neither file
+        self._model_file = os.path.join(directory, manifest["model"]) if "model" in manifest else self.model_path
+        self._log_file = (os.path.join(directory, manifest["log"]) if "log" in manifest
+                          else self._model_file + FACES_EXTENSION)
+        self._log_records = manifest.get("log_records", 0)
+        self._pending = []
+        self._rewrite = False
+
+    def read_manifest(self) -> bool:
+        """
+        Load the label map and the included samples, but not the recognizer.
+
+        This is all enroll() and save() need to append samples.
+
+        Returns:
+            bool: True if the manifest was loaded, False otherwise
+        """
+        if not os.path.exists(self.labels_path):
+            print(f"Error: Gallery labels not found at {self.labels_path}")
+            return False
+        self._apply_manifest(_read_manifest(self.labels_path))
+        return True
+
+    def load(self, shared: bool = True) -> bool:
+        """
+        Load the recognizer and its label map from disk.
+
+        Args:
+            shared: Reuse the process-wide cached recognizer. Pass False
+                to get a private copy that enroll() keeps up to date.
+
+        Returns:
+            bool: True if the gallery was loaded, False otherwise
+        """
+        if not self.read_manifest():
+            return False
+        if not os.path.exists(self._model_file):
+            print(f"Error: Gallery model not found at {self._model_file}")
+            return False
+
+        if not self._log_records:
+            self.recognizer = load_lbph(self._model_file) if shared else read_lbph(self._model_file)
+        else:
+            # The manifest a recognizer was built from travels with it, so the
+            # label map always matches the samples it holds
+            if shared:
+                self.recognizer, manifest = model_cache.get(self.labels_path, _read_gallery,
+                                                            lambda entry: lbph_nbytes(entry[0]))
+            else:
+                self.recognizer, manifest = _read_gallery(self.labels_path)
+            self._apply_manifest(manifest)
+        self._shared = shared
+        if self.threshold is None:
+            print(f"Error: Gallery model {self._model_file} has no calibrated confidence threshold; "
+                  "retrain it or give one (--confidence-threshold)")
+            return False
+        return True
+
+    def train(self, samples: Dict[str, Dict[str, np.ndarray]]):
+        """
+        Train the gallery from scratch.
+
+        save() then writes a new model generation instead of appending.
+
+        Args:
+            samples: Mapping of user name to {sample id: grayscale face image}
+        """
+        faces = []
+        ids = []
+        self.labels = {}
+        self.samples = {}
+        for label, name in enumerate(sorted(samples)):
+            self.labels[label] = name
+            self.samples[name] = list(samples[name])
+            faces.extend(samples[name].values())
+            ids.extend([label] * len(samples[name]))
+
+        self.recognizer = create_recognizer(self.engine)
+        self.recognizer.train(faces, np.array(ids))
+        self._shared = False
+        self._pending = []
+        self._rewrite = True
+
+    def enroll(self, name: str, samples: Dict[str, np.ndarray]) -> int:
+        """
+        Append a new identity or new samples of a known one.
+
+        Samples already listed in the manifest are skipped, so the cost only
+        depends on how many new samples are given, not on the gallery size.
+        The samples are kept for save(), and a private recognizer (see
+        load()) is updated with them; a shared one is released instead, as
+        it must not be modified, and the next load() includes them.
+
+        The "pca" engine cannot enroll: its projection is learned from all
+        users by train(), and new users would be encoded on axes fitted
+        without them. Retrain it instead (create_classifier.enroll_user
+        does).
+
+        Args:
+            name: Name of the user to enroll
+            samples: Mapping of sample id to grayscale face image
+
+        Returns:
+            int: Number of samples added to the gallery
+        """
+        if self.engine == "pca":
+            print("Error: pca galleries are retrained with every user (see create_classifier.train_gallery)")
+            return 0
+        included = set(self.samples.get(name, []))
+        new_ids = [sample_id for sample_id in samples if sample_id not in included]
+        if not new_ids:
+            return 0
+
+        label = self.label_for(name)
+        if label is None:
+            label = max(self.labels, default=-1) + 1
+            self.labels[label] = name
+
+        faces = [normalize_face(samples[sample_id]) for sample_id in new_ids]
+        labels = np.array([label] * len(faces))
+        if self._shared:
+            self.recognizer, self._shared = None, False
+        if self.recognizer is None and self._model_file is None:
+            # First samples of a new gallery: save() writes its first model
+            self.recognizer = create_recognizer(self.engine)
+        if self.recognizer is not None:
+            self.recognizer.update(faces, labels)
+        self._pending.extend(zip(labels.tolist(), faces))
+        self.samples.setdefault(name, []).extend(new_ids)
+        return len(new_ids)
+
+    def _write_model(self) -> List[str]:
+        # Writes the generation after the committed one (which this gallery
+        # need not have loaded); returns the files it supersedes
+        retired = []
+        generation = 0
+        if os.path.exists(self.labels_path):
+            committed = FaceGallery(self.model_path, self.labels_path, engine=self.engine)
+            committed._apply_manifest(_read_manifest(self.labels_path))
+            generation = committed.generation
+            retired = [committed._model_file, committed._log_file]
+            if self.engine == "opencv":
+                retired.append(binary_path(committed._model_file))
+        stem, extension = os.path.splitext(self.model_path)
+        if self.engine == "opencv" and isinstance(self.recognizer, NumpyLBPHRecognizer):
+            # A compacted OpenCV gallery loaded from its binary copy, which
+            # cannot be written back as XML (and predicts the same)
+            extension = BINARY_EXTENSION
+        generation += 1
+        model_file = f"{stem}.{generation}{extension}"
+        self.recognizer.write(model_file)
+        if self.engine == "opencv" and extension != BINARY_EXTENSION:
+            # Binary copy that loads without parsing the XML (see lbph_model.py)
+            write_sidecar(self.recognizer, model_file)
+        self.generation, self._model_file = generation, model_file
+        self._log_file, self._log_records = model_file + FACES_EXTENSION, 0
+        return retired
+
+    def _append_faces(self):
+        records = np.empty(len(self._pending), dtype=FACE_RECORD)
+        records["label"] = [label for label, _ in self._pending]
+        records["face"] = np.stack([face for _, face in self._pending])
+        committed = self._log_records * FACE_RECORD.itemsize
+        with open(self._log_file, "r+b" if os.path.exists(self._log_file) else "wb") as f:
+            # Drop the records of an earlier save that crashed before its commit
+            f.truncate(committed)
+            f.seek(committed)
+            f.write(records.tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+        self._log_records += len(records)
+
+    def _write_manifest(self):
+        directory = os.path.dirname(self.labels_path) or "."
+        fd, tmp_labels = tempfile.mkstemp(suffix=".json", dir=directory)
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump({
+                    "labels": {str(label): name for label, name in self.labels.items()},
+                    "samples": self.samples,
+                    "generation": self.generation,
+                    "model": os.path.relpath(self._model_file, directory),
+                    "log": os.path.relpath(self._log_file, directory),
+                    "log_records": self._log_records,
+                }, f)
+            os.replace(tmp_labels, self.labels_path)
+        finally:
+            if os.path.exists(tmp_labels):
+                os.remove(tmp_labels)
+
+    def save(self):
+        """
+        Commit the gallery to disk.
+
+        After train() (or for a new gallery) a new model generation is
+        written; otherwise the faces enrolled since the last save are
+        appended to the log. Either way the manifest is replaced last and
+        atomically, which commits the change, and only then are files of
+        the previous generation removed.
+        """
+        if not self._rewrite and self._model_file is not None and not self._pending:
+            return
+        os.makedirs(os.path.dirname(self.model_path) or ".", exist_ok=True)
+        os.makedirs(os.path.dirname(self.labels_path) or ".", exist_ok=True)
+
+        retired = []
+        if self._rewrite or self._model_file is None:
+            retired = self._write_model()
+        else:
+            self._append_faces()
+        self._write_manifest()
+        self._pending = []
+        self._rewrite = False
+        self._retire(retired)
+
+        if self.compact_records and self._log_records >= self.compact_records:
+            self.compact()
+
+    def compact(self):
+        """
+        Fold the committed faces log into a new model generation.
+
+        The model is rebuilt from the files the manifest names, so this
+        works whether or not the gallery was loaded. Unsaved changes are
+        saved first. Like train(), the new generation is committed by
+        replacing the manifest.
+        """
+        if self._pending or self._rewrite:
+            self.save()
+        if not os.path.exists(self.labels_path) or not _read_manifest(self.labels_path).get("log_records"):
+            return
+        recognizer, manifest = _read_gallery(self.labels_path)
+        self._apply_manifest(manifest)
+        self.recognizer, self._shared = recognizer, False
+        retired = self._write_model()
+        self._write_manifest()
+        self._retire(retired)
+
+    def _retire(self, paths: List[str]):
+        # Only called once the manifest no longer names these files
+        for path in paths:
+            model_cache.invalidate(path)
+            if os.path.exists(path):
+                os.remove(path)
+
+    def identify(self, roi_gray) -> Tuple[Optional[str], int]:
+        """
+        Identify a face against every enrolled user with a single predict.
+
+        Args:
+            roi_gray: Grayscale face region
+
+        Returns:
+            Tuple of (name or None if unknown, confidence percentage)
+        """
+        label, distance = self.recognizer.predict(normalize_face(roi_gray))
+        return self._match(label, distance)
+
+    def identify_many(self, rois) -> List[Tuple[Optional[str], int]]:
+        """
+        Identify every face of a frame.
+
+        With the NumPy engine all faces are scored against the gallery in one
+        batch; the OpenCV engine predicts them one by one.
+
+        Args:
+            rois: Grayscale face regions
+
+        Returns:
+            One (name or None if unknown, confidence percentage) per ROI
+        """
+        if len(rois) == 0:
+            return []
+        faces = [normalize_face(roi) for roi in rois]
+        if hasattr(self.recognizer, "predict_batch"):
+            labels, distances = self.recognizer.predict_batch(faces)
+            return [self._match(int(label), distance) for label, distance in zip(labels, distances)]
+        return [self._match(*self.recognizer.predict(face)) for face in faces]
+
+    def _match(self, label: int, distance: float) -> Tuple[Optional[str], int]:
+        confidence_percentage = 100 - int(distance)
+        threshold = self.threshold
+        if threshold is not None and confidence_percentage > threshold:
+            return self.labels.get(label), confidence_percentage
+        return None, confidence_percentage
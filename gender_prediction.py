@@ -1,13 +1,10 @@
 import cv2
-from mtcnn.mtcnn import MTCNN
-from keras.models import load_model
-from keras_preprocessing.image import img_to_array
 import numpy as np
-import threading
+from video_source import FrameGrabber, FrameRateGovernor
+from face_detection import FaceDetector
+from model_registry import registry
 
 # Initialize models and variables
-detector = MTCNN()
-
 emotion_model = "./data/_mini_XCEPTION.106-0.65.hdf5"
 ageProto = "./data/age_deploy.prototxt"
 ageModel = "./data/age_net.caffemodel"
@@ -19,51 +16,153 @@ ageList = ['(0-2)', '(4-6)', '(8-12)', '(15-20)', '(25-32)', '(38-43)', '(48-53)
 genderList = ['Male', 'Female']
 Emotions = ["angry", "disgust", "scared", "happy", "sad", "surprised", "neutral"]
 
-# Load models
-face_cascade = cv2.CascadeClassifier('./data/haarcascade_frontalface_default.xml')
-emotion_classifier = load_model(emotion_model, compile=False)
-ageNet = cv2.dnn.readNet(ageModel, ageProto)
-genderNet = cv2.dnn.readNet(genderModel, genderProto)
+# Models are loaded on first use (or warmed in the background) so that
+# importing this module, e.g. from the GUI, stays cheap.
+def _load_emotion_classifier():
+    # Keras/TensorFlow is only imported when emotion detection is needed
+    from keras.models import load_model
+    return load_model(emotion_model, compile=False)
+
+registry.register('face_detector', lambda: FaceDetector('./data/haarcascade_frontalface_default.xml', scale_factor=1.3, min_neighbors=5))
+registry.register('emotion_classifier', _load_emotion_classifier)
+registry.register('ageNet', lambda: cv2.dnn.readNet(ageModel, ageProto))
+registry.register('genderNet', lambda: cv2.dnn.readNet(genderModel, genderProto))
+
+# OpenCV loads these without holding the GIL, so a background load does not
+# stall a GUI; importing Keras/TensorFlow for the emotion model would
+OPENCV_MODEL_NAMES = ['face_detector', 'ageNet', 'genderNet']
+MODEL_NAMES = OPENCV_MODEL_NAMES + ['emotion_classifier']
+
+
+def warm_up_models(names=None):
+    """Load models on a background thread (default: every model)."""
+    return registry.warm_up(MODEL_NAMES if names is None else names)
+
+
+def predict_age_gender(rois, age=True, gender=True):
+    """
+    Predict age and gender for every face of a frame in one batch.
+
+    All ROIs go into a single blob, so each network runs one forward pass per
+    frame instead of one per face.
+
+    Args:
+        rois: List of face regions (3-channel images)
+        age: Run the age network
+        gender: Run the gender network
+
+    Returns:
+        List of (gender, gender probability, age, age probability) per ROI,
+        with None/0.0 for a network that was not run
+    """
+    if len(rois) == 0:
+        return []
+
+    blob = cv2.dnn.blobFromImages(rois, 1.0, (227, 227), MODEL_MEAN_VALUES, swapRB=False)
+
+    genderPreds = [None] * len(rois)
+    agePreds = [None] * len(rois)
+    if gender:
+        genderNet = registry.get('genderNet')
+        genderNet.setInput(blob)
+        genderPreds = genderNet.forward()
+    if age:
+        ageNet = registry.get('ageNet')
+        ageNet.setInput(blob)
+        agePreds = ageNet.forward()
+
+    results = []
+    for genderProbs, ageProbs in zip(genderPreds, agePreds):
+        result = (None, 0.0, None, 0.0)
+        if genderProbs is not None:
+            g = genderProbs.argmax()
+            result = (genderList[g], float(genderProbs[g])) + result[2:]
+        if ageProbs is not None:
+            a = ageProbs.argmax()
+            result = result[:2] + (ageList[a], float(ageProbs[a]))
+        results.append(result)
+    return results
+
+
+def predict_emotions(gray_rois):
+    """
+    Classify the emotion of every face of a frame in one batch.
+
+    The ROIs are stacked into a single (N, 48, 48, 1) tensor and run through
+    the model's direct call, which skips the per-call setup of predict().
 
-def ageAndgender():
+    Args:
+        gray_rois: List of grayscale face regions
+
+    Returns:
+        List of (label, probability, probabilities of every emotion) per ROI
+    """
+    if len(gray_rois) == 0:
+        return []
+    emotion_classifier = registry.get('emotion_classifier')
+
+    batch = np.empty((len(gray_rois), 48, 48, 1), dtype=np.float32)
+    for i, roi in enumerate(gray_rois):
+        batch[i, :, :, 0] = cv2.resize(roi, (48, 48))
+    batch /= 255.0
+
+    preds = np.asarray(emotion_classifier(batch, training=False))
+    return [(Emotions[p.argmax()], float(p.max()), p) for p in preds]
+
+def ageAndgender(headless=False, max_fps=None, on_result=None):
+    # headless: skip all drawing and windows, pacing with max_fps instead of waitKey
+    # on_result: called with the faces of every frame; returning False stops the loop
+    governor = FrameRateGovernor(max_fps)
     # Create a new capture for this function
-    cap = cv2.VideoCapture(0)
+    cap = FrameGrabber(0)
     if not cap.isOpened():
         print("Error: Could not open camera")
         return
 
     try:
+        face_detector = registry.get('face_detector')
+        
         while True:
             ret, img = cap.read()
             if not ret:
                 print("Error: Could not read frame")
                 break
 
-            default_img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-            faces = face_cascade.detectMultiScale(image=default_img, scaleFactor=1.3, minNeighbors=5)
+            # Detect on grayscale; only the face crops are converted to RGB for the networks
+            gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+            faces = face_detector.detect(gray)
             
+            boxes = []
+            rois = []
             for (x, y, w, h) in faces:
-                roi = default_img[y:y + h, x:x + w]
-                if roi.size == 0:
-                    continue
-                    
-                try:
-                    blob = cv2.dnn.blobFromImage(roi, 1.0, (227, 227), MODEL_MEAN_VALUES, swapRB=False)
-                    
-                    genderNet.setInput(blob)
-                    genderPreds = genderNet.forward()
-                    gender = genderList[genderPreds[0].argmax()]
-                    
-                    ageNet.setInput(blob)
-                    agePreds = ageNet.forward()
-                    age = ageList[agePreds[0].argmax()]
-                    
-                    cv2.rectangle(img, (x, y), (x + w, y + h), (255, 0, 0), 2)
-                    label = f"{gender}, {age}"
-                    cv2.putText(img, label, (x, y - 5), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 0, 255))
-                except Exception as e:
-                    print(f"Error processing face: {e}")
+                if w == 0 or h == 0:
                     continue
+                roi = cv2.cvtColor(img[y:y + h, x:x + w], cv2.COLOR_BGR2RGB)
+                boxes.append((x, y, w, h))
+                rois.append(roi)
+            
+            try:
+                # One forward pass per network for all faces in the frame
+                predictions = predict_age_gender(rois)
+            except Exception as e:
+                print(f"Error processing faces: {e}")
+                predictions = []
+            
+            if on_result is not None:
+                results = [{"box": tuple(int(v) for v in box), "gender": gender, "gender_probability": gender_probability,
+                            "age": age, "age_probability": age_probability}
+                           for box, (gender, gender_probability, age, age_probability) in zip(boxes, predictions)]
+                if on_result(results) is False:
+                    break
+
+            if headless:
+                governor.wait()
+                continue
+
+            for (x, y, w, h), (gender, _, age, _) in zip(boxes, predictions):
+                cv2.rectangle(img, (x, y), (x + w, y + h), (255, 0, 0), 2)
+                label = f"{gender}, {age}"
+                cv2.putText(img, label, (x, y - 5), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 0, 255))
 
             cv2.imshow("Gender and Age Prediction", img)
             key = cv2.waitKey(1) & 0xFF
@@ -73,16 +172,22 @@ def ageAndgender():
         print(f"Error in age and gender detection: {e}")
     finally:
         cap.release()
-        cv2.destroyAllWindows()
+        if not headless:
+            cv2.destroyAllWindows()
 
-def emotion():
+def emotion(headless=False, max_fps=None, on_result=None):
+    # headless: skip all drawing and windows, pacing with max_fps instead of waitKey
+    # on_result: called with the faces of every frame; returning False stops the loop
+    governor = FrameRateGovernor(max_fps)
     # Create a new capture for this function
-    cap = cv2.VideoCapture(0)
+    cap = FrameGrabber(0)
     if not cap.isOpened():
         print("Error: Could not open camera")
         return
 
     try:
+        face_detector = registry.get('face_detector')
+        
         while True:
             ret, img = cap.read()
             if not ret:
@@ -90,25 +195,29 @@ def emotion():
                 break
 
             gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-            faces = face_cascade.detectMultiScale(image=gray, scaleFactor=1.3, minNeighbors=5)
+            faces = face_detector.detect(gray)
 
-            for (x, y, w, h) in faces:
-                try:
-                    roi = gray[y:y + h, x:x + w]
-                    roi = cv2.resize(roi, (48, 48))
-                    roi = roi.astype("float") / 255.0
-                    roi = img_to_array(roi)
-                    roi = np.expand_dims(roi, axis=0)
-                    
-                    preds = emotion_classifier.predict(roi)[0]
-                    emotion_probability = np.max(preds)
-                    label = Emotions[preds.argmax()]
-                    
-                    cv2.rectangle(img, (x, y), (x + w, y + h), (0, 255, 0), 2)
-                    cv2.putText(img, label, (x, y - 5), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 255, 0))
-                except Exception as e:
-                    print(f"Error processing face: {e}")
-                    continue
+            try:
+                # One classifier call for all faces in the frame
+                predictions = predict_emotions([gray[y:y + h, x:x + w] for (x, y, w, h) in faces])
+            except Exception as e:
+                print(f"Error processing faces: {e}")
+                predictions = []
+            
+            if on_result is not None:
+                results = [{"box": tuple(int(v) for v in box), "emotion": label,
+                            "emotion_probability": emotion_probability}
+                           for box, (label, emotion_probability, _) in zip(faces, predictions)]
+                if on_result(results) is False:
+                    break
+
+            if headless:
+                governor.wait()
+                continue
+
+            for (x, y, w, h), (label, emotion_probability, _) in zip(faces, predictions):
+                cv2.rectangle(img, (x, y), (x + w, y + h), (0, 255, 0), 2)
+                cv2.putText(img, label, (x, y - 5), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 255, 0))
 
             cv2.imshow("Emotion Detection", img)
             key = cv2.waitKey(1) & 0xFF
@@ -118,4 +227,5 @@ def emotion():
         print(f"Error in emotion detection: {e}")
     finally:
         cap.release()
-        cv2.destroyAllWindows() 
\ No newline at end of file
+        if not headless:
+            cv2.destroyAllWindows() 
\ No newline at end of file
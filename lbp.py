@@ -0,0 +1,371 @@
+import numpy as np
+from typing import List, Optional, Sequence, Tuple
+from ann_index import IVFIndex
+
+ENGINES = ("opencv", "numpy", "pca")
+MODEL_EXTENSIONS = {"opencv": ".xml", "numpy": ".npz", "pca": ".pca"}
+# Galleries at least this large get an IVF index at training time
+ANN_MIN_SAMPLES = 5000
+# Minimum confidence (100 - distance) of a match on the chi-square scale of
+# the LBPH engines; "pca" models store their own (see calibrated_threshold)
+DEFAULT_CONFIDENCE_THRESHOLD = 50
+
+
+def model_extension(engine: str) -> str:
+    """Return the model file extension of a recognizer engine."""
+    if engine not in MODEL_EXTENSIONS:
+        raise ValueError(f"Unknown recognizer engine: {engine}")
+    return MODEL_EXTENSIONS[engine]
+
+
+def calibrated_threshold(recognizer, confidence_threshold: Optional[int] = None) -> Optional[int]:
+    """
+    Return the confidence threshold to accept matches of a recognizer with.
+
+    The engines measure distances on different scales. The LBPH engines
+    share OpenCV's, for which DEFAULT_CONFIDENCE_THRESHOLD holds; a "pca"
+    model stores the threshold calibrated when it was trained.
+
+    Args:
+        recognizer: Recognizer the matches come from
+        confidence_threshold: Threshold given by the caller, which overrides
+            the model's
+
+    Returns:
+        The threshold, or None for a model that has none (a "pca" model
+        trained on a single user or before thresholds were stored)
+    """
+    if confidence_threshold is not None:
+        return confidence_threshold
+    return getattr(recognizer, "confidence_threshold", DEFAULT_CONFIDENCE_THRESHOLD)
+
+
+def create_recognizer(engine: str = "opencv"):
+    """
+    Create an untrained LBPH recognizer.
+
+    Args:
+        engine: "opencv" for cv2.face.LBPHFaceRecognizer, "numpy" for
+            NumpyLBPHRecognizer, "pca" for the int8 descriptors of
+            quantized_lbp.QuantizedLBPRecognizer
+
+    Returns:
+        Recognizer with the cv2.face interface (train, update, predict,
+        read, write)
+    """
+    if engine == "opencv":
+        import cv2
+        return cv2.face.LBPHFaceRecognizer_create()
+    if engine == "numpy":
+        return NumpyLBPHRecognizer()
+    if engine == "pca":
+        from quantized_lbp import QuantizedLBPRecognizer
+        return QuantizedLBPRecognizer()
+    raise ValueError(f"Unknown recognizer engine: {engine}")
+
+
+def _uniform_lut() -> np.ndarray:
+    # Codes with at most two 0/1 transitions (circularly) get their own bin,
+    # every other code shares the last one: 58 + 1 = 59 bins for 8 neighbors
+    lut = np.full(256, 58, dtype=np.int64)
+    next_bin = 0
+    for code in range(256):
+        rotated = ((code << 1) | (code >> 7)) & 0xFF
+        if bin(code ^ rotated).count("1") <= 2:
+            lut[code] = next_bin
+            next_bin += 1
+    return lut
+
+
+UNIFORM_LUT = _uniform_lut()
+
+
+def lbp_images(faces: np.ndarray) -> np.ndarray:
+    """
+    Compute circular LBP(8, 1) codes of a batch of faces.
+
+    The eight neighbours are sampled on a circle of radius 1 with bilinear
+    interpolation exactly like OpenCV's LBPH (elbp), so the codes are
+    identical to cv2.face.LBPHFaceRecognizer's.
+
+    Args:
+        faces: uint8 array of shape (N, H, W)
+
+    Returns:
+        uint8 array of shape (N, H - 2, W - 2)
+    """
+    src = faces.astype(np.float32)
+    n, h, w = src.shape
+    center = src[:, 1:h - 1, 1:w - 1]
+    codes = np.zeros(center.shape, dtype=np.uint8)
+    eps = np.finfo(np.float32).eps
+
+    def shifted(dy, dx):
+        return src[:, 1 + dy:h - 1 + dy, 1 + dx:w - 1 + dx]
+
+    for neighbor in range(8):
+        x = np.float32(np.cos(2.0 * np.pi * neighbor / 8.0))
+        y = np.float32(-np.sin(2.0 * np.pi * neighbor / 8.0))
+        fx, fy = int(np.floor(x)), int(np.floor(y))
+        cx, cy = int(np.ceil(x)), int(np.ceil(y))
+        tx, ty = x - fx, y - fy
+        w1, w2 = (1 - tx) * (1 - ty), tx * (1 - ty)
+        w3, w4 = (1 - tx) * ty, tx * ty
+        t = w1 * shifted(fy, fx) + w2 * shifted(fy, cx) + w3 * shifted(cy, fx) + w4 * shifted(cy, cx)
+        codes |= (((t > center) | (np.abs(t - center) < eps)).astype(np.uint8) << neighbor)
+    return codes
+
+
+def spatial_histograms(faces: np.ndarray, grid_x: int = 8, grid_y: int = 8,
+                       uniform: bool = True) -> np.ndarray:
+    """
+    Compute LBP spatial histograms of a batch of faces with one bincount.
+
+    Every face is divided into grid_x * grid_y cells (pixels beyond the last
+    full cell are ignored, like OpenCV) and every cell histogram is
+    normalized to sum to 1.
+
+    Args:
+        faces: uint8 array of shape (N, H, W)
+        grid_x: Number of cells horizontally
+        grid_y: Number of cells vertically
+        uniform: Map the 256 codes to the 59 uniform-pattern bins; False
+            keeps all 256 bins like OpenCV's LBPH
+
+    Returns:
+        float32 array of shape (N, grid_x * grid_y * bins)
+    """
+    codes = lbp_images(faces)
+    n, h, w = codes.shape
+    cell_h, cell_w = h // grid_y, w // grid_x
+    codes = codes[:, :cell_h * grid_y, :cell_w * grid_x]
+    bins = 59 if uniform else 256
+    patterns = UNIFORM_LUT[codes] if uniform else codes.astype(np.int64)
+
+    rows = np.arange(cell_h * grid_y) // cell_h
+    cols = np.arange(cell_w * grid_x) // cell_w
+    cells = rows[:, None] * grid_x + cols[None, :]
+    index = (np.arange(n)[:, None, None] * (grid_x * grid_y) + cells) * bins + patterns
+    counts = np.bincount(index.ravel(), minlength=n * grid_x * grid_y * bins)
+    return (counts.reshape(n, -1) / np.float32(cell_h * cell_w)).astype(np.float32)
+
+
+def chi_square(queries: np.ndarray, candidates: np.ndarray) -> np.ndarray:
+    """
+    Chi-square distance as used by OpenCV's LBPH predict().
+
+    HISTCMP_CHISQR_ALT: 2 * sum((q - g)^2 / (q + g)) over the last axis,
+    with NumPy broadcasting between queries and candidates.
+
+    Args:
+        queries: Histograms, e.g. of shape (Q, 1, D)
+        candidates: Histograms, e.g. of shape (Q, K, D)
+
+    Returns:
+        Distances with the broadcast shape minus the last axis
+    """
+    diff = queries - candidates
+    total = queries + candidates
+    ratio = np.divide(diff * diff, total, out=np.zeros(total.shape, dtype=np.float32), where=total > 0)
+    return 2 * ratio.sum(axis=-1)
+
+
+class NumpyLBPHRecognizer:
+    """
+    An LBPH face recognizer implemented with vectorized NumPy.
+
+    Drop-in replacement for cv2.face.LBPHFaceRecognizer (train, update,
+    predict, read, write, getHistograms, getLabels). The gallery is one
+    contiguous (samples, features) matrix. predict_batch() scores every face
+    of a frame against all of it with a single matrix product of square-root
+    histograms (the Bhattacharyya coefficient, a close relative of the
+    chi-square distance) and then re-ranks the best `rerank` candidates per
+    face with the exact chi-square distance LBPH uses.
+
+    By default histograms have OpenCV's 256 bins, so predictions, distances
+    and the confidence threshold match the "opencv" engine exactly.
+    uniform=True uses the 59 uniform-pattern bins instead, which makes them
+    4x smaller but is slightly less accurate, and merging the rare
+    non-uniform codes into one bin lowers distances, so the confidence
+    threshold has to be re-calibrated.
+
+    Galleries of at least index_min_samples samples get an IVFIndex over the
+    square-root histograms when trained, which replaces the full matrix
+    product with a search of the n_probe closest clusters. The index is
+    extended by update() and saved in the same .npz file.
+    """
+
+    def __init__(self, grid_x: int = 8, grid_y: int = 8, uniform: bool = False,
+                 threshold: float = float("inf"), rerank: int = 10,
+                 index_min_samples: int = ANN_MIN_SAMPLES, n_probe: int = 8):
+        """
+        Initialize the recognizer.
+
+        Args:
+            grid_x: Number of histogram cells horizontally
+            grid_y: Number of histogram cells vertically
+            uniform: Use uniform-pattern (59-bin) instead of 256-bin histograms
+            threshold: Distance above which predict() returns label -1
+            rerank: Candidates per face re-scored with the exact chi-square
+                distance (0 scores the whole gallery exactly)
+            index_min_samples: Gallery size from which train() builds an IVF
+                index (0 never builds one)
+            n_probe: Clusters searched per face by the IVF index; higher is
+                slower but finds the exact nearest candidates more often
+        """
+        self.grid_x = grid_x
+        self.grid_y = grid_y
+        self.uniform = uniform
+        self.threshold = threshold
+        self.rerank = rerank
+        self.index_min_samples = index_min_samples
+        self.n_probe = n_probe
+        self.histograms = np.empty((0, 0), dtype=np.float32)
+        self.labels = np.empty(0, dtype=np.int32)
+        self.index: Optional[IVFIndex] = None
+        self._sqrt_histograms = self.histograms
+
+    def _set_gallery(self, histograms: np.ndarray, labels: np.ndarray, index: Optional[IVFIndex] = None):
+        self.histograms = np.ascontiguousarray(histograms, dtype=np.float32)
+        self.labels = labels
+        self.index = index
+        if index is None and 0 < self.index_min_samples <= len(labels):
+            self.build_index()
+        # The index keeps its own copy of the vectors it searches
+        self._sqrt_histograms = None if self.index is not None else np.sqrt(self.histograms)
+
+    def build_index(self, n_lists: Optional[int] = None, n_probe: Optional[int] = None):
+        """
+        Build the IVF index over the current gallery.
+
+        Args:
+            n_lists: Number of clusters (default: about 4 * sqrt(samples))
+            n_probe: Clusters searched per face (default: self.n_probe)
+        """
+        if n_probe is not None:
+            self.n_probe = n_probe
+        vectors = np.sqrt(self.histograms)
+        self.index = IVFIndex(n_lists or IVFIndex.suggested_lists(len(vectors)), self.n_probe)
+        self.index.train(vectors)
+        self.index.add(vectors, np.arange(len(vectors)))
+        self._sqrt_histograms = None
+
+    @staticmethod
+    def _stack(faces) -> np.ndarray:
+        if isinstance(faces, np.ndarray) and faces.ndim == 3:
+            return faces
+        return np.stack([np.asarray(face, dtype=np.uint8) for face in faces])
+
+    def compute(self, faces) -> np.ndarray:
+        """Compute the histograms of equally sized grayscale faces."""
+        return spatial_histograms(self._stack(faces), self.grid_x, self.grid_y, self.uniform)
+
+    def train(self, faces: Sequence[np.ndarray], labels):
+        """Replace the gallery with the given faces and labels."""
+        self._set_gallery(self.compute(faces), np.asarray(labels, dtype=np.int32).ravel())
+
+    def update(self, faces: Sequence[np.ndarray], labels):
+        """Append faces and labels to the gallery."""
+        if not len(self.labels):
+            self.train(faces, labels)
+            return
+        histograms = self.compute(faces)
+        if self.index is not None:
+            self.index.add(np.sqrt(histograms), np.arange(len(self.labels), len(self.labels) + len(histograms)))
+        self._set_gallery(np.vstack([self.histograms, histograms]),
+                          np.concatenate([self.labels, np.asarray(labels, dtype=np.int32).ravel()]),
+                          self.index)
+
+    def predict_batch(self, faces) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Find the nearest gallery sample of every face.
+
+        Args:
+            faces: Equally sized grayscale faces, as a list or (N, H, W) array
+
+        Returns:
+            Tuple of (labels, distances) arrays; the label is -1 where the
+            distance exceeds the threshold
+        """
+        if not len(self.labels):
+            raise ValueError("The recognizer has not been trained")
+        queries = self.compute(faces)
+        count = len(self.labels)
+        everything = np.arange(count)
+        if self.index is not None and 0 < self.rerank < count:
+            candidates, _ = self.index.search(np.sqrt(queries), self.rerank, self.n_probe)
+            # Probed clusters smaller than rerank leave -1 slots: repeat the best
+            candidates = np.where(candidates < 0, candidates[:, :1], candidates)
+            # Faces whose probed clusters were all empty are scored against the whole gallery
+            missing = np.flatnonzero(candidates[:, 0] < 0)
+            nearest, best_distances = self._nearest(queries, candidates)
+            if len(missing):
+                nearest[missing], best_distances[missing] = self._nearest(
+                    queries[missing], np.broadcast_to(everything, (len(missing), count)))
+        else:
+            if 0 < self.rerank < count:
+                # One matrix product scores every face against the whole gallery
+                similarity = np.sqrt(queries) @ self._sqrt_histograms.T
+                candidates = np.argpartition(-similarity, self.rerank - 1, axis=1)[:, :self.rerank]
+            else:
+                candidates = np.broadcast_to(everything, (len(queries), count))
+            nearest, best_distances = self._nearest(queries, candidates)
+        labels = np.where(best_distances <= self.threshold, self.labels[nearest], -1)
+        return labels, best_distances
+
+    def _nearest(self, queries: np.ndarray, candidates: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        # Exact chi-square re-ranking of every face's candidate samples
+        distances = np.empty(candidates.shape, dtype=np.float32)
+        # Bound the (faces, candidates, features) temporaries to ~16M floats
+        block = max(1, (1 << 24) // max(1, candidates.shape[1] * queries.shape[1]))
+        for start in range(0, len(queries), block):
+            stop = start + block
+            distances[start:stop] = chi_square(queries[start:stop, None, :],
+                                               self.histograms[candidates[start:stop]])
+
+        best = distances.argmin(axis=1)
+        rows = np.arange(len(queries))
+        return candidates[rows, best], distances[rows, best].astype(np.float64)
+
+    def predict(self, face) -> Tuple[int, float]:
+        """Return (label, distance) of the nearest gallery sample of one face."""
+        labels, distances = self.predict_batch(np.asarray(face, dtype=np.uint8)[None])
+        return int(labels[0]), float(distances[0])
+
+    def getHistograms(self) -> List[np.ndarray]:
+        return list(self.histograms)
+
+    def getLabels(self) -> np.ndarray:
+        return self.labels.reshape(-1, 1)
+
+    def write(self, path: str):
+        """
+        Save the gallery, and its IVF index if any, as an uncompressed .npz file.
+
+        Paths ending in .lbph are written in the compact binary format of
+        lbph_model.py instead (float16 histograms, no index).
+        """
+        if path.endswith(".lbph"):
+            from lbph_model import write_binary
+            write_binary(self, path)
+            return
+        index = self.index.state() if self.index is not None else {}
+        with open(path, "wb") as f:
+            np.savez(f, histograms=self.histograms, labels=self.labels,
+                     params=np.array([self.grid_x, self.grid_y, int(self.uniform)]),
+                     threshold=np.array(self.threshold), **index)
+
+    def read(self, path: str):
+        """Load a gallery saved by write()."""
+        if path.endswith(".lbph"):
+            from lbph_model import read_binary
+            read_binary(path, self)
+            return
+        with np.load(path) as data:
+            self.grid_x, self.grid_y, uniform = (int(v) for v in data["params"])
+            self.uniform = bool(uniform)
+            self.threshold = float(data["threshold"])
+            index = IVFIndex.from_state(data) if "ivf_centroids" in data else None
+            if index is not None:
+                self.n_probe = index.n_probe
+            self._set_gallery(data["histograms"], data["labels"].astype(np.int32), index)
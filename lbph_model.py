@@ -0,0 +1,211 @@
+import argparse
+import os
+import struct
+import time
+import numpy as np
+from lbp import NumpyLBPHRecognizer
+
+BINARY_EXTENSION = ".lbph"
+MAGIC = b"LBPH"
+FORMAT_VERSION = 1
+# magic, version, histogram dtype code, grid_x, grid_y, uniform, count, dim, threshold
+HEADER = struct.Struct("<4sHHHHB3xQQd")
+HEADER_SIZE = 64
+ALIGNMENT = 64
+HISTOGRAM_DTYPES = {1: np.dtype("<f2")}
+LABEL_DTYPE = np.dtype("<i4")
+
+
+def binary_path(path: str) -> str:
+    """Return the binary model path next to a model file (e.g. an OpenCV XML)."""
+    return os.path.splitext(path)[0] + BINARY_EXTENSION
+
+
+def _histogram_offset(count: int) -> int:
+    # Histograms start on an aligned boundary after the labels
+    end = HEADER_SIZE + count * LABEL_DTYPE.itemsize
+    return (end + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+def write_binary(recognizer: NumpyLBPHRecognizer, path: str):
+    """
+    Save an LBPH gallery in the compact binary format.
+
+    Layout: a 64-byte little-endian header (magic, version, histogram dtype,
+    grid size, uniform flag, sample count, histogram length, threshold),
+    the int32 labels, then the float16 histograms as one (count, dim) matrix
+    starting on a 64-byte boundary. Float16 keeps about three significant
+    digits, which changes chi-square distances by well under 0.1%.
+
+    An IVF index is not stored; use the .npz format to keep one.
+
+    Args:
+        recognizer: Trained NumpyLBPHRecognizer
+        path: Output file path, conventionally ending in .lbph
+    """
+    histograms = np.ascontiguousarray(recognizer.histograms, dtype=HISTOGRAM_DTYPES[1])
+    labels = np.ascontiguousarray(recognizer.labels, dtype=LABEL_DTYPE)
+    count, dim = histograms.shape
+    header = HEADER.pack(MAGIC, FORMAT_VERSION, 1, recognizer.grid_x, recognizer.grid_y,
+                         int(recognizer.uniform), count, dim, recognizer.threshold)
+    offset = _histogram_offset(count)
+    with open(path, "wb") as f:
+        f.write(header.ljust(HEADER_SIZE, b"\0"))
+        f.write(labels.tobytes())
+        f.write(b"\0" * (offset - f.tell()))
+        f.write(histograms.tobytes())
+
+
+def read_binary(path: str, recognizer: NumpyLBPHRecognizer = None) -> NumpyLBPHRecognizer:
+    """
+    Load a gallery saved by write_binary().
+
+    The file is memory-mapped and read in a single pass, so there is no text
+    to parse. The histograms are copied out of the mapping into float32
+    (matching needs float32 and their square roots), so the loaded gallery
+    takes about four times the file size in memory and the file is not kept
+    open.
+
+    Like OpenCV, the loaded recognizer scores the whole gallery with the
+    exact chi-square distance: no IVF index is built, however large it is,
+    and there is no square-root prefilter (rerank=0). Set rerank or call
+    build_index() to trade exactness for speed.
+
+    Args:
+        path: Binary model path
+        recognizer: Recognizer to load into (default: a new one)
+
+    Returns:
+        The loaded recognizer
+    """
+    with open(path, "rb") as f:
+        header = f.read(HEADER_SIZE)
+    if len(header) < HEADER.size or header[:4] != MAGIC:
+        raise ValueError(f"Not a binary LBPH model: {path}")
+    _, version, dtype_code, grid_x, grid_y, uniform, count, dim, threshold = HEADER.unpack_from(header)
+    if version > FORMAT_VERSION or dtype_code not in HISTOGRAM_DTYPES:
+        raise ValueError(f"Unsupported binary LBPH model version {version} (dtype {dtype_code}): {path}")
+
+    recognizer = recognizer or NumpyLBPHRecognizer()
+    recognizer.index_min_samples = 0
+    recognizer.rerank = 0
+    recognizer.grid_x, recognizer.grid_y = grid_x, grid_y
+    recognizer.uniform = bool(uniform)
+    recognizer.threshold = threshold
+    if count == 0:
+        recognizer._set_gallery(np.empty((0, dim), dtype=np.float32), np.empty(0, dtype=np.int32))
+        return recognizer
+    labels = np.memmap(path, dtype=LABEL_DTYPE, mode="r", offset=HEADER_SIZE, shape=(count,))
+    histograms = np.memmap(path, dtype=HISTOGRAM_DTYPES[dtype_code], mode="r",
+                           offset=_histogram_offset(count), shape=(count, dim))
+    recognizer._set_gallery(histograms, np.array(labels, dtype=np.int32))
+    return recognizer
+
+
+def from_opencv(recognizer) -> NumpyLBPHRecognizer:
+    """
+    Copy a trained cv2.face.LBPHFaceRecognizer into a NumpyLBPHRecognizer.
+
+    The copy keeps OpenCV's 256-bin histograms (uniform=False) and scores
+    every sample with the exact chi-square distance (no IVF index, no
+    prefilter), so it predicts the same labels and distances as the
+    original.
+    """
+    if recognizer.getRadius() != 1 or recognizer.getNeighbors() != 8:
+        raise ValueError("Only LBPH models with radius 1 and 8 neighbors can be converted")
+    histograms = recognizer.getHistograms()
+    numpy_recognizer = NumpyLBPHRecognizer(recognizer.getGridX(), recognizer.getGridY(), uniform=False,
+                                           threshold=recognizer.getThreshold(), rerank=0,
+                                           index_min_samples=0)
+    numpy_recognizer._set_gallery(np.vstack(histograms) if histograms else np.empty((0, 0)),
+                                  recognizer.getLabels().ravel().astype(np.int32))
+    return numpy_recognizer
+
+
+def write_sidecar(recognizer, model_path: str) -> str:
+    """
+    Save a binary copy of an OpenCV LBPH model next to its XML file.
+
+    load_lbph() loads the copy instead of parsing the XML for as long as it
+    is at least as new as the XML. The copy is written to a temporary file
+    and moved into place, so a crash never leaves a truncated one behind.
+
+    Args:
+        recognizer: Trained cv2.face.LBPHFaceRecognizer
+        model_path: Path the XML model was written to
+
+    Returns:
+        The binary model path
+    """
+    path = binary_path(model_path)
+    tmp_path = path + ".tmp"
+    try:
+        write_binary(from_opencv(recognizer), tmp_path)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return path
+
+
+def convert_xml(xml_path: str, output_path: str = None) -> str:
+    """
+    Convert an OpenCV LBPH XML model to the binary format.
+
+    Args:
+        xml_path: Model written by cv2.face.LBPHFaceRecognizer.write
+        output_path: Binary model path (default: next to the XML, .lbph)
+
+    Returns:
+        The binary model path
+    """
+    import cv2
+    recognizer = cv2.face.LBPHFaceRecognizer_create()
+    recognizer.read(xml_path)
+    output_path = output_path or binary_path(xml_path)
+    write_binary(from_opencv(recognizer), output_path)
+    return output_path
+
+
+def compare_load_times(xml_path: str, runs: int = 5):
+    """
+    Print the load time and size of an XML model and its binary conversion.
+
+    Args:
+        xml_path: OpenCV LBPH XML model
+        runs: Loads timed per format (the best run is reported)
+    """
+    import cv2
+    path = binary_path(xml_path)
+    if not os.path.exists(path) or os.path.getmtime(path) < os.path.getmtime(xml_path):
+        convert_xml(xml_path, path)
+
+    def best_of(load):
+        times = []
+        for _ in range(runs):
+            start = time.perf_counter()
+            load()
+            times.append(time.perf_counter() - start)
+        return min(times) * 1000
+
+    xml_ms = best_of(lambda: cv2.face.LBPHFaceRecognizer_create().read(xml_path))
+    binary_ms = best_of(lambda: read_binary(path))
+    xml_mb = os.path.getsize(xml_path) / 1e6
+    binary_mb = os.path.getsize(path) / 1e6
+    print(f"{os.path.basename(xml_path)}")
+    print(f"  xml    {xml_mb:8.2f} MB {xml_ms:9.1f} ms")
+    print(f"  binary {binary_mb:8.2f} MB {binary_ms:9.1f} ms  ({xml_ms / binary_ms:.0f}x faster, "
+          f"{xml_mb / binary_mb:.0f}x smaller)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert OpenCV LBPH XML models to the binary .lbph format.")
+    parser.add_argument("models", nargs="+", help="XML models, e.g. ./data/classifiers/*_classifier.xml")
+    parser.add_argument("--compare", action="store_true", help="Also compare the load times of both formats")
+    parser.add_argument("--runs", type=int, default=5, help="Loads timed per format with --compare")
+    args = parser.parse_args()
+    for model in args.models:
+        if args.compare:
+            compare_load_times(model, args.runs)
+        else:
+            print(f"{model} -> {convert_xml(model)}")
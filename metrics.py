@@ -0,0 +1,316 @@
+import json
+import os
+import tempfile
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict, deque
+from typing import Dict, Iterable, Optional, Tuple
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+CONFIDENCE_BUCKETS = (0, 10, 20, 30, 40, 50, 60, 70, 80, 90, 100)
+FACE_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+class Histogram:
+    """A fixed-bucket histogram with Prometheus (cumulative, "le") semantics."""
+
+    def __init__(self, buckets: Iterable[float]):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self) -> Dict[str, int]:
+        """Return the cumulative count per upper bound, ending with "+Inf"."""
+        result = {}
+        total = 0
+        for bound, count in zip(self.buckets + ("+Inf",), self.counts):
+            total += count
+            result[str(bound)] = total
+        return result
+
+
+class _StageTimer:
+    # A class rather than @contextmanager: no generator per timed block
+    __slots__ = ("_metrics", "_stage", "_start")
+
+    def __init__(self, metrics, stage):
+        self._metrics = metrics
+        self._stage = stage
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self._metrics.observe("stage_seconds", time.perf_counter() - self._start, stage=self._stage)
+        return False
+
+
+class _NullTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class Metrics:
+    """
+    Hot-path instrumentation: stage timers, counters, histograms and rolling FPS.
+
+    The processing loop reports through stage(), observe(), increment() and
+    frame(). Snapshots are pushed to the sinks from frame() every
+    flush_interval seconds, so no extra thread is needed.
+    """
+
+    enabled = True
+
+    def __init__(self, sinks: Iterable = (), flush_interval: float = 10.0,
+                 fps_window: float = 5.0, prefix: str = "face_recognition",
+                 labels: Optional[Dict[str, str]] = None):
+        """
+        Initialize the metrics.
+
+        Args:
+            sinks: Objects with a write(snapshot, prefix) method
+            flush_interval: Seconds between two pushes to the sinks
+            fps_window: Seconds of frame timestamps used for the rolling FPS
+            prefix: Prefix of every exported metric name
+            labels: Labels added to every exported metric, e.g. the stream
+                of a multi-process pool
+        """
+        self.sinks = list(sinks)
+        self.labels = dict(labels or {})
+        self.flush_interval = flush_interval
+        self.fps_window = fps_window
+        self.prefix = prefix
+        self.counters: Dict[Tuple[str, Labels], float] = defaultdict(float)
+        self.gauges: Dict[Tuple[str, Labels], float] = {}
+        self.histograms: Dict[Tuple[str, Labels], Histogram] = {}
+        self._frame_times = deque()
+        self._next_flush = time.monotonic() + flush_interval
+        self._lock = threading.Lock()
+
+    def stage(self, name: str):
+        """Return a context manager timing a stage of the current frame."""
+        return _StageTimer(self, name)
+
+    def observe(self, name: str, value: float, buckets: Iterable[float] = LATENCY_BUCKETS, **labels):
+        """Add a value to a histogram, creating it with the given buckets."""
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram(buckets)
+            histogram.observe(value)
+
+    def increment(self, name: str, value: float = 1, **labels):
+        """Add to a counter."""
+        with self._lock:
+            self.counters[(name, tuple(sorted(labels.items())))] += value
+
+    def set_gauge(self, name: str, value: float, **labels):
+        """Set a gauge to its current value."""
+        with self._lock:
+            self.gauges[(name, tuple(sorted(labels.items())))] = value
+
+    def confidence(self, value: float):
+        """Record the recognizer confidence of one face."""
+        self.observe("recognition_confidence", value, CONFIDENCE_BUCKETS)
+
+    def frame(self, faces: int = 0, dropped: int = 0):
+        """
+        Close a processed frame.
+
+        Args:
+            faces: Number of faces found in the frame
+            dropped: Frames dropped by the capture since the previous frame
+        """
+        now = time.monotonic()
+        self._frame_times.append(now)
+        while now - self._frame_times[0] > self.fps_window:
+            self._frame_times.popleft()
+
+        self.increment("frames_total")
+        self.increment("dropped_frames_total", dropped)
+        self.observe("faces_per_frame", faces, FACE_COUNT_BUCKETS)
+        self.set_gauge("fps", self.fps)
+        if self.sinks and now >= self._next_flush:
+            self.flush()
+
+    @property
+    def fps(self) -> float:
+        """Frames per second over the last fps_window seconds."""
+        if len(self._frame_times) < 2:
+            return 0.0
+        span = self._frame_times[-1] - self._frame_times[0]
+        return (len(self._frame_times) - 1) / span if span > 0 else 0.0
+
+    def snapshot(self) -> Dict:
+        """Return a copy of every metric as plain data."""
+        def entries(values):
+            return [{"name": name, "labels": dict(self.labels, **dict(labels)), "value": value}
+                    for (name, labels), value in sorted(values.items())]
+
+        with self._lock:
+            return {
+                "timestamp": time.time(),
+                "counters": entries(self.counters),
+                "gauges": entries(self.gauges),
+                "histograms": [{"name": name, "labels": dict(self.labels, **dict(labels)),
+                                "buckets": histogram.cumulative(),
+                                "sum": histogram.sum, "count": histogram.count}
+                               for (name, labels), histogram in sorted(self.histograms.items())],
+            }
+
+    def flush(self):
+        """Push a snapshot to every sink now."""
+        self._next_flush = time.monotonic() + self.flush_interval
+        snapshot = self.snapshot()
+        for sink in self.sinks:
+            try:
+                sink.write(snapshot, self.prefix)
+            except Exception as e:
+                print(f"Error writing metrics: {e}")
+
+
+class NullMetrics:
+    """Metrics that are switched off: every call is a no-op."""
+
+    enabled = False
+    fps = 0.0
+
+    def stage(self, name):
+        return _NULL_TIMER
+
+    def observe(self, name, value, buckets=LATENCY_BUCKETS, **labels):
+        pass
+
+    def increment(self, name, value=1, **labels):
+        pass
+
+    def set_gauge(self, name, value, **labels):
+        pass
+
+    def confidence(self, value):
+        pass
+
+    def frame(self, faces=0, dropped=0):
+        pass
+
+    def flush(self):
+        pass
+
+
+def _write_atomic(path: str, text: str):
+    # Readers (node_exporter, dashboards) never see a half-written file
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w") as f:
+            f.write(text)
+        os.replace(tmp_path, path)
+    except Exception:
+        os.unlink(tmp_path)
+        raise
+
+
+def _format_labels(labels: Dict[str, str], extra: Optional[Tuple[str, str]] = None) -> str:
+    items = list(labels.items()) + ([extra] if extra else [])
+    if not items:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in items) + "}"
+
+
+class PrometheusTextfileSink:
+    """Writes metrics in the Prometheus text format, e.g. for the node_exporter textfile collector."""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def write(self, snapshot: Dict, prefix: str):
+        lines = []
+        for kind, entries in (("counter", snapshot["counters"]), ("gauge", snapshot["gauges"])):
+            typed = set()
+            for entry in entries:
+                name = f"{prefix}_{entry['name']}"
+                if name not in typed:
+                    lines.append(f"# TYPE {name} {kind}")
+                    typed.add(name)
+                lines.append(f"{name}{_format_labels(entry['labels'])} {entry['value']}")
+
+        typed = set()
+        for entry in snapshot["histograms"]:
+            name = f"{prefix}_{entry['name']}"
+            if name not in typed:
+                lines.append(f"# TYPE {name} histogram")
+                typed.add(name)
+            for bound, count in entry["buckets"].items():
+                lines.append(f"{name}_bucket{_format_labels(entry['labels'], ('le', bound))} {count}")
+            lines.append(f"{name}_sum{_format_labels(entry['labels'])} {entry['sum']}")
+            lines.append(f"{name}_count{_format_labels(entry['labels'])} {entry['count']}")
+
+        _write_atomic(self.path, "\n".join(lines) + "\n")
+
+
+class JsonSink:
+    """Dumps the latest metrics snapshot as a JSON file."""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def write(self, snapshot: Dict, prefix: str):
+        _write_atomic(self.path, json.dumps(dict(snapshot, prefix=prefix), indent=2))
+
+
+_default_metrics = None
+
+
+def metrics_from_environment(stream: Optional[str] = None):
+    """
+    Create metrics configured from the environment.
+
+    METRICS_TEXTFILE and/or METRICS_JSON name the files to write and
+    METRICS_INTERVAL the seconds between writes. Without either file
+    instrumentation is disabled.
+
+    Args:
+        stream: Name of one stream of a multi-process pool (see
+            camera_pool.py). Every file then gets it before its extension
+            (metrics.prom -> metrics.north.prom) and every metric a
+            stream="north" label, so the processes do not overwrite each
+            other's files.
+    """
+    def path(variable):
+        root, extension = os.path.splitext(os.environ[variable])
+        return f"{root}.{stream}{extension}" if stream else os.environ[variable]
+
+    sinks = []
+    if os.environ.get("METRICS_TEXTFILE"):
+        sinks.append(PrometheusTextfileSink(path("METRICS_TEXTFILE")))
+    if os.environ.get("METRICS_JSON"):
+        sinks.append(JsonSink(path("METRICS_JSON")))
+    if not sinks:
+        return NullMetrics()
+    return Metrics(sinks, float(os.environ.get("METRICS_INTERVAL", 10)), labels={"stream": stream} if stream else None)
+
+
+def default_metrics():
+    """Return the process-wide metrics, configured from the environment (see metrics_from_environment)."""
+    global _default_metrics
+    if _default_metrics is None:
+        _default_metrics = metrics_from_environment()
+    return _default_metrics
@@ -0,0 +1,247 @@
+import cv2
+import os
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, Iterable, Optional
+
+
+class ModelRegistry:
+    """
+    A registry of models that are only loaded on first use.
+
+    Loaders are registered by name and run at most once, the first time the
+    model is requested (or when warm_up() preloads it on a background
+    thread). Concurrent requests for a model that is still loading wait for
+    that load instead of starting a second one.
+    """
+
+    def __init__(self):
+        self._loaders: Dict[str, Callable[[], object]] = {}
+        self._models: Dict[str, object] = {}
+        self._locks: Dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+
+    def register(self, name: str, loader: Callable[[], object]):
+        """
+        Register a model loader without running it.
+
+        Args:
+            name: Name the model is requested by
+            loader: Function returning the loaded model
+        """
+        with self._lock:
+            self._loaders[name] = loader
+            self._locks.setdefault(name, threading.Lock())
+
+    def is_loaded(self, name: str) -> bool:
+        """Return True if the model has already been loaded."""
+        return name in self._models
+
+    def get(self, name: str):
+        """
+        Return a model, loading it on first use.
+
+        Args:
+            name: Name the model was registered under
+
+        Returns:
+            The loaded model
+        """
+        model = self._models.get(name)
+        if model is not None:
+            return model
+
+        with self._locks[name]:
+            if name not in self._models:
+                self._models[name] = self._loaders[name]()
+            return self._models[name]
+
+    def unload(self, name: str):
+        """Drop a loaded model so the next get() reloads it."""
+        with self._locks[name]:
+            self._models.pop(name, None)
+
+    def warm_up(self, names: Optional[Iterable[str]] = None) -> threading.Thread:
+        """
+        Load models on a background thread.
+
+        Args:
+            names: Models to load (default: every registered model)
+
+        Returns:
+            The started daemon thread
+        """
+        names = list(self._loaders if names is None else names)
+
+        def _load_all():
+            for name in names:
+                try:
+                    self.get(name)
+                except Exception as e:
+                    print(f"Error warming up model {name}: {e}")
+
+        thread = threading.Thread(target=_load_all, daemon=True)
+        thread.start()
+        return thread
+
+
+# Process-wide registry shared by every module
+registry = ModelRegistry()
+
+
+class ModelCache:
+    """
+    A process-wide LRU cache of models loaded from files.
+
+    Entries are keyed by absolute path and validated against the file's
+    mtime and size, so a model rewritten on disk (e.g. by train_classifer)
+    is reloaded automatically. The least recently used entries are evicted
+    once the estimated memory use exceeds max_bytes.
+    """
+
+    def __init__(self, max_bytes: int = 512 * 1024 * 1024):
+        """
+        Initialize the cache.
+
+        Args:
+            max_bytes: Memory budget for cached models, in bytes
+        """
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # path -> (version, model, size)
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    @property
+    def size_bytes(self) -> int:
+        """Estimated memory used by cached models."""
+        return self._bytes
+
+    def get(self, path: str, loader: Callable[[str], object],
+            sizeof: Optional[Callable[[object], int]] = None):
+        """
+        Return the model stored at path, loading it if needed.
+
+        Args:
+            path: Model file path
+            loader: Function loading the model from a path
+            sizeof: Function estimating a model's memory use (default: file size)
+
+        Returns:
+            The cached or freshly loaded model
+        """
+        key = os.path.abspath(path)
+        stat = os.stat(key)
+        version = (stat.st_mtime_ns, stat.st_size)
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == version:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+
+        model = loader(key)
+        size = sizeof(model) if sizeof is not None else stat.st_size
+
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[2]
+            self._entries[key] = (version, model, size)
+            self._bytes += size
+            # Evict least recently used models, always keeping the newest one
+            while self._bytes > self.max_bytes and len(self._entries) > 1:
+                _, (_, _, evicted_size) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+        return model
+
+    def invalidate(self, path: str):
+        """Drop the entry of a path, e.g. right after rewriting the file."""
+        with self._lock:
+            entry = self._entries.pop(os.path.abspath(path), None)
+            if entry is not None:
+                self._bytes -= entry[2]
+
+    def clear(self):
+        """Drop every entry."""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+
+# Process-wide cache shared by every module
+model_cache = ModelCache()
+
+
+def _read_lbph(path: str):
+    # .npz and .lbph models are NumpyLBPHRecognizer galleries, .pca ones
+    # QuantizedLBPRecognizer models, everything else OpenCV XML
+    from lbp import create_recognizer
+    if path.endswith(".pca"):
+        engine = "pca"
+    else:
+        engine = "numpy" if path.endswith((".npz", ".lbph")) else "opencv"
+    recognizer = create_recognizer(engine)
+    recognizer.read(path)
+    return recognizer
+
+
+def lbph_nbytes(recognizer) -> int:
+    """Return the size of an LBPH recognizer's histograms, for model_cache budgets."""
+    return sum(hist.nbytes for hist in recognizer.getHistograms())
+
+
+def load_cascade(path: str):
+    """Return a shared Haar cascade, parsing the XML only once per version."""
+    return model_cache.get(path, cv2.CascadeClassifier)
+
+
+def _binary_copy(path: str) -> Optional[str]:
+    # The .lbph copy of an XML model (see lbph_model.write_sidecar), if it is
+    # at least as new as the XML
+    if not path.endswith(".xml"):
+        return None
+    fast_path = os.path.splitext(path)[0] + ".lbph"
+    if os.path.exists(fast_path) and os.path.getmtime(fast_path) >= os.path.getmtime(path):
+        return fast_path
+    return None
+
+
+def load_lbph(path: str):
+    """
+    Return a shared LBPH recognizer, parsing the file only once per version.
+
+    OpenCV XML models, NumpyLBPHRecognizer .npz and .lbph models and
+    QuantizedLBPRecognizer .pca models are supported. An XML model with a
+    binary .lbph copy at least as new as itself (see
+    lbph_model.write_sidecar) is loaded from the copy, which skips parsing
+    the XML.
+
+    The returned recognizer is shared: do not train() or update() it.
+    """
+    fast_path = _binary_copy(path)
+    if fast_path is not None:
+        try:
+            return model_cache.get(fast_path, _read_lbph, lbph_nbytes)
+        except Exception as e:
+            print(f"Error loading {fast_path}, falling back to the XML model: {e}")
+    return model_cache.get(path, _read_lbph, lbph_nbytes)
+
+
+def read_lbph(path: str):
+    """
+    Load a private LBPH recognizer, e.g. one that is going to be updated.
+
+    Same formats and binary copies as load_lbph(), but the recognizer is
+    neither cached nor shared.
+    """
+    fast_path = _binary_copy(path)
+    if fast_path is not None:
+        try:
+            return _read_lbph(fast_path)
+        except Exception as e:
+            print(f"Error loading {fast_path}, falling back to the XML model: {e}")
+    return _read_lbph(path)
@@ -0,0 +1,286 @@
+import argparse
+import cv2
+from typing import Callable, Dict, List, Optional
+from face_detection import FaceDetector
+from gallery import FaceGallery
+from gender_prediction import predict_age_gender, predict_emotions
+from video_source import FrameGrabber, FrameRateGovernor
+from metrics import JsonSink, Metrics, PrometheusTextfileSink, default_metrics
+
+
+class FaceHead:
+    """
+    Base class of an analysis head.
+
+    A head receives every face of a frame at once and returns one result
+    dict per face. Heads never capture, convert or detect on their own.
+    """
+
+    name = "head"
+
+    def process(self, frame, gray, boxes) -> List[Dict]:
+        """
+        Analyse the faces of one frame.
+
+        Args:
+            frame: Original BGR frame
+            gray: Grayscale version of the frame
+            boxes: List of (x, y, w, h) face boxes
+
+        Returns:
+            One result dict per box
+        """
+        raise NotImplementedError
+
+    def label(self, result: Dict) -> str:
+        """Short text drawn next to a face for this head's result."""
+        return ""
+
+
+class IdentityHead(FaceHead):
+    """Identifies faces against the shared gallery of enrolled users."""
+
+    name = "identity"
+
+    def __init__(self, gallery: Optional[FaceGallery] = None, engine: str = "opencv",
+                 confidence_threshold: Optional[int] = None):
+        self.gallery = gallery
+        if self.gallery is None:
+            self.gallery = FaceGallery(confidence_threshold=confidence_threshold, engine=engine)
+            if not self.gallery.load():
+                raise RuntimeError("Gallery could not be loaded")
+
+    def process(self, frame, gray, boxes) -> List[Dict]:
+        matches = self.gallery.identify_many([gray[y:y + h, x:x + w] for (x, y, w, h) in boxes])
+        return [{"identity": identity, "confidence": confidence} for identity, confidence in matches]
+
+    def label(self, result: Dict) -> str:
+        return (result.get("identity") or "Unknown").upper()
+
+
+class EmotionHead(FaceHead):
+    """Classifies the emotion of every face in one batched model call."""
+
+    name = "emotion"
+
+    def process(self, frame, gray, boxes) -> List[Dict]:
+        predictions = predict_emotions([gray[y:y + h, x:x + w] for (x, y, w, h) in boxes])
+        return [{"emotion": label, "emotion_probability": probability}
+                for label, probability, _ in predictions]
+
+    def label(self, result: Dict) -> str:
+        return result.get("emotion", "")
+
+
+class AgeGenderHead(FaceHead):
+    """Predicts age and/or gender of every face with one forward per network."""
+
+    name = "age_gender"
+
+    def __init__(self, age: bool = True, gender: bool = True):
+        self.age = age
+        self.gender = gender
+
+    def process(self, frame, gray, boxes) -> List[Dict]:
+        # The networks were always fed RGB crops; only the ROIs are converted
+        rois = [cv2.cvtColor(frame[y:y + h, x:x + w], cv2.COLOR_BGR2RGB) for (x, y, w, h) in boxes]
+        results = []
+        for gender, gender_probability, age, age_probability in predict_age_gender(rois, self.age, self.gender):
+            result = {}
+            if self.gender:
+                result.update(gender=gender, gender_probability=gender_probability)
+            if self.age:
+                result.update(age=age, age_probability=age_probability)
+            results.append(result)
+        return results
+
+    def label(self, result: Dict) -> str:
+        return ", ".join(result[key] for key in ("gender", "age") if result.get(key))
+
+
+class AnalysisPipeline:
+    """
+    Single-pass face analysis shared by any combination of heads.
+
+    Each frame is captured once, converted to grayscale once and searched
+    for faces once; the face boxes are then fanned out to every enabled
+    head. Running identity, emotion, age and gender together therefore
+    costs one detection plus the heads, instead of one loop per feature.
+    """
+
+    def __init__(self, heads: List[FaceHead], detector: Optional[FaceDetector] = None,
+                 metrics: Optional[Metrics] = None):
+        """
+        Initialize the pipeline.
+
+        Args:
+            heads: Enabled analysis heads
+            detector: Face detector (default: full-resolution Haar cascade)
+            metrics: Metrics to report stage timings to, one stage per head
+                (default: the process-wide metrics, disabled unless configured)
+        """
+        self.heads = heads
+        self.detector = detector or FaceDetector()
+        self.metrics = metrics if metrics is not None else default_metrics()
+        self._last_faces = []
+
+    def process_frame(self, frame) -> List[Dict]:
+        """
+        Detect and analyse every face of a frame.
+
+        Args:
+            frame: BGR frame
+
+        Returns:
+            One dict per face with its "box" and the results of every head
+        """
+        with self.metrics.stage("convert"):
+            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        with self.metrics.stage("detect"):
+            boxes = [tuple(int(v) for v in box) for box in self.detector.detect(gray, previous=self._last_faces)]
+        self._last_faces = boxes
+
+        faces = [{"box": box} for box in boxes]
+        if not boxes:
+            return faces
+        for head in self.heads:
+            try:
+                with self.metrics.stage(head.name):
+                    head_results = head.process(frame, gray, boxes)
+                for face, result in zip(faces, head_results):
+                    face.update(result)
+            except Exception as e:
+                self.metrics.increment("head_errors_total", head=head.name)
+                print(f"Error in {head.name} head: {e}")
+        if self.metrics.enabled:
+            for face in faces:
+                if "confidence" in face:
+                    self.metrics.confidence(face["confidence"])
+        return faces
+
+    def annotate(self, frame, faces: List[Dict]):
+        """Draw every face box with the labels of all heads."""
+        for face in faces:
+            x, y, w, h = face["box"]
+            text = " | ".join(label for label in (head.label(face) for head in self.heads) if label)
+            cv2.rectangle(frame, (x, y), (x + w, y + h), (0, 255, 0), 2)
+            cv2.putText(frame, text, (x, y - 5), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 0))
+        return frame
+
+    def run(self, source=0, on_result: Optional[Callable[[List[Dict]], None]] = None,
+            headless: bool = False, max_fps: Optional[float] = None):
+        """
+        Run the pipeline on a live source until 'q' or ESC is pressed.
+
+        Args:
+            source: Camera index, video file or stream URL
+            on_result: Called with the face results of every frame;
+                returning False stops the loop
+            headless: Skip all drawing and windows
+            max_fps: Frame-rate cap used instead of waitKey() pacing when headless
+        """
+        governor = FrameRateGovernor(max_fps)
+        # Live cameras always serve the freshest frame; files keep every frame
+        cap = FrameGrabber(source, drop_oldest=isinstance(source, int))
+        if not cap.isOpened():
+            print("Error: Could not open camera")
+            return
+
+        dropped = 0
+        try:
+            while True:
+                with self.metrics.stage("capture"):
+                    ret, frame = cap.read()
+                if not ret:
+                    print("Error: Could not read frame")
+                    break
+
+                faces = self.process_frame(frame)
+                self.metrics.frame(len(faces), cap.dropped - dropped)
+                dropped = cap.dropped
+                if on_result is not None and on_result(faces) is False:
+                    break
+
+                if headless:
+                    governor.wait()
+                    continue
+
+                with self.metrics.stage("display"):
+                    cv2.imshow("Face Analysis", self.annotate(frame, faces))
+                    key = cv2.waitKey(1) & 0xFF
+                if key == ord("q") or key == 27:
+                    break
+        except KeyboardInterrupt:
+            print("\nAnalysis interrupted by user")
+        finally:
+            cap.release()
+            if not headless:
+                cv2.destroyAllWindows()
+            self.metrics.flush()
+
+
+def build_pipeline(identity: bool = True, emotion: bool = True, age: bool = True,
+                   gender: bool = True, detector: Optional[FaceDetector] = None,
+                   metrics: Optional[Metrics] = None, engine: str = "opencv",
+                   confidence_threshold: Optional[int] = None) -> AnalysisPipeline:
+    """
+    Build a pipeline with the requested heads enabled.
+
+    Args:
+        identity: Identify faces against the gallery
+        emotion: Classify emotions
+        age: Predict age
+        gender: Predict gender
+        detector: Face detector shared by all heads
+        metrics: Metrics to report to
+        engine: Recognizer backend of the gallery, "opencv", "numpy" or "pca"
+        confidence_threshold: Minimum confidence of a gallery match
+            (default: the model's, see lbp.calibrated_threshold)
+
+    Returns:
+        AnalysisPipeline
+    """
+    heads: List[FaceHead] = []
+    if identity:
+        heads.append(IdentityHead(engine=engine, confidence_threshold=confidence_threshold))
+    if emotion:
+        heads.append(EmotionHead())
+    if age or gender:
+        heads.append(AgeGenderHead(age=age, gender=gender))
+    return AnalysisPipeline(heads, detector, metrics)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run several face analyses on one camera stream.")
+    parser.add_argument("--source", default="0", help="Camera index, video file or stream URL")
+    parser.add_argument("--no-identity", action="store_true", help="Disable gallery identification")
+    parser.add_argument("--no-emotion", action="store_true", help="Disable emotion detection")
+    parser.add_argument("--no-age", action="store_true", help="Disable age prediction")
+    parser.add_argument("--no-gender", action="store_true", help="Disable gender prediction")
+    parser.add_argument("--engine", choices=["opencv", "numpy", "pca"], default="opencv", help="Gallery recognizer backend")
+    parser.add_argument("--confidence-threshold", type=int,
+                        help="Minimum confidence of a gallery match (default: the model's calibrated one)")
+    parser.add_argument("--headless", action="store_true", help="Print results as JSON lines instead of showing a window")
+    parser.add_argument("--max-fps", type=float, help="Frame-rate cap in headless mode")
+    parser.add_argument("--metrics-textfile", help="Write Prometheus metrics to this file")
+    parser.add_argument("--metrics-json", help="Write metrics as JSON to this file")
+    parser.add_argument("--metrics-interval", type=float, default=10.0, help="Seconds between metrics writes")
+    args = parser.parse_args()
+
+    sinks = []
+    if args.metrics_textfile:
+        sinks.append(PrometheusTextfileSink(args.metrics_textfile))
+    if args.metrics_json:
+        sinks.append(JsonSink(args.metrics_json))
+    metrics = Metrics(sinks, args.metrics_interval) if sinks else None
+
+    source = int(args.source) if args.source.isdigit() else args.source
+    pipeline = build_pipeline(identity=not args.no_identity, emotion=not args.no_emotion,
+                              age=not args.no_age, gender=not args.no_gender, metrics=metrics,
+                              engine=args.engine, confidence_threshold=args.confidence_threshold)
+    if args.headless:
+        import json
+        pipeline.run(source, on_result=lambda faces: print(json.dumps(faces, default=str), flush=True),
+                     headless=True, max_fps=args.max_fps)
+    else:
+        pipeline.run(source)
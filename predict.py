@@ -1,23 +1,38 @@
+import argparse
+import csv
+import json
+import os
+import sys
 import cv2
-def predict(name, sample):
-    face_cascade = cv2.CascadeClassifier('./data/haarcascade_frontalface_default.xml')
-    recognizer = cv2.face.LBPHFaceRecognizer_create()
-    recognizer.read(f"./data/classifiers/{name}_classifier.xml")
-    cap = cv2.VideoCapture(sample)
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Tuple
+from face_dataset import normalize_face
+from video_source import FrameGrabber
+from face_detection import FaceDetector
+from gallery import FaceGallery
+from lbp import calibrated_threshold, model_extension
+from model_registry import load_lbph
+def predict(name, sample, engine="opencv"):
+    face_detector = FaceDetector('./data/haarcascade_frontalface_default.xml', 1.3, 5)
+    recognizer = load_lbph(f"./data/classifiers/{name}_classifier{model_extension(engine)}")
+    # Recorded sample: keep every frame, decoding ahead on the grabber thread
+    cap = FrameGrabber(sample, buffer_size=8, drop_oldest=False)
     pred = False
     
     while True:
         ret, frame = cap.read()
+        if not ret:
+            break
             #default_img = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
         gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-        faces = face_cascade.detectMultiScale(gray,1.3,5)
+        faces = face_detector.detect(gray)
 
         for (x,y,w,h) in faces:
 
 
             roi_gray = gray[y:y+h,x:x+w]
 
-            id,confidence = recognizer.predict(roi_gray)
+            id,confidence = recognizer.predict(normalize_face(roi_gray))
             confidence = 100 - int(confidence)
             if confidence > 50:
                 #if u want to print confidence level
@@ -41,7 +56,185 @@ def predict(name, sample):
         if cv2.waitKey(20) & 0xFF == ord('q'):
             break
         
-        cap.release()
-        cv2.destroyAllWindows()
+    cap.release()
+    cv2.destroyAllWindows()
     
-predict('tho', r'data\WIN_20230920_07_56_11_Pro.mp4')
\ No newline at end of file
+
+CSV_FIELDS = ["video", "frame", "timestamp", "x", "y", "w", "h", "identity", "confidence"]
+
+
+def split_video(path: str, chunk_frames: int) -> List[Tuple[int, int]]:
+    """
+    Split a video into consecutive frame ranges.
+
+    Args:
+        path: Video file path
+        chunk_frames: Number of frames per range
+
+    Returns:
+        List of (start, end) frame ranges, end exclusive
+    """
+    cap = cv2.VideoCapture(path)
+    total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    cap.release()
+    if total <= 0:
+        # Unknown length (e.g. some containers): process it in one piece
+        return [(0, sys.maxsize)]
+    return [(start, min(start + chunk_frames, total)) for start in range(0, total, chunk_frames)]
+
+
+def analyze_range(video: str, start: int, end: int, name: Optional[str] = None,
+                  confidence_threshold: Optional[int] = None, stride: int = 1,
+                  detect_width: Optional[int] = None, engine: str = "opencv") -> List[Dict]:
+    """
+    Detect and recognize faces in a frame range of a video, without any display.
+
+    Runs in a worker process; models come from that process's model cache,
+    so they are parsed once per worker rather than once per range.
+
+    Args:
+        video: Video file path
+        start: First frame of the range
+        end: Frame after the last one of the range
+        name: Verify against this user's classifier instead of identifying
+            against the gallery
+        confidence_threshold: Minimum confidence level for a positive match
+            (default: the model's, see lbp.calibrated_threshold)
+        stride: Analyse every Nth frame
+        detect_width: Detection resolution (None for native)
+        engine: Recognizer backend the models were trained with
+
+    Returns:
+        One record per analysed frame that contains faces
+    """
+    detector = FaceDetector('./data/haarcascade_frontalface_default.xml', 1.3, 5, detect_width=detect_width)
+    if name is not None:
+        classifier_path = f"./data/classifiers/{name}_classifier{model_extension(engine)}"
+        recognizer = load_lbph(classifier_path)
+        confidence_threshold = calibrated_threshold(recognizer, confidence_threshold)
+        if confidence_threshold is None:
+            raise RuntimeError(f"Classifier {classifier_path} has no calibrated confidence threshold")
+    else:
+        gallery = FaceGallery(confidence_threshold=confidence_threshold, engine=engine)
+        if not gallery.load():
+            raise RuntimeError("Gallery could not be loaded")
+
+    cap = cv2.VideoCapture(video)
+    fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+    if start:
+        cap.set(cv2.CAP_PROP_POS_FRAMES, start)
+
+    records = []
+    frame_index = start
+    try:
+        while frame_index < end:
+            # grab() skips decoding of frames we are not going to analyse
+            if (frame_index - start) % stride:
+                if not cap.grab():
+                    break
+                frame_index += 1
+                continue
+            ret, frame = cap.read()
+            if not ret:
+                break
+
+            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+            faces = []
+            for (x, y, w, h) in detector.detect(gray):
+                roi_gray = gray[y:y+h, x:x+w]
+                if name is not None:
+                    _, distance = recognizer.predict(normalize_face(roi_gray))
+                    confidence = 100 - int(distance)
+                    identity = name if confidence > confidence_threshold else None
+                else:
+                    identity, confidence = gallery.identify(roi_gray)
+                faces.append({"box": [int(x), int(y), int(w), int(h)],
+                              "identity": identity, "confidence": confidence})
+
+            if faces:
+                records.append({"video": video, "frame": frame_index,
+                                "timestamp": round(frame_index / fps, 3), "faces": faces})
+            frame_index += 1
+    finally:
+        cap.release()
+    return records
+
+
+def _analyze_task(task):
+    video, start, end, options = task
+    return analyze_range(video, start, end, **options)
+
+
+def analyze_videos(videos: List[str], output: str, output_format: str = "jsonl",
+                   workers: Optional[int] = None, chunk_frames: int = 900, **options) -> int:
+    """
+    Analyse recorded videos headlessly in parallel and stream results to a file.
+
+    Every video is split into frame ranges processed by a process pool.
+    Results are written in video and frame order as soon as each range is
+    done.
+
+    Args:
+        videos: Video file paths
+        output: Output file path ("-" for stdout)
+        output_format: "jsonl" (one frame per line) or "csv" (one face per row)
+        workers: Number of worker processes (default: CPU count)
+        chunk_frames: Number of frames per range
+        **options: Passed to analyze_range (name, confidence_threshold, stride, detect_width,
+            engine)
+
+    Returns:
+        int: Number of frame records written
+    """
+    tasks = [(video, start, end, options)
+             for video in videos for start, end in split_video(video, chunk_frames)]
+
+    out = sys.stdout if output == "-" else open(output, "w", newline="")
+    written = 0
+    try:
+        writer = None
+        if output_format == "csv":
+            writer = csv.DictWriter(out, fieldnames=CSV_FIELDS)
+            writer.writeheader()
+
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            for records in executor.map(_analyze_task, tasks):
+                for record in records:
+                    if writer is None:
+                        out.write(json.dumps(record) + "\n")
+                    else:
+                        for face in record["faces"]:
+                            x, y, w, h = face["box"]
+                            writer.writerow({"video": record["video"], "frame": record["frame"],
+                                             "timestamp": record["timestamp"], "x": x, "y": y, "w": w, "h": h,
+                                             "identity": face["identity"] or "", "confidence": face["confidence"]})
+                    written += 1
+                out.flush()
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    return written
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Analyse recorded videos without a display.")
+    parser.add_argument("videos", nargs="+", help="Video files to analyse")
+    parser.add_argument("-o", "--output", default="-", help="Output file (.jsonl or .csv, default: stdout)")
+    parser.add_argument("--format", choices=["jsonl", "csv"], help="Output format (default: from extension)")
+    parser.add_argument("--name", help="Verify against this user's classifier instead of the gallery")
+    parser.add_argument("--workers", type=int, help="Worker processes (default: CPU count)")
+    parser.add_argument("--chunk-frames", type=int, default=900, help="Frames per work unit")
+    parser.add_argument("--stride", type=int, default=1, help="Analyse every Nth frame")
+    parser.add_argument("--detect-width", type=int, help="Downscale frames to this width for detection")
+    parser.add_argument("--confidence-threshold", type=int,
+                        help="Minimum confidence of a match (default: the model's calibrated one)")
+    parser.add_argument("--engine", choices=["opencv", "numpy", "pca"], default="opencv", help="Recognizer backend")
+    args = parser.parse_args()
+
+    output_format = args.format or ("csv" if os.path.splitext(args.output)[1] == ".csv" else "jsonl")
+    count = analyze_videos(args.videos, args.output, output_format, workers=args.workers,
+                           chunk_frames=args.chunk_frames, name=args.name,
+                           confidence_threshold=args.confidence_threshold,
+                           stride=args.stride, detect_width=args.detect_width,
+                           engine=args.engine)
+    print(f"Wrote {count} frame records", file=sys.stderr)
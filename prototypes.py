@@ -0,0 +1,150 @@
+import argparse
+import time
+import numpy as np
+from typing import Dict, Optional, Sequence
+from ann_index import IVFIndex
+from lbp import calibrated_threshold, create_recognizer, spatial_histograms
+
+
+def select_prototypes(histograms: np.ndarray, labels: np.ndarray, per_label: int,
+                      iterations: int = 10, seed: int = 0) -> np.ndarray:
+    """
+    Pick a few representative samples of every label.
+
+    The square-root histograms of each label are clustered with k-means and
+    the sample closest to every centroid (its medoid) is kept. Because
+    prototypes are real samples, the result can train either engine.
+
+    Args:
+        histograms: LBP histograms of shape (N, D), e.g. from spatial_histograms()
+        labels: Label of every histogram
+        per_label: Maximum number of prototypes per label
+        iterations: Number of k-means iterations
+        seed: Seed of the clustering
+
+    Returns:
+        Sorted indices of the selected samples
+    """
+    vectors = np.sqrt(np.asarray(histograms, dtype=np.float32))
+    labels = np.asarray(labels).ravel()
+    selected = []
+    for label in np.unique(labels):
+        members = np.flatnonzero(labels == label)
+        if len(members) <= per_label:
+            selected.append(members)
+            continue
+        kmeans = IVFIndex(per_label)
+        kmeans.train(vectors[members], iterations, max_samples=len(members), seed=seed)
+        nearest = (kmeans.centroids @ vectors[members].T).argmax(axis=1)
+        selected.append(members[np.unique(nearest)])
+    return np.sort(np.concatenate(selected))
+
+
+def condense_faces(faces: Sequence[np.ndarray], per_label: int, labels=None) -> np.ndarray:
+    """
+    Return the indices of the prototype faces of every label.
+
+    Args:
+        faces: Equally sized grayscale faces
+        per_label: Maximum number of prototypes per label
+        labels: Label of every face (default: all faces are one identity)
+
+    Returns:
+        Sorted indices of the selected faces
+    """
+    histograms = spatial_histograms(np.stack(faces))
+    if labels is None:
+        labels = np.zeros(len(faces), dtype=np.int32)
+    return select_prototypes(histograms, labels, per_label)
+
+
+def holdout_split(samples: Dict[str, Dict[str, np.ndarray]], test_fraction: float = 0.25):
+    """
+    Split every user's samples into training and held-out faces.
+
+    The last test_fraction of every user's samples (the latest frames of
+    the capture) is held out, so near-duplicate neighbouring frames do not
+    leak into the test set.
+
+    Args:
+        samples: Mapping of user name to {sample id: grayscale face image},
+            in capture order (see create_classifier.load_user_samples)
+        test_fraction: Share of every user's samples held out
+
+    Returns:
+        Tuple of (train faces, train labels, test faces, test labels), with
+        users labelled 0, 1, ... in name order
+    """
+    train_faces, train_labels, test_faces, test_labels = [], [], [], []
+    for label, name in enumerate(sorted(samples)):
+        faces = list(samples[name].values())
+        split = max(1, int(round(len(faces) * (1 - test_fraction))))
+        train_faces.extend(faces[:split])
+        train_labels.extend([label] * split)
+        test_faces.extend(faces[split:])
+        test_labels.extend([label] * (len(faces) - split))
+    return train_faces, np.array(train_labels), test_faces, np.array(test_labels)
+
+
+def evaluate_prototypes(samples: Dict[str, Dict[str, np.ndarray]], counts=(0, 50, 30, 20, 15, 10),
+                        test_fraction: float = 0.25, engine: str = "opencv",
+                        confidence_threshold: Optional[int] = None):
+    """
+    Report accuracy and match latency of prototype models on a held-out split.
+
+    For every prototype count one model with all users is trained on the
+    holdout_split() training faces and every held-out face is identified
+    against it.
+
+    Args:
+        samples: Mapping of user name to {sample id: grayscale face image},
+            in capture order
+        counts: Prototypes per user to compare (0 keeps every sample)
+        test_fraction: Share of every user's samples held out
+        engine: Recognizer backend, "opencv", "numpy" or "pca"
+        confidence_threshold: Minimum confidence of an accepted match
+            (default: each model's own, see lbp.calibrated_threshold)
+    """
+    train_faces, train_labels, test_faces, test_labels = holdout_split(samples, test_fraction)
+    if not test_faces:
+        print("Error: Not enough samples for a held-out split")
+        return
+    histograms = spatial_histograms(np.stack(train_faces))
+
+    print(f"{len(samples)} users, {len(train_faces)} training and {len(test_faces)} held-out samples, "
+          f"{engine} engine")
+    print(f"{'per user':>9}{'model':>7}{'accuracy':>10}{'accepted':>10}{'ms/face':>9}{'speedup':>9}")
+    baseline_ms = None
+    for count in counts:
+        keep = np.arange(len(train_faces)) if count <= 0 else select_prototypes(histograms, train_labels, count)
+        recognizer = create_recognizer(engine)
+        recognizer.train([train_faces[i] for i in keep], train_labels[keep])
+
+        start = time.perf_counter()
+        predictions = [recognizer.predict(face) for face in test_faces]
+        ms = (time.perf_counter() - start) / len(test_faces) * 1000
+        baseline_ms = baseline_ms or ms
+        predicted = np.array([label for label, _ in predictions])
+        threshold = calibrated_threshold(recognizer, confidence_threshold)
+        if threshold is None:
+            # Nothing to calibrate on (a single user): accept every match
+            threshold = -1
+        confident = np.array([100 - int(distance) > threshold for _, distance in predictions])
+        accuracy = np.mean(predicted == test_labels)
+        accepted = np.mean((predicted == test_labels) & confident)
+        print(f"{count or 'all':>9}{len(keep):>7}{accuracy:>10.3f}{accepted:>10.3f}{ms:>9.2f}{baseline_ms / ms:>9.1f}")
+
+
+if __name__ == "__main__":
+    from create_classifier import list_enrolled_users, load_user_samples
+
+    parser = argparse.ArgumentParser(description="Compare prototype model sizes on a held-out split of enrolled users.")
+    parser.add_argument("users", nargs="*", help="Users to evaluate (default: every enrolled user)")
+    parser.add_argument("--counts", type=int, nargs="+", default=[0, 50, 30, 20, 15, 10],
+                        help="Prototypes per user (0 keeps every sample)")
+    parser.add_argument("--test-fraction", type=float, default=0.25, help="Share of samples held out")
+    parser.add_argument("--engine", choices=["opencv", "numpy", "pca"], default="opencv", help="Recognizer backend")
+    args = parser.parse_args()
+    users = args.users or list_enrolled_users()
+    evaluate_prototypes({name: load_user_samples(name) for name in users}, args.counts,
+                        args.test_fraction, args.engine)
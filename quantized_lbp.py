@@ -0,0 +1,297 @@
+import argparse
+import time
+import numpy as np
+from typing import Dict, List, Optional, Sequence, Tuple
+from lbp import calibrated_threshold, create_recognizer, spatial_histograms
+
+QUANT_SCALE = 127  # unit-norm descriptor components map to [-127, 127]
+WHITEN_REGULARIZATION = 0.1  # share of the mean variance added before whitening
+CALIBRATION_FALSE_ACCEPTS = 0.01  # share of unknown faces the calibrated threshold accepts
+CALIBRATION_FOLDS = 4  # projections fitted without a share of the users while calibrating
+
+
+class QuantizedLBPRecognizer:
+    """
+    An LBP face recognizer matching compact int8 descriptors.
+
+    Every face is described by its uniform-pattern (59-bin) LBP histograms,
+    square-rooted (Hellinger mapping), projected onto the top n_components
+    principal axes learned at train time, optionally whitened, L2-normalized
+    and quantized to int8. A gallery sample then takes n_components bytes
+    instead of the 64 KB of an OpenCV LBPH histogram, and matching is one
+    small matrix product of contiguous int8 rows instead of a chi-square
+    over 16k bins.
+
+    The distance is 100 * (1 - cosine similarity), so the usual confidence
+    of 100 - distance is the similarity in percent. That is not the LBPH
+    scale the apps' default threshold is meant for, so train() calibrates
+    confidence_threshold: the users are split into CALIBRATION_FOLDS
+    groups, and the faces of each group are matched, as unknown people,
+    against the others with a projection learned without them. The
+    threshold is the confidence that at most CALIBRATION_FALSE_ACCEPTS of
+    the matches of any held-out user reach. It is saved with the model and
+    used unless the caller gives a threshold (see
+    lbp.calibrated_threshold). A single user cannot be calibrated, and
+    leaves it None.
+
+    Same interface as cv2.face.LBPHFaceRecognizer (train, update, predict,
+    read, write) plus predict_batch(). update() projects new samples with
+    the axes learned by train().
+    """
+
+    def __init__(self, n_components: int = 128, whiten: bool = True, grid_x: int = 8, grid_y: int = 8,
+                 threshold: float = float("inf")):
+        """
+        Initialize the recognizer.
+
+        Args:
+            n_components: Descriptor length (bytes per gallery sample)
+            whiten: Scale every principal axis to unit variance, so the
+                few dominant axes (lighting, pose) do not drown the rest
+            grid_x: Number of histogram cells horizontally
+            grid_y: Number of histogram cells vertically
+            threshold: Distance above which predict() returns label -1
+        """
+        self.n_components = n_components
+        self.whiten = whiten
+        self.grid_x = grid_x
+        self.grid_y = grid_y
+        self.threshold = threshold
+        self.confidence_threshold: Optional[int] = None
+        self.mean = np.empty(0, dtype=np.float32)
+        self.projection = np.empty((0, 0), dtype=np.float32)
+        self.codes = np.empty((0, 0), dtype=np.int8)
+        self.labels = np.empty(0, dtype=np.int32)
+
+    @staticmethod
+    def _stack(faces) -> np.ndarray:
+        if isinstance(faces, np.ndarray) and faces.ndim == 3:
+            return faces
+        return np.stack([np.asarray(face, dtype=np.uint8) for face in faces])
+
+    def _features(self, faces) -> np.ndarray:
+        return np.sqrt(spatial_histograms(self._stack(faces), self.grid_x, self.grid_y, uniform=True))
+
+    def encode(self, faces) -> np.ndarray:
+        """
+        Compute the int8 descriptors of equally sized grayscale faces.
+
+        Returns:
+            int8 array of shape (N, n_components)
+        """
+        return self._quantize(self._features(faces))
+
+    def _quantize(self, features: np.ndarray) -> np.ndarray:
+        projected = (features - self.mean) @ self.projection
+        norms = np.linalg.norm(projected, axis=1, keepdims=True)
+        projected /= np.maximum(norms, np.finfo(np.float32).tiny)
+        return np.clip(np.rint(projected * QUANT_SCALE), -QUANT_SCALE, QUANT_SCALE).astype(np.int8)
+
+    def train(self, faces: Sequence[np.ndarray], labels):
+        """Learn the projection from the given faces and make them the gallery."""
+        features = self._features(faces)
+        self._fit(features)
+        self.codes = self._quantize(features)
+        self.labels = np.asarray(labels, dtype=np.int32).ravel()
+        self.confidence_threshold = self._calibrate(features)
+
+    def _fit(self, features: np.ndarray):
+        self.mean = features.mean(axis=0)
+        centered = features - self.mean
+        if len(centered) < centered.shape[1]:
+            # Fewer samples than features: eigen-decompose the smaller Gram matrix
+            eigenvalues, vectors = np.linalg.eigh(centered @ centered.T)
+        else:
+            eigenvalues, vectors = np.linalg.eigh(centered.T @ centered)
+        eigenvalues, vectors = eigenvalues[::-1], vectors[:, ::-1]
+        rank = int(np.sum(eigenvalues > max(eigenvalues[0], 0) * 1e-9))
+        count = max(1, min(self.n_components, rank))
+        eigenvalues = np.maximum(eigenvalues[:count], np.finfo(np.float32).tiny)
+        axes = vectors[:, :count]
+        if len(centered) < centered.shape[1]:
+            axes = centered.T @ axes / np.sqrt(eigenvalues)
+        self.projection = np.ascontiguousarray(axes, dtype=np.float32)
+        if self.whiten:
+            variances = eigenvalues / max(1, len(features) - 1)
+            self.projection /= np.sqrt(variances + WHITEN_REGULARIZATION * variances.mean()).astype(np.float32)
+
+    def _calibrate(self, features: np.ndarray) -> Optional[int]:
+        # Confidences of the faces of held-out users, as unknown people, in
+        # galleries of the other users whose projection never saw them
+        users = np.unique(self.labels)
+        if len(users) < 2:
+            return None
+        folds = np.arange(len(users)) % min(CALIBRATION_FOLDS, len(users))
+        confidences = []
+        for fold in np.unique(folds):
+            unknown = np.isin(self.labels, users[folds == fold])
+            unknown_labels = self.labels[unknown]
+            held_out = QuantizedLBPRecognizer(self.n_components, self.whiten, self.grid_x, self.grid_y)
+            held_out._fit(features[~unknown])
+            gallery = held_out._quantize(features[~unknown]).astype(np.float32)
+            similarity = held_out._quantize(features[unknown]).astype(np.float32) @ gallery.T
+            best = similarity.max(axis=1) / float(QUANT_SCALE * QUANT_SCALE)
+            distances = np.maximum(0.0, 100.0 * (1.0 - best.astype(np.float64)))
+            fold_confidences = 100 - distances.astype(int)
+            # Some people look more alike than others: hold every user to it
+            confidences += [np.quantile(fold_confidences[unknown_labels == user], 1 - CALIBRATION_FALSE_ACCEPTS)
+                            for user in np.unique(unknown_labels)]
+        return int(max(confidences))
+
+    def update(self, faces: Sequence[np.ndarray], labels):
+        """
+        Append faces and labels to the gallery, keeping the learned
+        projection and the calibrated confidence threshold.
+        """
+        if not len(self.labels):
+            self.train(faces, labels)
+            return
+        self.codes = np.vstack([self.codes, self.encode(faces)])
+        self.labels = np.concatenate([self.labels, np.asarray(labels, dtype=np.int32).ravel()])
+
+    def predict_batch(self, faces) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Find the nearest gallery sample of every face.
+
+        Args:
+            faces: Equally sized grayscale faces, as a list or (N, H, W) array
+
+        Returns:
+            Tuple of (labels, distances) arrays; the label is -1 where the
+            distance exceeds the threshold
+        """
+        if not len(self.labels):
+            raise ValueError("The recognizer has not been trained")
+        queries = self.encode(faces)
+        # int8 products summed over <= 2^10 components stay exact in float32,
+        # which lets BLAS do the dot products
+        similarity = queries.astype(np.float32) @ self.codes.astype(np.float32).T
+        nearest = similarity.argmax(axis=1)
+        best = similarity[np.arange(len(queries)), nearest] / float(QUANT_SCALE * QUANT_SCALE)
+        distances = np.maximum(0.0, 100.0 * (1.0 - best.astype(np.float64)))
+        labels = np.where(distances <= self.threshold, self.labels[nearest], -1)
+        return labels, distances
+
+    def predict(self, face) -> Tuple[int, float]:
+        """Return (label, distance) of the nearest gallery sample of one face."""
+        labels, distances = self.predict_batch(np.asarray(face, dtype=np.uint8)[None])
+        return int(labels[0]), float(distances[0])
+
+    def getHistograms(self) -> List[np.ndarray]:
+        return list(self.codes)
+
+    def getLabels(self) -> np.ndarray:
+        return self.labels.reshape(-1, 1)
+
+    def write(self, path: str):
+        """Save the projection and the gallery as an uncompressed .npz file."""
+        with open(path, "wb") as f:
+            np.savez(f, mean=self.mean, projection=self.projection, codes=self.codes, labels=self.labels,
+                     params=np.array([self.grid_x, self.grid_y, self.n_components, int(self.whiten)]),
+                     threshold=np.array(self.threshold),
+                     confidence_threshold=np.array(np.nan if self.confidence_threshold is None
+                                                   else self.confidence_threshold))
+
+    def read(self, path: str):
+        """Load a model saved by write()."""
+        with np.load(path) as data:
+            self.grid_x, self.grid_y, self.n_components, whiten = (int(v) for v in data["params"])
+            self.whiten = bool(whiten)
+            self.threshold = float(data["threshold"])
+            # Models saved before thresholds were calibrated have none
+            self.confidence_threshold = None
+            if "confidence_threshold" in data.files and not np.isnan(data["confidence_threshold"]):
+                self.confidence_threshold = int(data["confidence_threshold"])
+            self.mean = data["mean"]
+            self.projection = np.ascontiguousarray(data["projection"])
+            self.codes = np.ascontiguousarray(data["codes"])
+            self.labels = data["labels"].astype(np.int32)
+
+
+def _gallery_bytes(recognizer) -> int:
+    # Histogram (or descriptor) storage of one gallery sample
+    histograms = recognizer.getHistograms()
+    return histograms[0].nbytes if histograms else 0
+
+
+def compare_descriptors(samples: Dict[str, Dict[str, np.ndarray]], components=(32, 64, 128),
+                        test_fraction: float = 0.25, confidence_threshold: Optional[int] = None):
+    """
+    Compare quantized descriptors with plain LBPH on a held-out split.
+
+    Besides the accuracy on the held-out faces of enrolled users, every
+    candidate is checked at the confidence threshold the apps would use
+    ("threshold"): the last user (in name order) is left out of training,
+    so "false acc." is the share of that unknown person's faces accepted
+    as someone, next to the share of enrolled faces "accepted" as the right
+    user. The distance scales of the engines differ, so "1% FA at" reports
+    the lowest confidence threshold that accepts at most 1% of the unknown
+    faces.
+
+    Args:
+        samples: Mapping of user name to {sample id: grayscale face image},
+            in capture order (see create_classifier.load_user_samples)
+        components: Descriptor lengths to evaluate
+        test_fraction: Share of every user's samples held out
+        confidence_threshold: Minimum confidence of an accepted match
+            (default: each model's own, see lbp.calibrated_threshold)
+    """
+    from prototypes import holdout_split
+    train_faces, train_labels, test_faces, test_labels = holdout_split(samples, test_fraction)
+    if not test_faces:
+        print("Error: Not enough samples for a held-out split")
+        return
+    unknown_faces = []
+    if len(samples) > 1:
+        unknown = len(samples) - 1
+        unknown_faces = [face for face, label in zip(train_faces + test_faces,
+                                                     np.concatenate([train_labels, test_labels]))
+                         if label == unknown]
+        train_faces = [face for face, label in zip(train_faces, train_labels) if label != unknown]
+        test_faces = [face for face, label in zip(test_faces, test_labels) if label != unknown]
+        train_labels, test_labels = train_labels[train_labels != unknown], test_labels[test_labels != unknown]
+
+    candidates = [("opencv LBPH", create_recognizer("opencv")), ("numpy LBPH", create_recognizer("numpy"))]
+    candidates += [(f"pca {n}", QuantizedLBPRecognizer(n)) for n in components]
+    print(f"{len(samples)} users, {len(train_faces)} training and {len(test_faces)} held-out samples, "
+          f"{len(unknown_faces)} unknown faces")
+    print(f"{'descriptor':<14}{'bytes/sample':>13}{'accuracy':>10}{'threshold':>10}{'accepted':>10}"
+          f"{'false acc.':>11}{'1% FA at':>10}{'ms/face':>9}{'train s':>9}")
+    for name, recognizer in candidates:
+        start = time.perf_counter()
+        recognizer.train(train_faces, train_labels)
+        train_s = time.perf_counter() - start
+
+        start = time.perf_counter()
+        predictions = [recognizer.predict(face) for face in test_faces]
+        ms = (time.perf_counter() - start) / len(test_faces) * 1000
+        predicted = np.array([label for label, _ in predictions])
+        threshold = calibrated_threshold(recognizer, confidence_threshold)
+        if threshold is None:
+            # Nothing to calibrate on (a single user): accept every match
+            threshold = -1
+        confident = np.array([100 - int(distance) > threshold for _, distance in predictions])
+        accuracy = np.mean(predicted == test_labels)
+        accepted = np.mean((predicted == test_labels) & confident)
+        false_accepts = calibrated = "n/a"
+        if unknown_faces:
+            unknown_confidences = np.array([100 - int(recognizer.predict(face)[1]) for face in unknown_faces])
+            false_accepts = f"{np.mean(unknown_confidences > threshold):.3f}"
+            calibrated = str(max(0, int(np.quantile(unknown_confidences, 0.99))))
+        print(f"{name:<14}{_gallery_bytes(recognizer):>13}{accuracy:>10.3f}{threshold:>10}{accepted:>10.3f}"
+              f"{false_accepts:>11}{calibrated:>10}{ms:>9.2f}{train_s:>9.2f}")
+
+
+if __name__ == "__main__":
+    from create_classifier import list_enrolled_users, load_user_samples
+
+    parser = argparse.ArgumentParser(description="Compare quantized LBP descriptors with plain LBPH.")
+    parser.add_argument("users", nargs="*", help="Users to evaluate (default: every enrolled user)")
+    parser.add_argument("--components", type=int, nargs="+", default=[32, 64, 128], help="Descriptor lengths")
+    parser.add_argument("--test-fraction", type=float, default=0.25, help="Share of samples held out")
+    parser.add_argument("--confidence-threshold", type=int,
+                        help="Minimum confidence of a match (default: each model's calibrated one)")
+    args = parser.parse_args()
+    users = args.users or list_enrolled_users()
+    compare_descriptors({name: load_user_samples(name) for name in users}, args.components, args.test_fraction,
+                        args.confidence_threshold)
@@ -0,0 +1,174 @@
+import json
+import os
+import numpy as np
+import pytest
+from gallery import FaceGallery
+from model_registry import model_cache
+
+
+def _faces(count, seed=0):
+    rng = np.random.default_rng(seed)
+    return {f"{seed}_{i}": rng.integers(0, 256, (100, 100), dtype=np.uint8) for i in range(count)}
+
+
+def _gallery(tmp_path, engine="numpy", **kwargs):
+    extension = ".xml" if engine == "opencv" else ".npz"
+    return FaceGallery(str(tmp_path / f"gallery{extension}"), str(tmp_path / "gallery.json"),
+                       engine=engine, **kwargs)
+
+
+def _manifest(tmp_path):
+    with open(tmp_path / "gallery.json") as f:
+        return json.load(f)
+
+
+def _crash():
+    raise OSError("killed before the commit")
+
+
+def _identify(gallery, faces):
+    return gallery.identify_many(list(faces.values()))
+
+
+@pytest.fixture(autouse=True)
+def _clear_cache():
+    model_cache.clear()
+    yield
+    model_cache.clear()
+
+
+def test_crash_before_manifest_keeps_previous_gallery(tmp_path, monkeypatch):
+    alice, bob = _faces(4, seed=1), _faces(4, seed=2)
+    gallery = _gallery(tmp_path)
+    gallery.train({"alice": alice})
+    gallery.save()
+    gallery.enroll("bob", bob)
+
+    # The faces reach the log, but the manifest is never replaced
+    monkeypatch.setattr(gallery, "_write_manifest", _crash)
+    with pytest.raises(OSError):
+        gallery.save()
+    log_file = gallery._log_file
+    assert os.path.getsize(log_file) > 0
+
+    loaded = _gallery(tmp_path)
+    assert loaded.load(shared=False)
+    assert loaded.names == ["alice"]
+    assert loaded._log_records == 0
+    assert loaded.recognizer.histograms.shape[0] == len(alice)
+
+    # The next save drops the uncommitted records before appending
+    carol = _faces(3, seed=3)
+    loaded.enroll("carol", carol)
+    loaded.save()
+    assert os.path.getsize(log_file) == 3 * 100 * 100 + 3 * 4
+    reloaded = _gallery(tmp_path)
+    assert reloaded.load()
+    assert reloaded.names == ["alice", "carol"]
+    assert reloaded.samples["carol"] == list(carol)
+    assert [name for name, _ in _identify(reloaded, carol)] == ["carol"] * 3
+
+
+def test_crash_before_manifest_keeps_previous_generation(tmp_path, monkeypatch):
+    gallery = _gallery(tmp_path)
+    gallery.train({"alice": _faces(4, seed=1)})
+    gallery.save()
+    first_model = gallery._model_file
+
+    gallery.train({"alice": _faces(4, seed=1), "bob": _faces(4, seed=2)})
+    monkeypatch.setattr(gallery, "_write_manifest", _crash)
+    with pytest.raises(OSError):
+        gallery.save()
+
+    assert os.path.exists(first_model)
+    loaded = _gallery(tmp_path)
+    assert loaded.load()
+    assert (loaded.names, loaded.generation, loaded._model_file) == (["alice"], 1, first_model)
+
+
+def test_train_switches_generation_and_retires_files(tmp_path):
+    gallery = _gallery(tmp_path, engine="opencv")
+    gallery.train({"alice": _faces(4, seed=1)})
+    gallery.save()
+    gallery.enroll("bob", _faces(2, seed=2))
+    gallery.save()
+    first_files = [gallery._model_file, gallery._model_file[:-4] + ".lbph", gallery._log_file]
+    assert all(os.path.exists(path) for path in first_files)
+    assert _manifest(tmp_path)["log_records"] == 2
+
+    gallery.train({"alice": _faces(4, seed=1), "bob": _faces(4, seed=2)})
+    gallery.save()
+    manifest = _manifest(tmp_path)
+    assert (manifest["generation"], manifest["model"], manifest["log_records"]) == (2, "gallery.2.xml", 0)
+    assert not any(os.path.exists(path) for path in first_files)
+    assert sorted(os.listdir(tmp_path)) == ["gallery.2.lbph", "gallery.2.xml", "gallery.json"]
+
+
+def test_legacy_manifest_is_upgraded_on_save(tmp_path):
+    gallery = _gallery(tmp_path)
+    gallery.train({"alice": _faces(4, seed=1)})
+    gallery.recognizer.write(gallery.model_path)
+    with open(gallery.labels_path, "w") as f:
+        json.dump({"labels": {"0": "alice"}, "samples": {"alice": list(_faces(4, seed=1))}}, f)
+
+    loaded = _gallery(tmp_path)
+    assert loaded.load(shared=False)
+    loaded.enroll("bob", _faces(2, seed=2))
+    loaded.save()
+    assert _manifest(tmp_path)["log_records"] == 2
+    assert os.path.exists(gallery.model_path)
+
+    loaded.train({"alice": _faces(4, seed=1)})
+    loaded.save()
+    assert not os.path.exists(gallery.model_path)
+    assert _manifest(tmp_path)["generation"] == 1
+
+
+@pytest.mark.parametrize("engine", ["numpy", "opencv"])
+def test_save_compacts_log(tmp_path, engine):
+    alice, bob, carol = _faces(4, seed=1), _faces(3, seed=2), _faces(3, seed=3)
+    gallery = _gallery(tmp_path, engine=engine, compact_records=5)
+    gallery.train({"alice": alice})
+    gallery.save()
+
+    gallery.enroll("bob", bob)
+    gallery.save()
+    assert (_manifest(tmp_path)["generation"], _manifest(tmp_path)["log_records"]) == (1, 3)
+    log_file = gallery._log_file
+
+    gallery.enroll("carol", carol)
+    gallery.save()
+    manifest = _manifest(tmp_path)
+    assert (manifest["generation"], manifest["log_records"]) == (2, 0)
+    assert not os.path.exists(log_file)
+    expected = "gallery.2.lbph" if engine == "opencv" else "gallery.2.npz"
+    assert manifest["model"] == expected
+    assert manifest["samples"] == {"alice": list(alice), "bob": list(bob), "carol": list(carol)}
+
+    loaded = _gallery(tmp_path, engine=engine)
+    assert loaded.load()
+    assert loaded.names == ["alice", "bob", "carol"]
+    for name, faces in (("alice", alice), ("bob", bob), ("carol", carol)):
+        assert [match for match, _ in _identify(loaded, faces)] == [name] * len(faces)
+
+    # A compacted gallery keeps enrolling into its log
+    loaded.enroll("dave", _faces(2, seed=4))
+    loaded.save()
+    assert (_manifest(tmp_path)["generation"], _manifest(tmp_path)["log_records"]) == (2, 2)
+
+
+def test_pca_gallery_needs_a_threshold(tmp_path, capsys):
+    pca = FaceGallery(str(tmp_path / "gallery.pca"), str(tmp_path / "gallery.json"), engine="pca")
+    pca.train({"alice": _faces(4, seed=1)})
+    pca.save()
+
+    # One user leaves nothing to calibrate the distance scale against
+    assert not FaceGallery(pca.model_path, pca.labels_path, engine="pca").load()
+    assert "no calibrated confidence threshold" in capsys.readouterr().out
+    assert FaceGallery(pca.model_path, pca.labels_path, confidence_threshold=60, engine="pca").load()
+
+    pca.train({"alice": _faces(4, seed=1), "bob": _faces(4, seed=2)})
+    pca.save()
+    loaded = FaceGallery(pca.model_path, pca.labels_path, engine="pca")
+    assert loaded.load()
+    assert loaded.threshold == loaded.recognizer.confidence_threshold
@@ -0,0 +1,24 @@
+import numpy as np
+from lbp import NumpyLBPHRecognizer
+
+
+def _faces(count, seed=0):
+    rng = np.random.default_rng(seed)
+    return [rng.integers(0, 256, (100, 100), dtype=np.uint8) for _ in range(count)]
+
+
+def test_empty_probes_fall_back_to_the_whole_gallery():
+    faces, labels = _faces(60), np.arange(60) % 5
+    indexed = NumpyLBPHRecognizer(index_min_samples=10, n_probe=1)
+    indexed.train(faces, labels)
+    exact = NumpyLBPHRecognizer(rerank=0, index_min_samples=0)
+    exact.train(faces, labels)
+    assert indexed.index is not None
+
+    # Every probed cluster empty: no candidate at all
+    indexed.index.search = lambda queries, k, n_probe: (np.full((len(queries), k), -1), None)
+    queries = _faces(8, seed=1)
+    labels_found, distances = indexed.predict_batch(queries)
+    expected_labels, expected_distances = exact.predict_batch(queries)
+    np.testing.assert_array_equal(labels_found, expected_labels)
+    np.testing.assert_allclose(distances, expected_distances, rtol=1e-5)
@@ -0,0 +1,67 @@
+import cv2
+import numpy as np
+import pytest
+from lbp import NumpyLBPHRecognizer
+from lbph_model import binary_path, from_opencv, read_binary, write_binary, write_sidecar
+
+
+def _faces(count, seed=0):
+    rng = np.random.default_rng(seed)
+    return [rng.integers(0, 256, (100, 100), dtype=np.uint8) for _ in range(count)]
+
+
+@pytest.mark.parametrize("uniform", [False, True])
+def test_write_read_round_trip(tmp_path, uniform):
+    recognizer = NumpyLBPHRecognizer(grid_x=4, grid_y=6, uniform=uniform, threshold=80.0)
+    recognizer.train(_faces(12), np.arange(12) % 3)
+    path = str(tmp_path / "gallery.lbph")
+    write_binary(recognizer, path)
+
+    loaded = read_binary(path)
+    assert (loaded.grid_x, loaded.grid_y, loaded.uniform, loaded.threshold) == (4, 6, uniform, 80.0)
+    np.testing.assert_array_equal(loaded.labels, recognizer.labels)
+    assert loaded.histograms.dtype == np.float32
+    np.testing.assert_allclose(loaded.histograms, recognizer.histograms, rtol=1e-3, atol=1e-6)
+
+    queries = _faces(5, seed=1)
+    labels, distances = recognizer.predict_batch(queries)
+    loaded_labels, loaded_distances = loaded.predict_batch(queries)
+    np.testing.assert_array_equal(loaded_labels, labels)
+    np.testing.assert_allclose(loaded_distances, distances, rtol=1e-3)
+
+
+def test_read_into_recognizer_and_empty_gallery(tmp_path):
+    empty = NumpyLBPHRecognizer()
+    empty._set_gallery(np.empty((0, 256 * 64), dtype=np.float32), np.empty(0, dtype=np.int32))
+    path = str(tmp_path / "empty.lbph")
+    write_binary(empty, path)
+
+    recognizer = NumpyLBPHRecognizer()
+    assert read_binary(path, recognizer) is recognizer
+    assert recognizer.histograms.shape == (0, 256 * 64)
+    assert len(recognizer.labels) == 0
+
+
+def test_read_rejects_other_files(tmp_path):
+    path = tmp_path / "model.lbph"
+    path.write_bytes(b"<?xml version=\"1.0\"?>" + b"\0" * 64)
+    with pytest.raises(ValueError):
+        read_binary(str(path))
+
+
+def test_sidecar_matches_opencv_exhaustively(tmp_path):
+    # More samples than rerank candidates, so a prefilter would have to run
+    opencv = cv2.face.LBPHFaceRecognizer_create()
+    opencv.train(_faces(120), np.arange(120) % 6)
+    xml_path = str(tmp_path / "user_classifier.xml")
+    opencv.write(xml_path)
+    assert write_sidecar(opencv, xml_path) == binary_path(xml_path)
+
+    queries = _faces(40, seed=2)
+    expected = [opencv.predict(face) for face in queries]
+    for recognizer in (from_opencv(opencv), read_binary(binary_path(xml_path))):
+        # Converted and loaded models never switch to an approximate search
+        assert recognizer.index is None and recognizer.index_min_samples == 0 and recognizer.rerank == 0
+        labels, distances = recognizer.predict_batch(queries)
+        assert list(labels) == [label for label, _ in expected]
+        np.testing.assert_allclose(distances, [distance for _, distance in expected], rtol=1e-3)
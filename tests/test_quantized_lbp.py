@@ -0,0 +1,52 @@
+import numpy as np
+from lbp import DEFAULT_CONFIDENCE_THRESHOLD, NumpyLBPHRecognizer, calibrated_threshold
+from quantized_lbp import QuantizedLBPRecognizer
+
+
+def _users(count, samples, seed=0):
+    # Every user is a fixed texture seen with a little noise
+    rng = np.random.default_rng(seed)
+    faces, labels = [], []
+    for user in range(count):
+        base = rng.integers(0, 256, (100, 100)).astype(np.float32)
+        for _ in range(samples):
+            faces.append(np.clip(base + rng.normal(0, 8, base.shape), 0, 255).astype(np.uint8))
+            labels.append(user)
+    return faces, np.array(labels)
+
+
+def test_threshold_is_calibrated_and_saved(tmp_path):
+    faces, labels = _users(5, 6)
+    recognizer = QuantizedLBPRecognizer(16)
+    recognizer.train(faces, labels)
+    assert isinstance(recognizer.confidence_threshold, int)
+    assert calibrated_threshold(recognizer) == recognizer.confidence_threshold
+    assert calibrated_threshold(recognizer, 70) == 70
+
+    path = str(tmp_path / "gallery.pca")
+    recognizer.write(path)
+    loaded = QuantizedLBPRecognizer()
+    loaded.read(path)
+    assert loaded.confidence_threshold == recognizer.confidence_threshold
+
+
+def test_single_user_and_old_models_have_no_threshold(tmp_path):
+    faces, labels = _users(1, 6)
+    recognizer = QuantizedLBPRecognizer(4)
+    recognizer.train(faces, labels)
+    assert recognizer.confidence_threshold is None
+    assert calibrated_threshold(recognizer) is None
+
+    # Written before thresholds were stored
+    path = str(tmp_path / "old.pca")
+    with open(path, "wb") as f:
+        np.savez(f, mean=recognizer.mean, projection=recognizer.projection, codes=recognizer.codes,
+                 labels=recognizer.labels, params=np.array([8, 8, 4, 1]), threshold=np.array(np.inf))
+    loaded = QuantizedLBPRecognizer()
+    loaded.read(path)
+    assert loaded.confidence_threshold is None
+
+
+def test_lbph_engines_keep_default_threshold():
+    assert calibrated_threshold(NumpyLBPHRecognizer()) == DEFAULT_CONFIDENCE_THRESHOLD
+    assert calibrated_threshold(NumpyLBPHRecognizer(), 30) == 30
@@ -0,0 +1,135 @@
+import cv2
+import threading
+import time
+from collections import deque
+from typing import Optional
+
+
+class FrameGrabber:
+    """
+    A cv2.VideoCapture replacement that grabs frames on a background thread.
+
+    Frames go into a small ring buffer. For live cameras the oldest frame is
+    dropped whenever the buffer is full and read() returns the freshest one,
+    so a slow consumer no longer lags seconds behind the driver buffer. For
+    recorded files drop_oldest=False makes the grabber wait for the consumer
+    instead, so every frame is still processed in order.
+    """
+
+    def __init__(self, source=0, buffer_size: int = 2, drop_oldest: bool = True):
+        """
+        Open the source and start grabbing.
+
+        Args:
+            source: Device index, video file path or stream URL
+            buffer_size: Number of frames kept in the ring buffer
+            drop_oldest: Drop stale frames (live) instead of waiting (files)
+        """
+        self.source = source
+        self.drop_oldest = drop_oldest
+        self.grabbed = 0
+        self.dropped = 0
+
+        self._cap = cv2.VideoCapture(source)
+        self._buffer = deque(maxlen=buffer_size)
+        self._cond = threading.Condition()
+        self._stopped = False
+        self._ended = False
+        self._thread = threading.Thread(target=self._grab, daemon=True)
+        if self._cap.isOpened():
+            self._thread.start()
+
+    def isOpened(self) -> bool:
+        return self._cap.isOpened()
+
+    @property
+    def ended(self) -> bool:
+        """True once the source has no more frames (end of a file, lost stream)."""
+        with self._cond:
+            return self._ended and not self._buffer
+
+    def get(self, prop_id):
+        return self._cap.get(prop_id)
+
+    def _grab(self):
+        while not self._stopped:
+            ret, frame = self._cap.read()
+            with self._cond:
+                if not ret:
+                    self._ended = True
+                    self._cond.notify_all()
+                    return
+                if len(self._buffer) == self._buffer.maxlen:
+                    if self.drop_oldest:
+                        self.dropped += 1
+                    else:
+                        self._cond.wait_for(lambda: len(self._buffer) < self._buffer.maxlen or self._stopped)
+                        if self._stopped:
+                            return
+                self._buffer.append(frame)
+                self.grabbed += 1
+                self._cond.notify_all()
+
+    def read(self, timeout: float = 5.0):
+        """
+        Return the next frame, mimicking cv2.VideoCapture.read().
+
+        Args:
+            timeout: Seconds to wait for a frame before giving up
+
+        Returns:
+            Tuple of (success flag, frame or None)
+        """
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._buffer or self._ended, timeout):
+                return False, None
+            if not self._buffer:
+                return False, None
+            if self.drop_oldest:
+                frame = self._buffer.pop()
+                self.dropped += len(self._buffer)
+                self._buffer.clear()
+            else:
+                frame = self._buffer.popleft()
+            self._cond.notify_all()
+            return True, frame
+
+    def release(self):
+        """Stop the grabbing thread and release the capture."""
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+        if self._thread.is_alive():
+            self._thread.join(timeout=2.0)
+        self._cap.release()
+
+
+class FrameRateGovernor:
+    """
+    Paces a processing loop to at most max_fps.
+
+    Headless loops have no waitKey() to slow them down; the governor sleeps
+    just long enough to keep the configured frame rate, and not at all when
+    max_fps is None or the loop is already slower than that.
+    """
+
+    def __init__(self, max_fps: Optional[float] = None):
+        """
+        Initialize the governor.
+
+        Args:
+            max_fps: Maximum loop rate in frames per second (None for unlimited)
+        """
+        self.max_fps = max_fps
+        self._next = None
+
+    def wait(self):
+        """Sleep until the next frame slot."""
+        if not self.max_fps:
+            return
+        now = time.perf_counter()
+        if self._next is None or self._next < now:
+            self._next = now
+        elif self._next > now:
+            time.sleep(self._next - now)
+        self._next += 1.0 / self.max_fps